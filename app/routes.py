@@ -1,7 +1,12 @@
 from flask import Blueprint, render_template, Response, jsonify, current_app, request, send_from_directory
-import os
+import hmac
 import datetime
+import functools
 import config
+from modules import metrics
+from modules.profiler import profiler, ProfilerBusy
+from modules.retention import evento_y_segmento
+from modules import sidecar
 
 main_bp = Blueprint('main', __name__)
 
@@ -27,28 +32,119 @@ def status():
         "humidity": sensor_data["humidity"],
         "pressure": sensor_data["pressure"],
         "mode": mode_manager.get_mode() if mode_manager else 2,
-        "mode_description": mode_manager.get_mode_description() if mode_manager else "Unknown"
+        "mode_description": mode_manager.get_mode_description() if mode_manager else "Unknown",
+        "pipeline": camera.get_pipeline_stats(),
+        "metrics": metrics.summary()
     }
+    postprocess = getattr(current_app, "postprocess", None)
+    if postprocess:
+        response["postprocess"] = postprocess.stats()
+    storage = getattr(current_app, "storage", None)
+    if storage:
+        response["storage"] = storage.estadisticas()
+    spool = getattr(current_app, "spool", None)
+    if spool:
+        response["spool"] = spool.stats()
+    archive = getattr(current_app, "archive", None)
+    if archive:
+        response["archive"] = archive.stats()
     # Alias para compatibilidad con el frontend 
     response["temp"] = sensor_data["location_temp"] 
     
     return jsonify(response)
 
+@main_bp.route("/metrics")
+def prometheus_metrics():
+    """Contadores e histogramas por etapa en formato de texto de Prometheus."""
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+def require_debug_token(view):
+    """Las rutas de diagnóstico exigen config.DEBUG_TOKEN (cabecera X-Debug-Token o ?token=)."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not config.DEBUG_TOKEN:
+            return jsonify({"error": "Debug endpoints disabled (DEBUG_TOKEN not set)"}), 404
+        token = request.headers.get("X-Debug-Token") or request.args.get("token", "")
+        if not hmac.compare_digest(token.encode(), config.DEBUG_TOKEN.encode()):
+            return jsonify({"error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+def _text_download(text, kind, timestamp, extra_headers=None):
+    name = datetime.datetime.fromtimestamp(timestamp).strftime(f"{kind}_%Y%m%d_%H%M%S.txt")
+    response = Response(text, mimetype="text/plain")
+    response.headers["Content-Disposition"] = f"attachment; filename={name}"
+    for key, value in (extra_headers or {}).items():
+        response.headers[key] = str(value)
+    return response
+
+@main_bp.route("/debug/profile")
+@require_debug_token
+def debug_profile():
+    """Perfil de todos los hilos durante ?seconds= (formato collapsed para flamegraph.pl / speedscope)."""
+    return _run_profiler("profile", profiler.sample, request.args.get("seconds", type=float),
+                         request.args.get("interval", type=float))
+
+@main_bp.route("/debug/memory")
+@require_debug_token
+def debug_memory():
+    """Top de reservas de memoria (tracemalloc) durante ?seconds=."""
+    return _run_profiler("memory", profiler.memory, request.args.get("seconds", type=float),
+                         request.args.get("top", type=int))
+
+def _run_profiler(kind, run, *args):
+    try:
+        text, stats = run(*args)
+    except ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    headers = {f"X-Profile-{key.capitalize()}": value for key, value in stats.items()}
+    return _text_download(text, kind, profiler.last(kind)[0], headers)
+
+@main_bp.route("/debug/last/<kind>")
+@require_debug_token
+def debug_last(kind):
+    """Descarga el último resultado ('profile' o 'memory'), lanzado desde aquí o desde Telegram."""
+    result = profiler.last(kind)
+    if result is None:
+        return jsonify({"error": f"No {kind} result available"}), 404
+    timestamp, text = result
+    return _text_download(text, kind, timestamp)
+
 def generate_frames(camera):
+    # Cada cliente espera al siguiente frame publicado; el JPEG se codifica una sola vez para todos
+    last_seq = 0
     while True:
-        frame_bytes = camera.get_frame()
+        last_seq, frame_bytes = camera.broadcaster.wait_for_frame(last_seq, timeout=1.0)
         if frame_bytes:
             yield(b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        else:
-            # Pausa si no hay frame disponible
-            import time
-            time.sleep(0.1)
 
 @main_bp.route("/video_feed")
 def video_feed():
     camera = current_app.camera
     return Response(generate_frames(camera), mimetype="multipart/x-mixed-replace; boundary=frame")
 
+@main_bp.route("/api/live")
+def live_info():
+    """Disponibilidad del directo HLS y del clip en curso."""
+    info = current_app.camera.get_live_info()
+    return jsonify({
+        "playlist_url": "/live/live.m3u8" if info["playlist"] else None,
+        "recording_url": f"/recordings/{info['recording']}" if info["recording"] else None
+    })
+
+@main_bp.route("/live/<path:filename>")
+def serve_live(filename):
+    """Lista de reproducción y segmentos fMP4 del directo HLS."""
+    if filename.endswith(".m3u8"):
+        response = send_from_directory(config.HLS_DIR, filename, mimetype="application/vnd.apple.mpegurl")
+        # La lista cambia con cada segmento: no se cachea
+        response.headers["Cache-Control"] = "no-cache"
+    else:
+        response = send_from_directory(config.HLS_DIR, filename, mimetype="video/mp4")
+        # Los segmentos no cambian nunca (nombres únicos): se cachean sin revalidar
+        response.headers["Cache-Control"] = "public, max-age=3600, immutable"
+    return response
+
 @main_bp.route("/mode", methods=["GET"])
 def get_mode():
     """Obtener el modo actual."""
@@ -87,40 +183,151 @@ def gallery():
     """Renderiza la galería de videos."""
     return render_template("gallery.html")
 
+def _parse_time(value):
+    """Fecha de un parámetro: epoch en segundos o ISO 8601 (2026-10-18T02:00)."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+def _recording_json(row):
+    event_id, segment = evento_y_segmento(row["filename"])
+    return {
+        "filename": row["filename"],
+        "size_mb": round(row["size"] / (1024 * 1024), 2),
+        "date": datetime.datetime.fromtimestamp(row["created"]).strftime('%d/%m/%Y %H:%M:%S'),
+        "timestamp": row["created"],
+        "thumbnail_url": f"/thumbnails/{row['thumbnail']}" if row["thumbnail"] else None,
+        "score": row["score"],
+        "pinned": bool(row["pinned"]),
+        "event_id": event_id,
+        "segment": segment,
+    }
+
 @main_bp.route("/api/recordings")
 def list_recordings():
-    """Listado de grabaciones disponibles en el disco NAS."""
-    recordings = []
-    if os.path.exists(config.PATH_NAS):
-        files = [f for f in os.listdir(config.PATH_NAS) if f.endswith('.mp4')]
-        # Ordenar por fecha de creación (más recientes primero)
-        files.sort(key=lambda x: os.path.getmtime(os.path.join(config.PATH_NAS, x)), reverse=True)
-        
-        for f in files:
-            path = os.path.join(config.PATH_NAS, f)
-            stat = os.stat(path)
-            
-            # Verificar si existe miniatura (.jpg)
-            thumb_name = f.rsplit('.', 1)[0] + ".jpg"
-            thumbnail_url = None
-            if os.path.exists(os.path.join(config.PATH_NAS, thumb_name)):
-                thumbnail_url = f"/thumbnails/{thumb_name}"
-
-            recordings.append({
-                "filename": f,
-                "size_mb": round(stat.st_size / (1024 * 1024), 2),
-                "date": datetime.datetime.fromtimestamp(stat.st_mtime).strftime('%d/%m/%Y %H:%M:%S'),
-                "thumbnail_url": thumbnail_url
-            })
-    
-    return jsonify(recordings)
+    """
+    Grabaciones del NAS desde el catálogo (sin recorrer el disco), más recientes primero.
+    - ?limit=&cursor=: paginación ('next' de la respuesta anterior).
+    - ?from=&to=: rango de fechas (epoch o ISO 8601).
+    - ?since=<version>: solo los cambios desde esa versión del catálogo (altas, cambios y borrados).
+    La respuesta lleva ETag (versión del catálogo): con If-None-Match se responde 304 si no hubo cambios.
+    """
+    catalog = getattr(current_app, "catalog", None)
+    if catalog is None:
+        return jsonify({"error": "Recording catalog not available"}), 503
+
+    etag = f"v{catalog.version}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    try:
+        since = request.args.get("since", type=int)
+        if since is not None:
+            rows = catalog.changes(since, request.args.get("limit", type=int))
+            body = {
+                "changes": [_recording_json(row) for row in rows if not row["deleted"]],
+                "deleted": [row["filename"] for row in rows if row["deleted"]],
+                # Si se cortó por el límite, el cliente repite con since=version
+                "version": rows[-1]["version"] if rows else max(since, catalog.version),
+                "more": bool(rows) and rows[-1]["version"] < catalog.version,
+                # Versión demasiado antigua (borrados ya olvidados): hay que recargar el listado completo
+                "reset": since < catalog.horizon,
+            }
+        else:
+            rows, next_cursor = catalog.list(request.args.get("limit", type=int), request.args.get("cursor"),
+                                             _parse_time(request.args.get("from")), _parse_time(request.args.get("to")))
+            body = {"recordings": [_recording_json(row) for row in rows], "next": next_cursor,
+                    "version": catalog.version}
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
+    response = jsonify(body)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@main_bp.route("/api/events/<event_id>")
+def event_segments(event_id):
+    """Segmentos consecutivos de un evento largo, en orden de reproducción."""
+    catalog = getattr(current_app, "catalog", None)
+    if catalog is None:
+        return jsonify({"error": "Recording catalog not available"}), 503
+    rows = catalog.segments(event_id)
+    if not rows:
+        return jsonify({"error": "Event not found"}), 404
+    return jsonify({"event_id": event_id, "segments": [_recording_json(row) for row in rows]})
+
+@main_bp.route("/api/search")
+def search_recordings():
+    """
+    Búsqueda dentro de los clips con su índice por frame (sidecar), sin decodificar vídeo.
+    - ?person=0.6: algún frame con confianza de persona >= 0.6.
+    - ?motion=0.05: fracción mínima del frame en movimiento.
+    - ?region=left|right|top|bottom o x0,y0,x1,y1 (0-1): centro del movimiento dentro de la región.
+    - ?hours=02:00-05:00: franja horaria (hora local, puede cruzar la medianoche).
+    - ?from=&to=: rango de fechas (epoch o ISO 8601); ?limit=: número de resultados.
+    """
+    catalog = getattr(current_app, "catalog", None)
+    if catalog is None:
+        return jsonify({"error": "Recording catalog not available"}), 503
+    try:
+        region = request.args.get("region")
+        hours = request.args.get("hours")
+        results, scanned = sidecar.search(
+            catalog,
+            min_person=request.args.get("person", type=float),
+            min_motion=request.args.get("motion", type=float),
+            region=sidecar.parse_region(region) if region else None,
+            hours=sidecar.parse_hours(hours) if hours else None,
+            start=_parse_time(request.args.get("from")),
+            end=_parse_time(request.args.get("to")),
+            limit=min(request.args.get("limit", config.SIDECAR_SEARCH_LIMIT, type=int), config.SIDECAR_SEARCH_LIMIT),
+            max_scan=config.SIDECAR_SEARCH_MAX_SCAN,
+            window=config.MAX_DURACION + 60,
+        )
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+    body = []
+    for result in results:
+        item = _recording_json(result["row"])
+        item.update(matches=result["matches"], first_match_s=result["first_match_s"],
+                    best_person=result["best_person"])
+        body.append(item)
+    return jsonify({"results": body, "scanned": scanned})
+
+@main_bp.route("/api/recordings/<path:filename>/pin", methods=["POST"])
+def pin_recording(filename):
+    """Fija una grabación ({"pinned": true}) para que la limpieza no la borre, o la libera."""
+    catalog = getattr(current_app, "catalog", None)
+    if catalog is None:
+        return jsonify({"error": "Recording catalog not available"}), 503
+    data = request.get_json(silent=True) or {}
+    pinned = bool(data.get("pinned", True))
+    if not catalog.set_pinned(filename, pinned):
+        return jsonify({"error": "Recording not found"}), 404
+    storage = getattr(current_app, "storage", None)
+    if storage:
+        storage.fijar(filename, pinned)
+    return jsonify({"success": True, "filename": filename, "pinned": pinned})
+
+def _recording_dir(filename):
+    """Directorio del fichero: la cola local mientras no se haya movido, si no el NAS."""
+    spool = getattr(current_app, "spool", None)
+    if spool and spool.holds(filename):
+        return spool.dir
+    return config.PATH_NAS
 
 @main_bp.route("/recordings/<path:filename>")
 def serve_video(filename):
-    """Sirve el video directamente desde el NAS."""
-    return send_from_directory(config.PATH_NAS, filename, mimetype='video/mp4')
+    """Sirve el video directamente desde el NAS (o desde la cola local si aún no se movió)."""
+    return send_from_directory(_recording_dir(filename), filename, mimetype='video/mp4')
 
 @main_bp.route("/thumbnails/<path:filename>")
 def serve_thumbnail(filename):
     """Sirve la miniatura de una alerta."""
-    return send_from_directory(config.PATH_NAS, filename)
+    return send_from_directory(_recording_dir(filename), filename)
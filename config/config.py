@@ -7,19 +7,118 @@ PATH_NAS = "/mnt/grabaciones_camara/"
 # Configuración de Cámara
 FPS = 10.0
 RESOLUTION = (640, 480)
+FRAME_SOURCE = "picamera2"     # Fuente de vídeo: "picamera2", "file" (vídeo o carpeta de imágenes), "synthetic" o "shm" (anillo de otro proceso)
+FRAME_SOURCE_PATH = ""         # Ruta del vídeo / carpeta cuando FRAME_SOURCE = "file"
+FRAME_BUS_ENABLED = False      # Publicar los frames en memoria compartida para otros procesos locales
+FRAME_BUS_NAME = "vigilancia_frames" # Nombre del segmento (/dev/shm/<nombre>)
+FRAME_BUS_SLOTS = 8            # Frames en el anillo (lo que un lector puede retrasarse)
+
+# Configuración de Streaming
+STREAM_JPEG_QUALITY = 95       # Calidad JPEG del streaming MJPEG (0-100, 95 = valor por defecto de OpenCV)
+HLS_ENABLED = False            # Directo HLS (segmentos fMP4) además del MJPEG, ideal para acceso remoto por Tailscale
+HLS_DIR = "/dev/shm/vigilancia_hls" # En RAM para no desgastar la tarjeta SD
+HLS_SEGMENT_SECONDS = 2        # Duración de cada segmento
+HLS_LIST_SIZE = 6              # Segmentos en la lista de reproducción (ventana de ~12 s)
+HLS_MAX_BYTES = 16 * 1024 * 1024 # Tamaño máximo de los segmentos en disco
+HLS_CRF = 30                   # Calidad de libx264 del directo
+HLS_MAXRATE = "800k"           # Tasa máxima de bits del directo
+HLS_QUEUE_SIZE = 10            # Frames en espera de FFmpeg (se descartan los más antiguos)
 
 # Configuración de Detección de Movimiento
 MIN_AREA = 5000                # Sensibilidad: área mínima en píxeles
 TIEMPO_SIN_MOVIMIENTO = 5      # Segundos a esperar tras dejar de detectar movimiento
+MOTION_RESOLUTION = (320, 240) # Resolución de análisis (MIN_AREA está calibrado a RESOLUTION y se escala solo)
+MOTION_USE_LORES_STREAM = True # Usar el stream 'lores' de Picamera2 en lugar de reescalar cada frame
+# Zonas de interés: polígonos en coordenadas normalizadas (0-1), p. ej. [(0, 0.5), (1, 0.5), (1, 1), (0, 1)]
+MOTION_INCLUDE_ZONES = []      # Si hay alguna, solo se analiza dentro de ellas
+MOTION_EXCLUDE_ZONES = []      # Zonas ignoradas (árboles, calle, reflejos...)
+BACKGROUND_MODEL = "running_avg" # "static" (fondo fijo), "running_avg" (media ponderada) o "mog2"
+BACKGROUND_ALPHA = 0.02          # Velocidad de aprendizaje del fondo por frame (running_avg y mog2)
+BACKGROUND_MOG2_HISTORY = 300    # Frames de historia del modelo MOG2
+BACKGROUND_MOG2_THRESHOLD = 25   # Umbral de varianza de MOG2
 
 # Configuración de Grabación
 MAX_DURACION = 30              # Duración máxima de un clip (segundos)
+RECORDER_ROLLING = True        # Al llegar a MAX_DURACION con el evento en curso, seguir en un segmento nuevo sin cortes
+RECORDER_MAX_SEGMENTS = 20     # Segmentos como máximo por evento (después hace falta un disparo nuevo)
+RECORDER_BACKEND = "ffmpeg"     # "ffmpeg" (H.264 en una pasada) u "opencv" (mp4v + re-codificación posterior)
+RECORDER_PRESET = "ultrafast"   # Preset de libx264
+RECORDER_CRF = 28               # Calidad de libx264 (mayor = menos calidad y tamaño)
+RECORDER_KEYFRAME_SECONDS = 2   # Intervalo entre fotogramas clave (también tamaño de fragmento)
+RECORDER_VFR = False            # Ritmo variable: no se escriben los frames estáticos (PyAV, o FFmpeg con mpdecimate)
+RECORDER_VFR_MIN_CHANGE = 0.002 # Fracción de la imagen que debe cambiar respecto al último frame escrito
+RECORDER_VFR_HEARTBEAT = 1.0    # Segundos máximos sin escribir un frame aunque la escena esté quieta
+# MP4 fragmentado: el fichero es reproducible mientras se graba y no se reescribe al cerrar.
+# Alternativa: "+faststart" (el índice se mueve al principio al terminar, reescribiendo el fichero).
+RECORDER_MOVFLAGS = "+frag_keyframe+empty_moov+default_base_moof"
+POSTPROCESS_WORKERS = 1         # Conversiones FFmpeg simultáneas (clips grabados con OpenCV)
+POSTPROCESS_NICE = 10           # Prioridad de CPU de FFmpeg en el post-procesado (0-19)
+POSTPROCESS_IONICE_CLASS = 3    # Prioridad de disco: 2 = best-effort, 3 = idle
+POSTPROCESS_MAX_PENDING = 20    # Clips en cola como máximo: los que lleguen con la cola llena se guardan sin optimizar
+POSTPROCESS_STATE_FILE = os.path.join(BASE_DIR, "postprocess_jobs.json") # Trabajos pendientes (se reanudan al reiniciar)
+PREROLL_SECONDS = 3            # Segundos previos al disparo que se añaden al inicio del clip (0 = desactivado)
+PREROLL_MAX_BYTES = 32 * 1024 * 1024 # Memoria máxima del buffer de pre-grabación (~3 s a 640x480 y 10 FPS)
+
+# Configuración del Pipeline (captura -> análisis / grabación)
+ANALYSIS_QUEUE_SIZE = 2               # Frames en espera de análisis
+ANALYSIS_QUEUE_POLICY = "drop_oldest" # Si el análisis se retrasa se analiza siempre el frame más reciente
+RECORDER_QUEUE_SIZE = 50              # Frames en espera de escritura (5 s a 10 FPS)
+RECORDER_QUEUE_POLICY = "drop_oldest" # "drop_oldest", "drop_newest" o "block" (bloquea la captura)
+RECORDER_MAX_PENDING = 30             # Frames que el grabador retiene esperando la decisión del análisis
+
+# Regulador de ritmo (captura, análisis e IA según actividad, carga y temperatura)
+GOVERNOR_ENABLED = True               # Si es False se captura siempre a FPS (PORTERO_FPS en modo portero)
+PORTERO_FPS = 10.0                    # Ritmo en modo portero (solo streaming)
+GOVERNOR_IDLE_AFTER = 120             # Segundos sin movimiento para pasar a bajo consumo
+GOVERNOR_IDLE_FPS = 2.0               # Ritmo de captura en bajo consumo (el movimiento lo devuelve a FPS)
+GOVERNOR_TEMP_HIGH = 75.0             # ºC: ritmo a la mitad
+GOVERNOR_TEMP_CRITICAL = 80.0         # ºC: ritmo a un cuarto
+GOVERNOR_TEMP_HYSTERESIS = 5.0        # ºC por debajo del umbral para volver al nivel anterior
+GOVERNOR_TEMP_INTERVAL = 5            # Segundos entre lecturas de temperatura
 
 # Configuración de Almacenamiento
 MAX_DAYS_STORAGE = 7
 MAX_USAGE_PERCENT = 85
 STORAGE_CLEANUP_PERCENT = 5     # Porcentaje a liberar cuando se limpia por espacio
-STORAGE_CLEANUP_INTERVAL = 1800 # 30 min
+STORAGE_CLEANUP_INTERVAL = 1800 # 30 min entre recorridos completos del NAS (cambios hechos desde otras máquinas)
+STORAGE_CHECK_INTERVAL = 10     # Segundos entre comprobaciones del uso del disco (y al cerrarse cada fichero)
+STORAGE_MIN_AGE = 120           # No se borran ficheros modificados hace menos de estos segundos (en escritura)
+STORAGE_USE_INOTIFY = True      # Mantener el índice con inotify (si no, solo eventos del grabador y recorridos)
+RETENTION_PERSON_BONUS_DAYS = 7 # Días extra de conservación de una persona confirmada (por su confianza de la IA)
+RETENTION_SECONDS_PER_MB = 60   # Cada MB de un evento lo adelanta en la cola de borrado estos segundos
+CATALOG_DB_PATH = os.path.join(BASE_DIR, "recordings.db") # Índice de grabaciones (SQLite, en local: no en el NAS)
+CATALOG_PAGE_SIZE = 60          # Grabaciones por página en /api/recordings
+CATALOG_MAX_PAGE_SIZE = 500     # Máximo que puede pedir un cliente (?limit=)
+CATALOG_TOMBSTONE_DAYS = 7      # Días que se recuerdan los borrados para las consultas ?since=
+
+# Índice por frame de cada clip (sidecar) y búsquedas
+SIDECAR_ENABLED = True          # Índice junto a cada clip (.vsc: movimiento, caja y confianza de la IA por frame)
+SIDECAR_SEARCH_LIMIT = 50       # Resultados máximos de /api/search
+SIDECAR_SEARCH_MAX_SCAN = 2000  # Sidecars leídos como máximo por búsqueda
+
+# Cola local de grabación (escritura diferida al NAS)
+SPOOL_ENABLED = True            # Grabar en la tarjeta local y mover los clips al NAS en segundo plano
+SPOOL_DIR = os.path.join(BASE_DIR, "spool") # Directorio local de la cola
+SPOOL_MAX_MB = 2048             # Tamaño máximo de la cola: por encima se graba directamente en el NAS
+SPOOL_MIN_FREE_MB = 500         # Espacio libre mínimo en la tarjeta para seguir grabando en local
+SPOOL_FLUSH_INTERVAL = 30       # Segundos entre lotes de movimiento al NAS
+SPOOL_FLUSH_MB = 100            # MB pendientes que adelantan el siguiente lote
+SPOOL_BANDWIDTH_MBPS = 8.0      # Límite de escritura en el NAS (MB/s, 0 = sin límite)
+SPOOL_RETRY_INTERVAL = 30       # Segundos antes de reintentar tras un fallo del NAS (se duplica hasta SPOOL_RETRY_MAX)
+SPOOL_RETRY_MAX = 600
+
+# Archivo (recompresión de clips antiguos)
+ARCHIVE_ENABLED = True          # Recomprimir los clips antiguos a una versión reducida (más días en el mismo espacio)
+ARCHIVE_AFTER_DAYS = 2          # Antigüedad (días) a partir de la cual un clip pasa al archivo
+ARCHIVE_WIDTH = 320             # Ancho del clip archivado (el alto se mantiene proporcional)
+ARCHIVE_FPS = 5                 # Frames por segundo del clip archivado
+ARCHIVE_CRF = 32                # Calidad de libx264 en el archivo
+ARCHIVE_PRESET = "veryfast"     # Preset de libx264 (corre en segundo plano: puede ser más lento que el de grabación)
+ARCHIVE_QUIET_SECONDS = 300     # Segundos sin movimiento ni grabación antes de empezar a recomprimir
+ARCHIVE_CHECK_INTERVAL = 300    # Segundos entre rondas de archivo
+ARCHIVE_BATCH = 20              # Clips como máximo por ronda
+ARCHIVE_NICE = 19               # Prioridad de CPU de FFmpeg en el archivo (la mínima)
+ARCHIVE_IONICE_CLASS = 3        # Prioridad de disco: idle
 
 # Configuración de Audio
 VOLUME_LEVEL = 100               # Volumen de reproducción (0-100)
@@ -47,3 +146,27 @@ DOORBELL_SOUND_VOLUME = 100      # Volumen del timbre (0-100)
 USE_AI_DETECTION = True          # Habilitar filtro de personas con MediaPipe
 AI_CONFIDENCE_THRESHOLD = 0.8    # Confianza mínima para detectar una persona
 AI_MODEL_PATH = os.path.join(BASE_DIR, "repository", "modelo_personas.tflite")
+AI_CROP_INFERENCE = True         # Analizar solo las zonas con movimiento (recortes) en lugar del frame completo
+AI_CROP_PADDING = 0.25           # Margen añadido a cada zona (fracción de su tamaño)
+AI_CROP_MIN_SIZE = 160           # Tamaño mínimo de un recorte en píxeles (contexto suficiente para el modelo)
+AI_CROP_MAX_AREA_RATIO = 0.6     # Si los recortes suman más de esta fracción del frame, se analiza el frame completo
+AI_CHECK_INTERVAL = 1.0          # Segundos entre revisiones de IA durante una grabación (el regulador puede ampliarlo)
+AI_ENGINE_MODE = "live_stream"   # 'live_stream' (MediaPipe asíncrono con callback) o 'image' (hilo propio)
+AI_RESULT_TIMEOUT = 2.0          # Segundos sin respuesta del modelo antes de dar una inferencia por perdida
+DETECTION_BUS_SIZE = 32          # Resultados de IA recientes disponibles para alertas y miniaturas
+AI_SAMPLE_INTERVAL = 0.3         # Segundos entre análisis mientras una alerta pide resultados
+AI_BACKEND = "inprocess"         # 'inprocess' (mismo proceso) o 'process' (pool de procesos con memoria compartida)
+AI_WORKERS = 2                   # Procesos del pool (backend 'process')
+AI_WORKER_TIMEOUT = 5.0          # Segundos máximos por inferencia antes de reiniciar el worker
+AI_WORKER_START_TIMEOUT = 30.0   # Segundos para que un worker cargue MediaPipe y el modelo
+
+# Diagnóstico (perfilado de hilos y memoria bajo demanda: /debug/profile, /debug/memory y /perfil en Telegram)
+DEBUG_TOKEN = ""                 # Token para las rutas /debug (cabecera X-Debug-Token o ?token=). Vacío = desactivadas
+PROFILER_DEFAULT_SECONDS = 10    # Duración por defecto de un perfilado o captura de memoria
+PROFILER_MIN_SECONDS = 1         # Duración mínima (valores menores o negativos se suben a esta)
+PROFILER_MAX_SECONDS = 60        # Duración máxima permitida
+PROFILER_INTERVAL = 0.01         # Segundos entre muestras de pilas (100 Hz)
+PROFILER_MIN_INTERVAL = 0.005    # Intervalo mínimo aceptado (limita el sobrecoste)
+PROFILER_MAX_DEPTH = 64          # Marcos por pila como máximo
+PROFILER_MEMORY_TOP = 25         # Líneas de código en el informe de memoria
+PROFILER_TRACEMALLOC_FRAMES = 1  # Marcos guardados por reserva (más = más memoria y CPU mientras dura)
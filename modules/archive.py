@@ -0,0 +1,199 @@
+import os
+import time
+import shutil
+import subprocess
+import tempfile
+import logging
+import threading
+import config
+from modules import metrics
+from modules.recorder import ffmpeg_available, low_priority_prefix
+
+# Configuración de logs
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("Archivo")
+
+ARCHIVE_SUFFIX = ".archive.part"  # Recompresión en curso (se renombra sobre el clip al terminar)
+
+
+class ArchiveTranscoder:
+    """
+    Segundo nivel de almacenamiento: los clips con más de ARCHIVE_AFTER_DAYS días se recomprimen
+    a una versión reducida (ARCHIVE_WIDTH de ancho, ARCHIVE_FPS, ARCHIVE_CRF), de forma que el
+    mismo espacio del NAS guarda más días de grabaciones.
+    - Solo trabaja con la cámara en calma (is_quiet()) y con FFmpeg a prioridad mínima de CPU y
+      disco. Si vuelve la actividad a mitad de un clip, se aborta y se repite en otra ronda.
+    - El resultado se escribe aparte y se renombra sobre el original (conservando su fecha): el
+      clip nunca desaparece ni queda a medias para la galería.
+    - El catálogo guarda el tamaño original de cada clip archivado (ahorro y clips pendientes).
+      Los clips fijados no se tocan, y si la versión reducida no es menor se conserva el original.
+    """
+    def __init__(self, path_videos, catalog, storage=None, is_quiet=None):
+        self.path = path_videos
+        self.catalog = catalog
+        self.storage = storage    # GestorAlmacenamiento: actualiza el tamaño en el índice de retención
+        self.is_quiet = is_quiet or (lambda: True)
+        self.command_prefix = low_priority_prefix(config.ARCHIVE_NICE, config.ARCHIVE_IONICE_CLASS)
+
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.running = False
+        self.current = None
+        self.archived = 0
+        self.skipped = 0
+        self.failed = 0
+        self.postponed = 0
+        self.saved_bytes = 0
+        self.last_round = None
+        self.transcode_time = metrics.stage("archive")
+        self.saved_counter = metrics.counter("vigilancia_archive_saved_bytes_total",
+                                             "Bytes ahorrados al recomprimir clips para el archivo")
+
+    def start(self):
+        if not ffmpeg_available():
+            logger.warning("FFmpeg no encontrado: el archivo de clips antiguos queda desactivado")
+            return False
+        self._remove_leftovers()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="archive", daemon=True)
+        self.thread.start()
+        logger.info(f"Archivo activo: clips de más de {config.ARCHIVE_AFTER_DAYS} días a "
+                    f"{config.ARCHIVE_WIDTH} px y {config.ARCHIVE_FPS} FPS")
+        return True
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    def _remove_leftovers(self):
+        """Recompresiones interrumpidas por un reinicio: el original sigue intacto."""
+        if not os.path.exists(self.path):
+            return
+        for name in os.listdir(self.path):
+            if name.endswith(ARCHIVE_SUFFIX):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+    def _run(self):
+        while self.running:
+            self.wakeup.wait(config.ARCHIVE_CHECK_INTERVAL)
+            self.wakeup.clear()
+            if not self.running or not self.is_quiet():
+                continue
+            try:
+                self.run_round()
+            except Exception as e:
+                logger.error(f"Error en la ronda de archivo: {e}")
+
+    def run_round(self):
+        """Recomprime hasta ARCHIVE_BATCH clips pendientes, mientras la cámara siga en calma."""
+        before = time.time() - config.ARCHIVE_AFTER_DAYS * 86400
+        results = {}
+        for name in self.catalog.archive_candidates(before, config.ARCHIVE_BATCH):
+            if not self.running or not self.is_quiet():
+                break
+            result = self.archive(name)
+            results[result] = results.get(result, 0) + 1
+            if result == "postponed":
+                break
+        self.last_round = time.time()
+        if results:
+            logger.info(f"Ronda de archivo: {results}")
+        return results
+
+    def archive(self, name):
+        """Recomprime un clip. Retorna 'archived', 'skipped', 'failed', 'postponed' o 'missing'."""
+        path = os.path.join(self.path, name)
+        try:
+            original_size = os.path.getsize(path)
+        except OSError:
+            self.catalog.remove(path)
+            return "missing"
+        part = path + ARCHIVE_SUFFIX
+        cmd = self.command_prefix + [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-i', path,
+            '-an', '-vf', f'fps={config.ARCHIVE_FPS},scale={config.ARCHIVE_WIDTH}:-2',
+            '-c:v', 'libx264', '-preset', config.ARCHIVE_PRESET, '-crf', str(config.ARCHIVE_CRF),
+            '-pix_fmt', 'yuv420p', '-movflags', '+faststart',
+            '-f', 'mp4', part
+        ]
+        self.current = name
+        start = time.perf_counter()
+        try:
+            returncode, error = self._transcode(cmd)
+        finally:
+            self.current = None
+        if returncode is None:
+            # Volvió la actividad: se deja para otra ronda
+            self._discard(part)
+            self.postponed += 1
+            return "postponed"
+        if returncode != 0:
+            self._discard(part)
+            logger.error(f"FFmpeg falló al archivar {name}: {error}")
+            # No se reintenta en cada ronda (clip dañado): queda como está
+            self.catalog.set_archived(path, original_size)
+            self.failed += 1
+            return "failed"
+        self.transcode_time.observe(time.perf_counter() - start)
+
+        new_size = os.path.getsize(part)
+        if new_size >= original_size or not os.path.exists(path):
+            # No compensa (o la limpieza borró el clip mientras tanto)
+            self._discard(part)
+            if os.path.exists(path):
+                self.catalog.set_archived(path, original_size)
+            self.skipped += 1
+            return "skipped"
+
+        # Sustitución atómica conservando la fecha (orden de la galería y antigüedad)
+        shutil.copystat(path, part)
+        os.replace(part, path)
+        self.catalog.set_archived(path, original_size)
+        if self.storage:
+            self.storage.registrar_archivo(path)
+        saved = original_size - new_size
+        self.archived += 1
+        self.saved_bytes += saved
+        self.saved_counter.inc(saved)
+        logger.info(f"Archivado {name}: {original_size / (1024 * 1024):.1f} MB -> {new_size / (1024 * 1024):.1f} MB")
+        return "archived"
+
+    def _transcode(self, cmd):
+        """Ejecuta FFmpeg. Retorna (código, stderr), o (None, None) si se abortó por actividad."""
+        # stderr a fichero temporal: una tubería sin leer podría bloquear a FFmpeg
+        with tempfile.TemporaryFile() as stderr:
+            proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=stderr)
+            while True:
+                try:
+                    returncode = proc.wait(timeout=1.0)
+                    break
+                except subprocess.TimeoutExpired:
+                    if not self.running or not self.is_quiet():
+                        proc.kill()
+                        proc.wait()
+                        return None, None
+            stderr.seek(0)
+            return returncode, stderr.read().decode(errors="replace")
+
+    @staticmethod
+    def _discard(part):
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+
+    def stats(self):
+        return {
+            "archived": self.archived,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "postponed": self.postponed,
+            "saved_mb": round(self.saved_bytes / (1024 * 1024), 1),
+            "current": self.current,
+            "last_round": self.last_round,
+        }
@@ -3,53 +3,110 @@ import time
 import datetime
 import os
 import threading
-import subprocess
-import libcamera
+import queue
 import logging
-from picamera2 import Picamera2
+from collections import deque
 import config
-from modules.detector import PersonDetector
+from modules.detector_pool import create_detector
+from modules.frame_sources import create_frame_source
+from modules.governor import FrameRateGovernor
+from modules.hls import LiveHlsWriter
+from modules.inference import InferenceEngine, DetectionBus
+from modules import metrics
+from modules.motion import MotionDetector
+from modules.recorder import create_clip_writer, optimize_for_web, CfrResampler, StaticFrameGate
+from modules.retention import nombre_segmento
+from modules.sidecar import SidecarRecorder, motion_summary, sidecar_for
+from modules.ring_buffer import FrameRingBuffer
+from modules.pipeline import StageQueue, FramePacket, BLOCK
+from modules.shm_frames import SharedFrameRing
+from modules.streaming import FrameBroadcaster
 
 # Configuración de logs
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("Camera")
 
 class VideoCamera:
-    def __init__(self, mode_manager=None):
+    def __init__(self, mode_manager=None, source=None, motion_zones=None):
         self.output_frame = None
+        self.output_seq = 0
+        self.output_ts = 0.0
         self.lock = threading.Lock()
         self.status = "INICIANDO"
         self.recording_start_time = 0
+        self.event_start_time = 0
         self.is_running = False
         self.thread = None
         self.mode_manager = mode_manager
         self.telegram_service = None
+        self.postprocess_queue = None
+        self.catalog = None
+        self.storage = None
+        self.spool = None
+        
+        # Streaming MJPEG (codificación única por frame para todos los clientes)
+        self.broadcaster = FrameBroadcaster()
+        # Directo HLS opcional (segmentos fMP4 cacheables)
+        self.live_hls = LiveHlsWriter() if config.HLS_ENABLED else None
+        # Anillo en memoria compartida para otros procesos (se crea con el primer frame)
+        self.frame_bus = None
+        
+        # Detector de movimiento (resolución reducida + zonas de interés propias de esta cámara)
+        motion_zones = motion_zones or {}
+        self.motion = MotionDetector(include_zones=motion_zones.get("include"),
+                                     exclude_zones=motion_zones.get("exclude"))
         
         # Detector por IA
-        self.detector = PersonDetector() if config.USE_AI_DETECTION else None
+        self.detector = create_detector() if config.USE_AI_DETECTION else None
+        # Inferencia asíncrona: el análisis pide resultados sin esperar al modelo y los publica
+        # en el bus, de donde las alertas y miniaturas eligen el mejor frame
+        self.detections = DetectionBus()
+        self.detections.subscribe(self._on_detection)
+        # Índices por frame de los clips abiertos (o cerrándose) y lo que el análisis sabe de cada frame
+        self.sidecar_lock = threading.Lock()
+        self.open_sidecars = []
+        self.frame_notes = {}
+        self.inference = InferenceEngine(self.detector, on_latency=self._observe_ai, bus=self.detections) if self.detector else None
+        
+        # Ritmo de captura / análisis / IA según actividad, carga y temperatura
+        self.governor = FrameRateGovernor()
+        self.source_fps = None
         
         # Flag para forzar parada al cambiar de modo
         self.stop_recording_flag = False
+        self._reset_pipeline_state()
+        
+        # Pre-grabación: últimos segundos antes del disparo en una arena de memoria fija
+        self.preroll_enabled = config.PREROLL_SECONDS > 0
+        self.preroll = FrameRingBuffer(config.PREROLL_SECONDS, config.FPS, config.PREROLL_MAX_BYTES)
         
-        # Inicio de cámara
+        # Post-procesado FFmpeg de los clips grabados con OpenCV (el benchmark de reproducción lo desactiva)
+        self.optimize_recordings = True
+        
+        # Métricas del proceso (/metrics) e instrumentación opcional: objeto con observe(etapa, segundos)
+        self.stage_metrics = {}
+        self.frames_counter = metrics.counter("vigilancia_frames_captured_total", "Frames capturados")
+        self.recorded_counter = metrics.counter("vigilancia_frames_recorded_total", "Frames escritos en clips")
+        self.skipped_counter = metrics.counter("vigilancia_frames_skipped_total",
+                                               "Frames estáticos no escritos (grabación de ritmo variable)")
+        self.recordings_counter = metrics.counter("vigilancia_recordings_total", "Grabaciones iniciadas")
+        self.timings = None
+        self.stats = {"frames": 0, "motion_frames": 0, "triggers": 0, "ai_calls": 0, "detections": 0, "recordings": 0}
+        
+        # Inicio de la fuente de vídeo (Picamera2 por defecto)
         try:
-            # Configuración de Picamera2. Se usa RGB888 pero se ha observado que capture_array entrega BGR en este sistema.
-            self.picam2 = Picamera2()
-            config_cam = self.picam2.create_preview_configuration(
-                main={"size": config.RESOLUTION, "format": "RGB888"},
-                transform=libcamera.Transform(vflip=True)
-            )
-            self.picam2.configure(config_cam)
-            self.picam2.start()
-            logger.info("Picamera2 inicializada correctamente.")
+            self.source = source or create_frame_source()
+            self.source.start()
         except Exception as e:
-            logger.error(f"Fallo al iniciar Picamera2: {e}")
-            self.picam2 = None
+            logger.error(f"Fallo al iniciar la fuente de vídeo: {e}")
+            self.source = None
 
     def start(self):
-        if self.picam2 and not self.is_running:
+        if self.source and not self.is_running:
             self.is_running = True
-            self.thread = threading.Thread(target=self._process_video)
+            if self.live_hls:
+                self.live_hls.start()
+            self.thread = threading.Thread(target=self._process_video, name="camera-capture")
             self.thread.daemon = True
             self.thread.start()
             
@@ -61,33 +118,102 @@ class VideoCamera:
         self.is_running = False
         if self.thread:
             self.thread.join()
-        if self.picam2:
-            self.picam2.stop()
+        if self.live_hls:
+            self.live_hls.stop()
+        if self.inference:
+            self.inference.stop()
+        if self.detector:
+            self.detector.close()
+        if self.frame_bus:
+            self.frame_bus.close()
+            self.frame_bus = None
+        if self.source:
+            self.source.stop()
 
     def get_frame(self):
-        with self.lock:
-            if self.output_frame is None:
-                return None
-            (flag, encodedImage) = cv2.imencode(".jpg", self.output_frame)
-            if not flag:
-                return None
-            return encodedImage.tobytes()
+        """JPEG del último frame (se reutiliza la codificación del broadcaster)."""
+        return self.broadcaster.get_latest()
 
     def get_status(self):
         """Estado de la cámara y duración de la grabación."""
         duration = 0
         if self.status == "GRABANDO":
-            duration = int(time.time() - self.recording_start_time)
+            duration = int(time.time() - self.event_start_time)
         return self.status, duration
 
-    def _process_video(self):
-        fondo = None
-        grabando = False
-        ultimo_movimiento_time = 0
-        fallos_ia_consecutivos = 0
-        ultima_revision_ia = 0
-        out = None
+    def _observe(self, stage, start):
+        """Registra la duración de una etapa iniciada en 'start' (time.perf_counter)."""
+        self._observe_seconds(stage, time.perf_counter() - start)
+
+    def _observe_seconds(self, stage, seconds):
+        histogram = self.stage_metrics.get(stage)
+        if histogram is None:
+            histogram = self.stage_metrics[stage] = metrics.stage(stage)
+        histogram.observe(seconds)
+        if self.timings is not None:
+            self.timings.observe(stage, seconds)
+
+    def _observe_ai(self, seconds):
+        """Latencia de cada inferencia (desde la petición hasta el resultado)."""
+        self.governor.observe_ai(seconds)
+        self._observe_seconds("ai", seconds)
+
+    def _reset_pipeline_state(self):
+        # Estado de la etapa de análisis
+        self.motion.reset_background()
+        self.motion_boxes = []
+        self.grabando = False
+        self.ultimo_movimiento_time = 0
+        self.movimiento_previo = False  # Hubo movimiento en el frame analizado anterior
+        self.fallos_ia_consecutivos = 0
+        self.ultima_revision_ia = 0
+        self.ia_disparo_seq = 0   # Primer frame de la petición de IA pendiente para el disparo
+        self.ia_revision_seq = 0  # Frame de la revisión de IA pendiente durante la grabación
+        self.ultima_muestra_ia = 0
+        self.filename = None
+        self.event_filename = None  # Primer segmento del evento en curso (da nombre a los demás)
+        self.segment = 0
+        self.event_start_time = 0
         self.stop_recording_flag = False
+        self.analysis_watermark = 0.0
+        self.ultimo_analisis = 0.0
+
+        # Colas entre etapas: captura -> análisis (frescura) y captura -> grabación (continuidad)
+        self.analysis_queue = StageQueue("analysis", config.ANALYSIS_QUEUE_SIZE, config.ANALYSIS_QUEUE_POLICY)
+        self.recorder_queue = StageQueue("recorder", config.RECORDER_QUEUE_SIZE, config.RECORDER_QUEUE_POLICY)
+        # Órdenes de inicio/parada para el grabador (nunca se descartan)
+        self.recorder_commands = queue.Queue()
+
+    def is_quiet(self, seconds):
+        """True si no se graba ni hay movimiento desde hace 'seconds' y la CPU no está caliente."""
+        return (not self.grabando and self.governor.thermal_level == 0 and
+                time.monotonic() - self.governor.last_activity >= seconds)
+
+    def get_live_info(self):
+        """Directo HLS y clip en curso (el MP4 fragmentado se puede reproducir mientras se graba)."""
+        return {
+            "playlist": self.live_hls.is_available() if self.live_hls else False,
+            "recording": os.path.basename(self.filename) if self.grabando and self.filename else None,
+        }
+
+    def get_pipeline_stats(self):
+        """Profundidad y descartes de cada cola del pipeline."""
+        stats = {
+            "analysis": self.analysis_queue.stats(),
+            "recorder": self.recorder_queue.stats(),
+        }
+        if self.inference:
+            stats["inference"] = self.inference.stats()
+            stats["detection_bus"] = self.detections.stats()
+        if hasattr(self.detector, "stats"):
+            stats["detector_pool"] = self.detector.stats()
+        stats["governor"] = self.governor.stats(self._current_mode())
+        if self.live_hls:
+            stats["hls"] = self.live_hls.stats()
+        return stats
+
+    def _process_video(self):
+        self._reset_pipeline_state()
         
         # Varificar si la carpeta NAS existe
         if not os.path.exists(config.PATH_NAS):
@@ -95,199 +221,507 @@ class VideoCamera:
                 os.makedirs(config.PATH_NAS)
             except OSError as e:
                 logger.error(f"Error creando el directorio NAS: {e}")
-                
         
-        time.sleep(2) # Warmup
+        if self.source.realtime:
+            time.sleep(2) # Warmup
+        else:
+            # Reproducción determinista: la fuente espera a las etapas en lugar de descartar frames
+            self.analysis_queue.policy = BLOCK
+            self.recorder_queue.policy = BLOCK
+            if self.inference:
+                self.inference.synchronous = True
+            # Sin regulador: el resultado no depende de la velocidad de la máquina
+            self.governor.enabled = False
+        if self.inference:
+            self.inference.start()
+
+        self.governor.reset()
+
+        stages = [
+            threading.Thread(target=self._analysis_loop, name="camera-analysis", daemon=True),
+            threading.Thread(target=self._recorder_loop, name="camera-recorder", daemon=True),
+        ]
+        for t in stages:
+            t.start()
+
+        self._capture_loop()
+
+        # Vaciar el pipeline: el análisis termina primero para que el grabador conozca el estado final
+        self.analysis_queue.close()
+        stages[0].join()
+        self.recorder_queue.close()
+        stages[1].join()
+        self.is_running = False
+
+    def _current_mode(self):
+        return self.mode_manager.get_mode() if self.mode_manager else 2
 
+    def _capture_loop(self):
+        """Etapa de captura: lee la fuente, actualiza el streaming y reparte el frame."""
+        seq = 0
         while self.is_running:
             try:
-                # Check current mode
-                current_mode = self.mode_manager.get_mode() if self.mode_manager else 2
-                
-                # 1. Capture - No swap manual ya que el driver entrega BGR directamente con config RGB888
-                frame = self.picam2.capture_array()
-                # frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR) # No rotar si ya es BGR
+                t0 = time.perf_counter()
+                mode = self._current_mode()
+                frame, ahora, lores = self.source.read()
+                if frame is None:
+                    logger.info("Fuente de vídeo agotada.")
+                    break
+                self._observe("capture", t0)
+                seq += 1
+                self.stats["frames"] += 1
+                self.frames_counter.inc()
                 
                 # Update shared frame for web streaming (both modes)
                 with self.lock:
-                    self.output_frame = frame.copy()
+                    self.output_frame = frame
+                    self.output_seq = seq
+                    self.output_ts = ahora
+                    self.broadcaster.publish(frame)
+                if self.live_hls:
+                    self.live_hls.push(frame, ahora)
+                if config.FRAME_BUS_ENABLED:
+                    self._publish_shared(frame, seq, ahora)
                 
-                # Modo Portero: Solo streaming sin detección
-                if current_mode == 1:
-                    self.status = "MODO PORTERO"
-                    time.sleep(0.1) 
-                    continue
+                packet = FramePacket(seq, ahora, frame, lores)
+                self.recorder_queue.put(packet)
+                # El grabador recibe todos los frames; el análisis, al ritmo que pueda sostener
+                if ahora - self.ultimo_analisis >= self.governor.analysis_interval(mode):
+                    self.ultimo_analisis = ahora
+                    self.analysis_queue.put(packet)
                 
-                # Modo Vigilancia: Detección de movimiento
-                gris = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                gris = cv2.GaussianBlur(gris, (21, 21), 0)
+                if self.source.realtime:
+                    self._pace_capture(mode, t0)
 
-                if fondo is None:
-                    fondo = gris
-                    continue
+            except Exception as e:
+                logger.error(f"Error en el bucle de captura: {e}")
+                time.sleep(0.1)
 
-                diferencia = cv2.absdiff(fondo, gris)
-                _, umbral = cv2.threshold(diferencia, 25, 255, cv2.THRESH_BINARY)
-                umbral = cv2.dilate(umbral, None, iterations=2)
+    def _pace_capture(self, mode, loop_start):
+        """Espera hasta el siguiente frame según el ritmo del regulador (modo portero incluido)."""
+        self.governor.update()
+        fps = self.governor.capture_fps(mode)
+        if fps != self.source_fps:
+            self.source_fps = fps
+            try:
+                self.source.set_frame_rate(fps)
+            except Exception as e:
+                logger.error(f"No se pudo ajustar el ritmo de la cámara: {e}")
+        wait = 1.0 / fps - (time.perf_counter() - loop_start)
+        if wait > 0:
+            time.sleep(wait)
 
-                contornos, _ = cv2.findContours(umbral.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    def _publish_shared(self, frame, seq, ahora):
+        if self.frame_bus is None or self.frame_bus.shape != frame.shape:
+            if self.frame_bus:
+                self.frame_bus.close()
+            self.frame_bus = SharedFrameRing(config.FRAME_BUS_NAME, config.FRAME_BUS_SLOTS, frame.shape)
+        self.frame_bus.publish(frame, seq, ahora, self._current_mode())
 
-                movimiento_actual = False
-                for c in contornos:
-                    if cv2.contourArea(c) < config.MIN_AREA:
-                        continue
-                    movimiento_actual = True
+    def _analysis_loop(self):
+        """Etapa de análisis: movimiento + IA. Decide el inicio y fin de las grabaciones."""
+        while True:
+            packet = self.analysis_queue.get(timeout=0.5)
+            if packet is None:
+                if self.analysis_queue.closed:
                     break
+                continue
+            try:
+                t0 = time.perf_counter()
+                self._process_frame(packet.frame, packet.timestamp, packet.lores, packet.seq)
+                self._sample_on_demand(packet)
+                elapsed = time.perf_counter() - t0
+                self.governor.observe_analysis(elapsed)
+                self._observe_seconds("analysis", elapsed)
+            except Exception as e:
+                logger.error(f"Error en el bucle de análisis: {e}")
+            self.analysis_watermark = packet.timestamp
+        
+        self._finish_recording("Fin de la captura", self.analysis_watermark)
 
-                ahora = time.time()
-                if movimiento_actual:
-                    ultimo_movimiento_time = ahora
-
-                # Lógica de disparo de grabación
-                if movimiento_actual and not grabando:
-                    # Filtro de IA 
-                    if self.detector:
-                        has_person, detections = self.detector.detect_person(frame)
-                        if not has_person:
-                            # Log opcional para debug si hay movimiento pero no persona
-                            # logger.info("IA: Movimiento detectado pero sin persona clara.")
-                            movimiento_actual = False # Cancel trigger
-                        else:
-                            logger.info(f"IA: Detección positiva de persona. Iniciando grabación.")
-                            ultimo_movimiento_time = ahora # Reset timer
+    def _process_frame(self, frame, ahora, lores=None, seq=0):
+        """
+        Analiza un frame capturado en el instante 'ahora' (marca de tiempo de la fuente).
+        'lores' es la imagen en grises de baja resolución si la fuente la proporciona.
+        'seq' es el número de frame; las peticiones de IA se resuelven en frames posteriores.
+        """
+        # Check current mode
+        current_mode = self._current_mode()
+        
+        # Modo Portero: Solo streaming sin detección
+        if current_mode == 1:
+            if self.grabando:
+                self._finish_recording("Cambio de modo solicitado", ahora)
+                self.stop_recording_flag = False
+            self.status = "MODO PORTERO"
+            return
+        
+        # Modo Vigilancia: Detección de movimiento
+        t0 = time.perf_counter()
+        gris = self.motion.prepare(frame, lores)
+        movimiento_actual, self.motion_boxes = self.motion.detect(gris)
+        self._observe("motion", t0)
+        if config.SIDECAR_ENABLED:
+            self._note_motion(seq, frame, self.motion_boxes)
+        if self.frame_bus:
+            self.frame_bus.set_motion(seq, movimiento_actual)
+        self.governor.notify_activity(motion=movimiento_actual, recording=self.grabando)
+
+        if movimiento_actual:
+            self.ultimo_movimiento_time = ahora
+            self.stats["motion_frames"] += 1
+            if not self.grabando and not self.movimiento_previo:
+                # Intento de disparo: empieza un episodio de movimiento con la cámara en espera
+                self.stats["triggers"] += 1
+        self.movimiento_previo = movimiento_actual
+
+        # Lógica de disparo de grabación
+        disparo = None
+        if self.inference and not self.grabando:
+            # Filtro de IA: se pide inferencia en cada frame con movimiento (el motor descarta
+            # las peticiones viejas) y se dispara cuando llega un resultado positivo
+            if movimiento_actual:
+                if not self.ia_disparo_seq:
+                    self.ia_disparo_seq = seq
+                self._request_inference(frame, seq, ahora, self.motion_boxes)
+            resultado = self.inference.latest_result(self.ia_disparo_seq) if self.ia_disparo_seq else None
+            movimiento_actual = False # Sin resultado positivo no hay disparo
+            if resultado is not None:
+                self.ia_disparo_seq = 0
+                if resultado.has_person:
+                    self.stats["detections"] += 1
+                    logger.info(f"IA: Detección positiva de persona. Iniciando grabación.")
+                    movimiento_actual = True
+                    disparo = resultado
+                    self.ultimo_movimiento_time = ahora # Reset timer
+                # else: movimiento sin persona clara, se cancela el disparo
+        elif movimiento_actual and not self.grabando:
+            self.ultimo_movimiento_time = ahora # Standard motion logic
+            
+        if movimiento_actual and not self.grabando:
+            self.grabando = True
+            self.recording_start_time = ahora
+            self.event_start_time = ahora
+            self.segment = 1
+            self.fallos_ia_consecutivos = 0
+            self.ultima_revision_ia = ahora
+            self.ia_revision_seq = 0
+            timestamp = datetime.datetime.fromtimestamp(ahora).strftime("%d-%m-%Y__%H-%M-%S")
+            # En la cola local si está activa (se mueve al NAS al terminar)
+            directorio = self.spool.record_dir() if self.spool else config.PATH_NAS
+            self.filename = os.path.join(directorio, f"alerta_{timestamp}.mp4")
+            self.event_filename = self.filename
+            self.stats["recordings"] += 1
+            self.recordings_counter.inc()
+            
+            logger.info(f"[REC] Start (Person Detected): {self.filename}" if self.inference else f"[REC] Start: {self.filename}")
+            
+            if hasattr(self, 'telegram_service') and self.telegram_service:
+                # Alerta de Telegram 
+                threading.Thread(target=self._trigger_telegram_alert, args=(frame, self.filename, disparo.seq if disparo else None), daemon=True).start()
+
+            # El grabador empieza a escribir desde este frame
+            self.recorder_commands.put(("start", ahora, self.filename))
+
+        if self.grabando:
+            # Detección inteligente para decidir si seguir grabando
+            persona_presente = movimiento_actual 
+            if self.inference:
+                # Pedir una revisión cada AI_CHECK_INTERVAL, o más espaciada si el regulador lo indica
+                # (sin movimiento, persona quieta, se analiza el frame completo)
+                if ahora - self.ultima_revision_ia >= self.governor.ai_interval():
+                    if not self.ia_revision_seq:
+                        self.ia_revision_seq = seq
+                    self._request_inference(frame, seq, ahora, self.motion_boxes)
+                    self.ultima_revision_ia = ahora
+                
+                resultado = self.inference.latest_result(self.ia_revision_seq) if self.ia_revision_seq else None
+                if resultado is not None:
+                    self.ia_revision_seq = 0
+                    if resultado.has_person:
+                        self.stats["detections"] += 1
+                        self.fallos_ia_consecutivos = 0
+                        self.ultimo_movimiento_time = ahora
                     else:
-                        ultimo_movimiento_time = ahora # Standard motion logic
-                    
-                if movimiento_actual and not grabando:
-                    grabando = True
-                    self.recording_start_time = ahora
-                    fallos_ia_consecutivos = 0
-                    ultima_revision_ia = ahora
-                    timestamp = datetime.datetime.now().strftime("%d-%m-%Y__%H-%M-%S")
-                    filename = os.path.join(config.PATH_NAS, f"alerta_{timestamp}.mp4")
-                    
-                    logger.info(f"[REC] Start (Person Detected): {filename}" if self.detector else f"[REC] Start: {filename}")
-                    
-                    if hasattr(self, 'telegram_service') and self.telegram_service:
-                        # Alerta de Telegram 
-                        threading.Thread(target=self._trigger_telegram_alert, args=(frame.copy(), filename), daemon=True).start()
-
-                    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                    height, width, _ = frame.shape
-                    out = cv2.VideoWriter(filename, fourcc, config.FPS, (width, height))
-
-                if grabando:
-                    if out is not None:
-                        out.write(frame)
-                    
-                    # Detección inteligente para decidir si seguir grabando
-                    persona_presente = movimiento_actual 
-                    if self.detector:
-                        # Comprobar cada 1 segundo
-                        if ahora - ultima_revision_ia >= 1.0:
-                            persona_presente, _ = self.detector.detect_person(frame)
-                            ultima_revision_ia = ahora
-                            
-                            if persona_presente:
-                                fallos_ia_consecutivos = 0
-                                ultimo_movimiento_time = ahora
-                            else:
-                                fallos_ia_consecutivos += 1
-                                logger.info(f"IA: Persona no detectada ({fallos_ia_consecutivos}/2 consecutivos)")
-                        else:
-                            # Entre revisiones de 1s, asumimos que sigue igual o nos basamos en movimiento
-                            persona_presente = True if fallos_ia_consecutivos == 0 else False
-                    
-                    duracion_actual = ahora - self.recording_start_time
-                    tiempo_quieto = ahora - ultimo_movimiento_time
-                    
-                    razon_parada = ""
-                    if self.stop_recording_flag:
-                        razon_parada = "Cambio de modo solicitado"
-                        self.stop_recording_flag = False
-                    elif duracion_actual > config.MAX_DURACION:
-                        razon_parada = "Duración máxima alcanzada"
-                    elif self.detector and fallos_ia_consecutivos >= 2:
-                        razon_parada = "Persona no detectada (2s consecutivos)"
-                    elif not persona_presente and tiempo_quieto > config.TIEMPO_SIN_MOVIMIENTO:
-                        razon_parada = "Persona ausente (timeout)" if self.detector else "Sin movimiento detectado"
-                    
-                    if razon_parada:
-                        grabando = False
-                        if out is not None:
-                            out.release()
-                            out = None
-                            # Optimización para web con FFmpeg
-                            threading.Thread(target=self._optimize_video_for_web, args=(filename,), daemon=True).start()
-                            
-                        logger.info(f"[STOP] {razon_parada}. Post-processing started for {filename}")
-                        fondo = gris
-
-                # Actualizar estado
-                if grabando:
-                    self.status = "GRABANDO"
+                        self.fallos_ia_consecutivos += 1
+                        logger.info(f"IA: Persona no detectada ({self.fallos_ia_consecutivos}/2 consecutivos)")
+                
+                # Entre revisiones, asumimos que sigue igual
+                persona_presente = self.fallos_ia_consecutivos == 0
+            
+            duracion_actual = ahora - self.recording_start_time
+            tiempo_quieto = ahora - self.ultimo_movimiento_time
+            
+            razon_parada = ""
+            if self.stop_recording_flag:
+                razon_parada = "Cambio de modo solicitado"
+                self.stop_recording_flag = False
+            elif self.inference and self.fallos_ia_consecutivos >= 2:
+                razon_parada = "Persona no detectada (2s consecutivos)"
+            elif not persona_presente and tiempo_quieto > config.TIEMPO_SIN_MOVIMIENTO:
+                razon_parada = "Persona ausente (timeout)" if self.inference else "Sin movimiento detectado"
+            elif duracion_actual > config.MAX_DURACION:
+                if config.RECORDER_ROLLING and self.segment < config.RECORDER_MAX_SEGMENTS:
+                    # El evento sigue: segmento nuevo desde este mismo frame, sin nuevo disparo
+                    self._rotate_recording(ahora)
                 else:
-                    self.status = "VIGILANDO"
+                    razon_parada = "Duración máxima alcanzada"
+            
+            if razon_parada:
+                self._finish_recording(razon_parada, ahora)
+                self.motion.reset_background(gris)
 
-                # Rectángulos si hay movimiento
-                if movimiento_actual:
-                    for c in contornos:
-                        if cv2.contourArea(c) >= config.MIN_AREA:
-                            (x, y, wa, ha) = cv2.boundingRect(c)
-                            cv2.rectangle(frame, (x, y), (x + wa, y + ha), (0, 255, 0), 2)
+        # Actualizar estado
+        if self.grabando:
+            self.status = "GRABANDO"
+        else:
+            self.status = "VIGILANDO"
 
-            except Exception as e:
-                logger.error(f"Error en el bucle de video: {e}")
-                time.sleep(0.1)
+    def _note_motion(self, seq, frame, boxes):
+        """Guarda el resumen de movimiento del frame 'seq' para el sidecar del clip."""
+        height, width = frame.shape[:2]
+        with self.sidecar_lock:
+            self.frame_notes[seq] = motion_summary(boxes, (width, height))
+            # Frames que nunca se grabaron (fuera de clip): se descartan los más antiguos
+            while len(self.frame_notes) > 512:
+                del self.frame_notes[next(iter(self.frame_notes))]
 
-    def _optimize_video_for_web(self, raw_path):
-        """
-        Usa FFmpeg para convertir el vídeo a H.264 optimizado para web (faststart).
-        Esto permite que el vídeo se reproduzca en streaming sin esperar a descargarse entero.
-        """
-        if not os.path.exists(raw_path):
+    def _on_detection(self, result):
+        """Resultado de la IA: confianza de persona para los sidecars abiertos."""
+        with self.sidecar_lock:
+            sidecars = list(self.open_sidecars)
+        for sidecar in sidecars:
+            sidecar.set_person(result.timestamp, result.score)
+
+    def _open_sidecar(self, frame, since):
+        if not config.SIDECAR_ENABLED:
+            return None
+        height, width = frame.shape[:2]
+        sidecar = SidecarRecorder((width, height), config.FPS)
+        # Resultados que llegaron antes de abrir el clip (el disparo y la pre-grabación)
+        for result in self.detections.since(since):
+            sidecar.set_person(result.timestamp, result.score)
+        with self.sidecar_lock:
+            self.open_sidecars.append(sidecar)
+        return sidecar
+
+    def _add_sidecar_row(self, sidecar, seq, timestamp):
+        if sidecar is None:
             return
+        with self.sidecar_lock:
+            note = self.frame_notes.pop(seq, None)
+        if note is None:
+            sidecar.add(timestamp)  # Frame no analizado
+        else:
+            sidecar.add(timestamp, *note)
 
-        final_path = raw_path # El nombre ya termina en .mp4
-        temp_path = raw_path + ".temp.mp4"
-        
+    def _save_sidecar(self, sidecar, filename):
+        """Escribe el sidecar junto al clip (antes de que la cola local lo mueva) y lo registra."""
+        with self.sidecar_lock:
+            if sidecar in self.open_sidecars:
+                self.open_sidecars.remove(sidecar)
+        if not sidecar.count:
+            return
+        path = os.path.join(os.path.dirname(filename), sidecar_for(os.path.basename(filename)))
         try:
-            # Renombramos el original a temp
-            os.rename(raw_path, temp_path)
-            
-            logger.info(f"FFmpeg: Optimizando {final_path}...")
-            
-            # Comando FFmpeg para optimizar el video
-           
-            cmd = [
-                'ffmpeg', '-y', '-i', temp_path,
-                '-c:v', 'libx264', '-preset', 'ultrafast',
-                '-crf', '28', 
-                '-movflags', '+faststart',
-                final_path
-            ]
+            sidecar.save(path)
+        except OSError as e:
+            logger.error(f"No se pudo guardar el sidecar de {filename}: {e}")
+            return
+        if self.catalog:
+            self.catalog.set_sidecar(filename, sidecar.max_person())
+        if self.storage:
+            self.storage.registrar_archivo(path)
+
+    def _request_inference(self, frame, seq, ahora, boxes=None):
+        self.inference.submit(frame, seq, ahora, boxes)
+        self.ultima_muestra_ia = ahora
+        self.stats["ai_calls"] += 1
+
+    def _sample_on_demand(self, packet):
+        """Mientras una alerta pide resultados, analiza un frame completo cada AI_SAMPLE_INTERVAL."""
+        if (self.inference and self.detections.demand_active()
+                and packet.timestamp - self.ultima_muestra_ia >= config.AI_SAMPLE_INTERVAL):
+            self._request_inference(packet.frame, packet.seq, packet.timestamp)
+
+    def _rotate_recording(self, ahora):
+        """Pasa el evento en curso a su siguiente segmento a partir del frame 'ahora'."""
+        self.segment += 1
+        self.recording_start_time = ahora
+        directorio = self.spool.record_dir() if self.spool else config.PATH_NAS
+        self.filename = os.path.join(directorio, nombre_segmento(self.event_filename, self.segment))
+        self.recorder_commands.put(("rotate", ahora, self.filename))
+        logger.info(f"[REC] Segmento {self.segment} del evento: {self.filename}")
+
+    def _finish_recording(self, razon_parada, ahora):
+        """Marca el fin del clip en curso; el grabador lo cierra tras escribir el frame 'ahora'."""
+        if not self.grabando:
+            return
+        self.grabando = False
+        self.recorder_commands.put(("stop", ahora, self.filename))
+        logger.info(f"[STOP] {razon_parada}. Cerrando {self.filename}")
+
+    def _recorder_loop(self):
+        """
+        Etapa de grabación. Los frames llegan antes de que el análisis decida sobre ellos,
+        así que se retienen hasta que el análisis los ha superado (analysis_watermark) y
+        entonces se aplican las órdenes de inicio/parada por marca de tiempo. Si el análisis
+        se retrasa más de RECORDER_MAX_PENDING frames, se escriben según el último estado conocido.
+        Los frames descartados fuera de grabación se copian al buffer de pre-grabación, que
+        se vuelca al principio de cada clip nuevo.
+        Al pasar de segmento ("rotate") el frame de la orden ya va al segmento nuevo y el
+        anterior se cierra en otro hilo: la escritura no se detiene ni se pierde ningún frame.
+        """
+        pending = deque()
+        commands = deque()
+        out = None
+        filename = None
+        resampler = None
+        gate = None
+        sidecar = None
+        closing = []  # Hilos cerrando segmentos anteriores
+        self.preroll.clear()
+
+        while True:
+            packet = self.recorder_queue.get(timeout=0.5)
+            if packet is not None:
+                pending.append(packet)
+            elif self.recorder_queue.closed:
+                # Fin: el análisis ya terminó, todo lo pendiente está decidido
+                self.analysis_watermark = float("inf")
             
-            # Ejecutar conversión
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            while True:
+                try:
+                    commands.append(self.recorder_commands.get_nowait())
+                except queue.Empty:
+                    break
+
+            watermark = self.analysis_watermark
+            while pending and (pending[0].timestamp <= watermark or len(pending) > config.RECORDER_MAX_PENDING):
+                item = pending.popleft()
+                
+                # Órdenes anteriores a este frame (la parada se aplica después de escribir su frame)
+                while commands and (commands[0][1] < item.timestamp or
+                                    (commands[0][0] != "stop" and commands[0][1] == item.timestamp)):
+                    action, _, path = commands.popleft()
+                    if action == "rotate" and out is not None:
+                        closing = [t for t in closing if t.is_alive()]
+                        t = threading.Thread(target=self._close_writer, args=(out, filename, sidecar),
+                                             name="camera-close", daemon=True)
+                        t.start()
+                        closing.append(t)
+                        out, filename = self._open_writer(path, item.frame), path
+                        resampler = CfrResampler(config.FPS)
+                        gate = StaticFrameGate() if out.variable_rate else None
+                        sidecar = self._open_sidecar(item.frame, item.timestamp)
+                    elif action in ("start", "rotate"):
+                        out, filename = self._open_writer(path, item.frame), path
+                        # Ritmo constante: los frames se colocan según su marca de tiempo.
+                        # Ritmo variable: se escriben con su marca y se saltan los estáticos
+                        resampler = CfrResampler(config.FPS)
+                        gate = StaticFrameGate() if out.variable_rate else None
+                        sidecar = self._open_sidecar(item.frame, item.timestamp - config.PREROLL_SECONDS)
+                        self._flush_preroll(out, item.timestamp, resampler, gate, sidecar)
+                    else:
+                        self._close_writer(out, filename, sidecar)
+                        out = sidecar = None
+                
+                if out is not None:
+                    t0 = time.perf_counter()
+                    self._write_frame(out, resampler, gate, item.frame, item.timestamp, item.lores)
+                    self._add_sidecar_row(sidecar, item.seq, item.timestamp)
+                    self._observe("record", t0)
+                elif self.preroll_enabled:
+                    self.preroll.push(item.frame, item.timestamp)
             
-            if result.returncode == 0:
-                logger.info(f"FFmpeg: Conversión exitosa. Archivo listo para streaming: {final_path}")
-                # Borramos el temporal si todo fue bien
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
+            if packet is None and self.recorder_queue.closed and not pending:
+                break
+
+        # Órdenes restantes (p. ej. parada final)
+        while commands:
+            action, _, path = commands.popleft()
+            if action == "stop":
+                self._close_writer(out, filename, sidecar)
+                out = sidecar = None
+        if out is not None:
+            self._close_writer(out, filename, sidecar)
+        for t in closing:
+            t.join()
+
+    def _write_frame(self, out, resampler, gate, frame, timestamp, lores=None):
+        """Escribe un frame en el clip en curso (repetido, saltado o con su marca de tiempo)."""
+        if gate is None:
+            copies = resampler.frames_for(timestamp)
+            for _ in range(copies):
+                out.write(frame)
+            self.recorded_counter.inc(copies)
+            return
+        write, keyframe = gate.decide(timestamp, frame, lores)
+        if write:
+            out.write_at(frame, timestamp, keyframe)
+            self.recorded_counter.inc()
+        else:
+            self.skipped_counter.inc()
+
+    def _flush_preroll(self, out, start_ts, resampler, gate=None, sidecar=None):
+        """Escribe en el clip recién abierto los segundos previos al disparo."""
+        since = start_ts - config.PREROLL_SECONDS
+        written = 0
+        for ts, frame in self.preroll.frames_since(since):
+            self._write_frame(out, resampler, gate, frame, ts)
+            if sidecar is not None:
+                sidecar.add(ts)
+            written += 1
+        self.preroll.clear()
+        if written:
+            logger.info(f"[REC] Pre-grabación: {written} frames anteriores al disparo")
+
+    def _open_writer(self, filename, frame):
+        height, width, _ = frame.shape
+        return create_clip_writer(filename, (width, height), config.FPS, variable_rate=config.RECORDER_VFR)
+
+    def _close_writer(self, out, filename, sidecar=None):
+        if out is None:
+            return
+        t0 = time.perf_counter()
+        ok = out.close()
+        self._observe("close", t0)
+        if sidecar is not None:
+            # Tras cerrar el clip: han llegado los resultados de IA de sus últimos frames
+            self._save_sidecar(sidecar, filename)
+        if self.catalog:
+            self.catalog.add(filename)
+        if self.storage:
+            self.storage.registrar_archivo(filename)
+        if ok and out.needs_postprocess and self.optimize_recordings:
+            # Optimización para web con FFmpeg (cola acotada si está disponible)
+            if self.postprocess_queue:
+                self.postprocess_queue.submit(filename)
             else:
-                logger.error(f"FFmpeg falló: {result.stderr}")
-                # Si falla, intentamos dejar el original como estaba para que al menos se pueda descargar
-                if os.path.exists(temp_path) and not os.path.exists(final_path):
-                    os.rename(temp_path, final_path)
-                    
-        except Exception as e:
-            logger.error(f"Error durante el post-procesado de vídeo: {e}")
-            if os.path.exists(temp_path) and not os.path.exists(final_path):
-                os.rename(temp_path, final_path)
+                threading.Thread(target=self._optimize_and_index, args=(filename,), daemon=True).start()
+        elif self.spool:
+            self.spool.submit(filename)
+
+    def _optimize_and_index(self, filename):
+        if optimize_for_web(filename) and self.catalog:
+            self.catalog.add(filename)
+        if self.spool:
+            self.spool.submit(filename)
 
     def set_telegram_service(self, service):
         self.telegram_service = service
+
+    def set_postprocess_queue(self, postprocess_queue):
+        self.postprocess_queue = postprocess_queue
+
+    def set_catalog(self, catalog):
+        self.catalog = catalog
+
+    def set_storage_manager(self, storage):
+        self.storage = storage
+
+    def set_spool(self, spool):
+        self.spool = spool
     
     def _on_mode_change(self, old_mode, new_mode):
         """Callback when mode changes. Stop recording if switching from Mode 2."""
@@ -300,17 +734,19 @@ class VideoCamera:
         """Dispara el proceso de captura inteligente para el timbre."""
         threading.Thread(target=self._capture_and_send_smart_alert, args=("Timbre - Alguien en la puerta",), daemon=True).start()
 
-    def _trigger_telegram_alert(self, initial_frame, video_path=None):
+    def _trigger_telegram_alert(self, initial_frame, video_path=None, initial_seq=None):
         """Dispara el proceso de captura inteligente para vigilancia."""
         # Se lanza en un hilo para no bloquear el bucle de video
-        threading.Thread(target=self._capture_and_send_smart_alert, args=("Alerta de Movimiento", initial_frame, video_path), daemon=True).start()
+        threading.Thread(target=self._capture_and_send_smart_alert, args=("Alerta de Movimiento", initial_frame, video_path, initial_seq), daemon=True).start()
 
-    def _capture_and_send_smart_alert(self, caption="Alerta", fallback_frame=None, video_path=None):
+    def _capture_and_send_smart_alert(self, caption="Alerta", fallback_frame=None, video_path=None, initial_seq=None):
         """
         Lógica unificada para capturar la mejor foto posible usando IA:
         - Espera el delay configurado en config.TELEGRAM_ALERT_DELAY.
         - Muestrea frames durante 2 segundos adicionales.
         - Se queda con el que tenga mayor confianza de 'persona'.
+          No lanza inferencias: elige entre los resultados que el pipeline publica en el bus
+          (initial_seq es el frame del disparo, ya analizado).
         - Envía a Telegram.
         - Si hay video_path, guarda la imagen como miniatura (.jpg).
         """
@@ -318,41 +754,30 @@ class VideoCamera:
         
         logger.info(f"[SMART-ALERT] Iniciando captura inteligente: {caption}")
         
-        # 1. Análisis del frame inicial (fallback) para asegurar que no haya 0.00
-        best_frame = fallback_frame if fallback_frame is not None else (self.output_frame.copy() if self.output_frame is not None else None)
+        # 1. Frame inicial (fallback) para asegurar que no haya 0.00
+        # Los frames de captura no se modifican después de publicarse: no hace falta copiarlos
+        with self.lock:
+            current_frame, current_seq = self.output_frame, self.output_seq
+        best_frame = fallback_frame if fallback_frame is not None else current_frame
         best_score = 0
+        since_seq = initial_seq if initial_seq is not None else current_seq
         
-        if self.detector and best_frame is not None:
-            has_person, detections = self.detector.detect_person(best_frame)
-            if has_person:
-                best_score = detections[0].categories[0].score
-                logger.info(f"[SMART-ALERT] Score inicial detectado: {best_score:.2f}")
+        if self.inference and initial_seq is None:
+            # Sin disparo previo (timbre): que el pipeline analice el frame actual
+            self.detections.request(config.AI_SAMPLE_INTERVAL)
 
         # 2. Espera inicial (delay configurable)
         time.sleep(config.TELEGRAM_ALERT_DELAY)
         
         # 3. Ventana de muestreo (2 segundos buscando a la persona)
-        window_end = time.time() + 2.0
-        
-        if self.detector:
+        if self.inference:
             logger.info("[SMART-ALERT] Analizando frames para encontrar la mejor captura...")
-            while time.time() < window_end:
-                current_frame = None
-                with self.lock:
-                    if self.output_frame is not None:
-                        current_frame = self.output_frame.copy()
-                
-                if current_frame is not None:
-                    has_person, detections = self.detector.detect_person(current_frame)
-                    if has_person:
-                        # Extraemos el score de la categoría 'person'
-                        score = detections[0].categories[0].score
-                        if score > best_score:
-                            best_score = score
-                            best_frame = current_frame
-                            logger.info(f"[SMART-ALERT] Frame mejorado encontrado (Confianza: {score:.2f})")
-                
-                time.sleep(0.3) # Muestrear cada 300ms para no saturar la CPU
+            self.detections.request(2.0)
+            time.sleep(2.0)
+            best = self.detections.best(since_seq)
+            if best is not None:
+                best_frame, best_score = best.frame, best.score
+                logger.info(f"[SMART-ALERT] Mejor frame: {best.seq} (Confianza: {best_score:.2f})")
         
         if best_frame is None:
             logger.error("[SMART-ALERT] No se pudo obtener ningún frame válido")
@@ -372,6 +797,10 @@ class VideoCamera:
                 thumb_path = video_path.rsplit('.', 1)[0] + ".jpg"
                 cv2.imwrite(thumb_path, best_frame)
                 logger.info(f"[SMART-ALERT] Miniatura guardada en NAS: {thumb_path}")
+                if self.catalog:
+                    self.catalog.set_thumbnail(video_path, thumb_path, best_score if self.inference else None)
+                if self.storage:
+                    self.storage.registrar_archivo(thumb_path, best_score if self.inference else None)
 
             if self.telegram_service:
                 self.telegram_service.send_alert(temp_path, caption=f"{caption} (Confianza IA: {best_score:.2f})")
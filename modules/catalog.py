@@ -0,0 +1,366 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+import config
+from modules.retention import SEGMENT_MARK, evento_y_segmento
+
+# Configuración de logs
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("Catalogo")
+
+CLIP_EXTENSION = ".mp4"
+THUMB_EXTENSION = ".jpg"
+TEMP_SUFFIX = ".temp.mp4"  # Original de un post-procesado en curso (no es una grabación)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    filename  TEXT PRIMARY KEY,
+    created   REAL NOT NULL,          -- mtime del clip la primera vez que se vio cerrado (orden de la galería)
+    mtime     REAL NOT NULL,
+    size      INTEGER NOT NULL,
+    thumbnail TEXT,                   -- Nombre de la miniatura .jpg, si existe
+    score     REAL,                   -- Confianza de la IA de la alerta, si la hubo
+    pinned    INTEGER NOT NULL DEFAULT 0, -- Fijado a mano: la limpieza no lo borra
+    deleted   INTEGER NOT NULL DEFAULT 0, -- 0, o fecha (epoch) en que se borró
+    original_size INTEGER,            -- Tamaño antes de pasar al archivo (NULL si no se ha archivado)
+    sidecar   INTEGER NOT NULL DEFAULT 0, -- Tiene índice por frame (.vsc, ver modules/sidecar.py)
+    max_person REAL,                  -- Mayor confianza de persona del sidecar (NULL: la IA no analizó el clip)
+    version   INTEGER NOT NULL        -- Versión del catálogo en el último cambio de la fila
+);
+CREATE INDEX IF NOT EXISTS recordings_listing ON recordings (deleted, created DESC, filename DESC);
+CREATE INDEX IF NOT EXISTS recordings_version ON recordings (version);
+CREATE INDEX IF NOT EXISTS recordings_size ON recordings (deleted, size);
+"""
+
+COLUMNS = "filename, created, mtime, size, thumbnail, score, pinned, deleted, version"
+
+# Alta o actualización de un clip. 'created' solo cambia si el clip reaparece tras borrarse o
+# si la fila era provisional (size 0: creada por la alerta o el sidecar antes del cierre), así
+# siempre es el mtime del clip cerrado. Una miniatura NULL no borra la que ya hubiera.
+UPSERT = (
+    "INSERT INTO recordings (filename, created, mtime, size, thumbnail, deleted, version) "
+    "VALUES (?, ?, ?, ?, ?, 0, ?) "
+    "ON CONFLICT(filename) DO UPDATE SET mtime=excluded.mtime, size=excluded.size, "
+    "thumbnail=COALESCE(excluded.thumbnail, thumbnail), deleted=0, version=excluded.version, "
+    "created=CASE WHEN deleted OR size=0 THEN excluded.created ELSE created END"
+)
+
+
+def thumbnail_for(clip_name):
+    return clip_name.rsplit(".", 1)[0] + THUMB_EXTENSION
+
+
+def is_clip(name):
+    return name.endswith(CLIP_EXTENSION) and not name.endswith(TEMP_SUFFIX)
+
+
+class RecordingCatalog:
+    """
+    Índice de las grabaciones del NAS (y de la cola local) en SQLite, guardado en la tarjeta
+    local: SQLite y CIFS no se llevan bien.
+    - Se actualiza con los eventos del sistema: cierre de un clip, fin del post-procesado,
+      miniatura de la alerta y borrados de la limpieza. La galería no toca el NAS.
+    - reconcile() recorre el directorio una vez y corrige las diferencias (al arrancar y tras
+      cada limpieza, por si se borró o copió algo desde Samba).
+    - Cada cambio incrementa la versión del catálogo: sirve de ETag y para pedir solo los
+      cambios desde una versión (los borrados se guardan como marcas 'deleted').
+    """
+    def __init__(self, path_videos, db_path=None, extra_paths=()):
+        self.path = path_videos
+        # Otros directorios con grabaciones (la cola local antes de moverlas al NAS)
+        self.paths = [path_videos] + [p for p in extra_paths if p]
+        self.db_path = db_path or config.CATALOG_DB_PATH
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+            # Catálogos creados antes de poder fijar grabaciones
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(recordings)")}
+            if "pinned" not in columns:
+                self.conn.execute("ALTER TABLE recordings ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+            if "original_size" not in columns:
+                self.conn.execute("ALTER TABLE recordings ADD COLUMN original_size INTEGER")
+            if "sidecar" not in columns:
+                self.conn.execute("ALTER TABLE recordings ADD COLUMN sidecar INTEGER NOT NULL DEFAULT 0")
+                self.conn.execute("ALTER TABLE recordings ADD COLUMN max_person REAL")
+        self.version = self.conn.execute("SELECT COALESCE(MAX(version), 0) FROM recordings").fetchone()[0]
+        self.last_reconcile = None
+        # Versión de la última marca de borrado purgada (más atrás ?since= no es fiable); se guarda en user_version
+        self.horizon = self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def start(self):
+        """Reconciliación inicial en segundo plano (en un NAS lento puede tardar)."""
+        threading.Thread(target=self.reconcile, name="catalog-reconcile", daemon=True).start()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _bump(self):
+        """Nueva versión del catálogo (llamar con self.lock)."""
+        self.version += 1
+        return self.version
+
+    def _stat(self, name):
+        for path in self.paths:
+            try:
+                return os.stat(os.path.join(path, name))
+            except OSError:
+                continue
+        return None
+
+    def locate(self, name):
+        """Ruta del fichero en el NAS o en la cola local (None si no está)."""
+        for path in self.paths:
+            full = os.path.join(path, name)
+            if os.path.isfile(full):
+                return full
+        return None
+
+    # --- Eventos del sistema ---
+
+    def add(self, path):
+        """Clip nuevo o modificado (cierre de la grabación, fin del post-procesado)."""
+        name = os.path.basename(path)
+        st = self._stat(name)
+        if st is None:
+            return self.remove(path)
+        has_thumb = self._stat(thumbnail_for(name)) is not None
+        with self.lock, self.conn:
+            self.conn.execute(UPSERT, (name, st.st_mtime, st.st_mtime, st.st_size,
+                                       thumbnail_for(name) if has_thumb else None, self._bump()))
+
+    def set_thumbnail(self, clip_path, thumb_path, score=None):
+        """Miniatura (y confianza de la IA) guardada por la alerta de un clip."""
+        name = os.path.basename(clip_path)
+        now = time.time()
+        with self.lock, self.conn:
+            # La alerta suele llegar con el clip aún grabándose: la fila se crea ya y add() la completa al cerrar
+            version = self._bump()
+            self.conn.execute("INSERT OR IGNORE INTO recordings (filename, created, mtime, size, version) "
+                              "VALUES (?, ?, ?, 0, ?)", (name, now, now, version))
+            self.conn.execute("UPDATE recordings SET thumbnail=?, score=COALESCE(?, score), version=? "
+                              "WHERE filename=?", (os.path.basename(thumb_path), score, version, name))
+
+    def set_sidecar(self, clip_path, max_person):
+        """El clip tiene índice por frame; max_person es su mayor confianza de persona (o None)."""
+        name = os.path.basename(clip_path)
+        now = time.time()
+        with self.lock, self.conn:
+            version = self._bump()
+            self.conn.execute("INSERT OR IGNORE INTO recordings (filename, created, mtime, size, version) "
+                              "VALUES (?, ?, ?, 0, ?)", (name, now, now, version))
+            self.conn.execute("UPDATE recordings SET sidecar=1, max_person=?, version=? WHERE filename=?",
+                              (max_person, version, name))
+
+    def set_pinned(self, path, pinned):
+        """Fija (o libera) una grabación. False si no está en el catálogo."""
+        with self.lock, self.conn:
+            cursor = self.conn.execute("UPDATE recordings SET pinned=?, version=? WHERE filename=? AND deleted=0",
+                                       (int(bool(pinned)), self.version + 1, os.path.basename(path)))
+            if cursor.rowcount:
+                self._bump()
+            return cursor.rowcount > 0
+
+    def set_archived(self, path, original_size):
+        """El clip se recomprimió para el archivo (o se descartó hacerlo): tamaño nuevo y original."""
+        name = os.path.basename(path)
+        st = self._stat(name)
+        if st is None:
+            return self.remove(path)
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE recordings SET mtime=?, size=?, original_size=?, version=? WHERE filename=?",
+                              (st.st_mtime, st.st_size, original_size, self._bump(), name))
+
+    def remove(self, path):
+        """Un fichero del NAS se ha borrado: clip (marca de borrado) o miniatura."""
+        name = os.path.basename(path)
+        with self.lock, self.conn:
+            # La versión solo avanza si algo cambió (el mismo borrado puede llegar por varias vías)
+            if is_clip(name):
+                cursor = self.conn.execute("UPDATE recordings SET deleted=?, version=? WHERE filename=? AND deleted=0",
+                                           (int(time.time()), self.version + 1, name))
+            elif name.endswith(THUMB_EXTENSION):
+                cursor = self.conn.execute("UPDATE recordings SET thumbnail=NULL, version=? WHERE thumbnail=?",
+                                           (self.version + 1, name))
+            else:
+                return
+            if cursor.rowcount:
+                self._bump()
+
+    # --- Reconciliación ---
+
+    def reconcile(self):
+        """Compara el catálogo con el directorio (un listado y un stat por clip) y aplica las diferencias."""
+        start = time.perf_counter()
+        # Las filas que cambien durante el recorrido ya están al día (eventos más recientes que el listado)
+        scan_version = self.version
+        names = set()
+        for path in self.paths:
+            try:
+                names.update(os.listdir(path))
+            except OSError as e:
+                # Sin el listado completo se darían por borradas grabaciones que existen
+                logger.error(f"No se pudo reconciliar el catálogo con {path}: {e}")
+                return None
+        on_disk = {}
+        for name in names:
+            if is_clip(name):
+                st = self._stat(name)
+                if st is not None:
+                    on_disk[name] = (st.st_mtime, st.st_size, thumbnail_for(name) if thumbnail_for(name) in names else None)
+
+        with self.lock:
+            known = {row["filename"]: row for row in
+                     self.conn.execute("SELECT filename, mtime, size, thumbnail FROM recordings "
+                                       "WHERE deleted=0 AND version <= ?", (scan_version,))}
+            recent = {row[0] for row in
+                      self.conn.execute("SELECT filename FROM recordings WHERE version > ?", (scan_version,))}
+            added = changed = removed = 0
+            with self.conn:
+                for name, (mtime, size, thumb) in on_disk.items():
+                    row = known.get(name)
+                    if name in recent:
+                        continue
+                    if row is None:
+                        added += 1
+                    elif (row["mtime"], row["size"], row["thumbnail"]) != (mtime, size, thumb):
+                        changed += 1
+                    else:
+                        continue
+                    if row is not None and thumb is None:
+                        # La miniatura desapareció del disco (el UPSERT conserva la anterior si llega NULL)
+                        self.conn.execute("UPDATE recordings SET thumbnail=NULL WHERE filename=?", (name,))
+                    self.conn.execute(UPSERT, (name, mtime, mtime, size, thumb, self._bump()))
+                for name in known.keys() - on_disk.keys():
+                    self.conn.execute("UPDATE recordings SET deleted=?, version=? WHERE filename=?",
+                                      (int(time.time()), self._bump(), name))
+                    removed += 1
+                # Las marcas de borrado solo interesan a clientes recientes
+                limit = int(time.time() - config.CATALOG_TOMBSTONE_DAYS * 86400)
+                purged = self.conn.execute("SELECT MAX(version) FROM recordings WHERE deleted > 0 AND deleted < ?",
+                                           (limit,)).fetchone()[0]
+                if purged:
+                    self.conn.execute("DELETE FROM recordings WHERE deleted > 0 AND deleted < ?", (limit,))
+                    self.horizon = max(self.horizon, purged)
+                    self.conn.execute(f"PRAGMA user_version = {int(self.horizon)}")
+        self.last_reconcile = time.time()
+        result = {"clips": len(on_disk), "added": added, "changed": changed, "removed": removed,
+                  "seconds": round(time.perf_counter() - start, 3)}
+        if added or changed or removed:
+            logger.info(f"Catálogo reconciliado: {result}")
+        return result
+
+    # --- Consultas ---
+
+    def list(self, limit=None, cursor=None, start=None, end=None):
+        """
+        Página de grabaciones, más recientes primero. 'cursor' es el 'next' de la página anterior;
+        start/end filtran por fecha de creación (epoch). Retorna (filas, cursor siguiente o None).
+        """
+        limit = max(1, min(int(limit or config.CATALOG_PAGE_SIZE), config.CATALOG_MAX_PAGE_SIZE))
+        where, params = ["deleted=0"], []
+        if start is not None:
+            where.append("created >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("created < ?")
+            params.append(end)
+        if cursor:
+            created, _, name = cursor.partition(",")
+            # Paginación por clave (created, filename): coste constante en cualquier página
+            where.append("(created, filename) < (?, ?)")
+            params += [float(created), name]
+        query = (f"SELECT {COLUMNS} FROM recordings WHERE {' AND '.join(where)} "
+                 f"ORDER BY created DESC, filename DESC LIMIT ?")
+        with self.lock:
+            rows = [dict(row) for row in self.conn.execute(query, params + [limit + 1])]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1]['created']!r},{rows[-1]['filename']}"
+        return rows, next_cursor
+
+    def changes(self, since, limit=None):
+        """Filas modificadas (o borradas) después de la versión 'since', en orden de versión."""
+        limit = max(1, min(int(limit or config.CATALOG_MAX_PAGE_SIZE), config.CATALOG_MAX_PAGE_SIZE))
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(
+                f"SELECT {COLUMNS} FROM recordings WHERE version > ? ORDER BY version LIMIT ?", (since, limit))]
+
+    def retention_metadata(self):
+        """Confianza de la IA y fijado de las grabaciones que tienen alguno: {nombre: (score, pinned)}."""
+        with self.lock:
+            return {row[0]: (row[1], bool(row[2])) for row in self.conn.execute(
+                "SELECT filename, score, pinned FROM recordings WHERE deleted=0 AND (score IS NOT NULL OR pinned)")}
+
+    def segments(self, event_id):
+        """Segmentos del evento en orden de reproducción (alerta_X.mp4, alerta_X_parte2.mp4, ...)."""
+        prefix = event_id + SEGMENT_MARK
+        with self.lock:
+            # Rango sobre la clave primaria: alerta_X.mp4 y todos los alerta_X_parteN.mp4
+            rows = [dict(row) for row in self.conn.execute(
+                f"SELECT {COLUMNS} FROM recordings WHERE deleted=0 AND "
+                f"(filename = ? OR (filename >= ? AND filename < ?))",
+                (event_id + CLIP_EXTENSION, prefix, prefix + "\U0010ffff"))]
+        rows = [row for row in rows if evento_y_segmento(row["filename"])[0] == event_id]
+        return sorted(rows, key=lambda row: evento_y_segmento(row["filename"])[1])
+
+    def sidecar_candidates(self, min_person=None, start=None, end=None, hours=None, window=0, limit=None):
+        """
+        Clips con sidecar que pueden cumplir una búsqueda, más recientes primero: confianza máxima
+        >= min_person y cerrados entre start y end, o dentro de la franja horaria 'hours' (segundos
+        del día, hora local). 'created' es el cierre del clip, así que ambos límites finales se
+        amplían 'window' segundos (la duración máxima) para incluir clips que empezaron dentro.
+        """
+        where, params = ["deleted=0", "sidecar=1"], []
+        if min_person is not None:
+            where.append("max_person >= ?")
+            params.append(min_person)
+        if start is not None:
+            where.append("created >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("created < ?")
+            params.append(end + window)
+        if hours is not None:
+            first, last = hours
+            span = last - first if first <= last else last + 86400 - first
+            # Si la franja ampliada cubre el día entero no descarta nada
+            if span + window < 86400:
+                last = (last + window) % 86400
+                day_second = "(CAST(strftime('%s', created, 'unixepoch', 'localtime') AS INTEGER) % 86400)"
+                # Tras ampliarla, la franja cruza la medianoche si el final queda antes del inicio
+                where.append(f"({day_second} >= ? {'AND' if first <= last else 'OR'} {day_second} < ?)")
+                params += [first, last]
+        query = (f"SELECT {COLUMNS}, max_person FROM recordings WHERE {' AND '.join(where)} "
+                 f"ORDER BY created DESC, filename DESC LIMIT ?")
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(query, params + [limit or -1])]
+
+    def archive_candidates(self, before, limit):
+        """Clips creados antes de 'before' (epoch) aún sin archivar, los más antiguos primero. Los fijados no."""
+        with self.lock:
+            return [row[0] for row in self.conn.execute(
+                "SELECT filename FROM recordings WHERE deleted=0 AND created < ? AND original_size IS NULL "
+                "AND NOT pinned ORDER BY created LIMIT ?", (before, limit))]
+
+    def archive_stats(self):
+        """(clips recomprimidos, bytes ahorrados) entre las grabaciones que siguen en el NAS."""
+        with self.lock:
+            count, saved = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(original_size - size), 0) FROM recordings "
+                "WHERE deleted=0 AND original_size > size").fetchone()
+        return count, saved
+
+    def stats(self):
+        with self.lock:
+            count, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM recordings WHERE deleted=0").fetchone()
+        return {"clips": count, "size_mb": round(size / (1024 * 1024), 1), "version": self.version,
+                "last_reconcile": self.last_reconcile}
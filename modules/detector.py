@@ -1,5 +1,6 @@
 import logging
 import os
+import threading
 import cv2
 import numpy as np
 import config
@@ -16,10 +17,18 @@ except ImportError:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("Detector")
 
+# Separación entre piezas del mosaico para que una detección no abarque dos zonas
+MOSAIC_GAP = 16
+
 class PersonDetector:
     """Gestión de detección de personas con MediaPipe."""
+    concurrency = 1  # Inferencias simultáneas que admite (ver DetectorPool)
+
     def __init__(self):
         self.detector = None
+        self._rgb_buffer = None
+        # Protege el modelo en modo IMAGE y el buffer RGB compartido
+        self.lock = threading.Lock()
         if not MEDIAPIPE_AVAILABLE:
             logger.error("Librería MediaPipe no encontrada.")
             return
@@ -37,52 +46,199 @@ class PersonDetector:
                 logger.warning(f"Modelo IA no encontrado en {config.AI_MODEL_PATH}")
                 return
 
-            base_options = python.BaseOptions(model_asset_path=config.AI_MODEL_PATH)
-            options = vision.ObjectDetectorOptions(
-                base_options=base_options,
-                running_mode=vision.RunningMode.IMAGE,
-                max_results=5,
-                score_threshold=config.AI_CONFIDENCE_THRESHOLD,
-                category_allowlist=['person']
-            )
-            self.detector = vision.ObjectDetector.create_from_options(options)
+            self.detector = vision.ObjectDetector.create_from_options(self._options(vision.RunningMode.IMAGE))
             logger.info("Detector de personas (MediaPipe) iniciado.")
         except Exception as e:
             logger.error(f"Error al iniciar MediaPipe: {e}")
             self.detector = None
 
-    def detect_person(self, frame):
+    def _options(self, running_mode, result_callback=None):
+        base_options = python.BaseOptions(model_asset_path=config.AI_MODEL_PATH)
+        return vision.ObjectDetectorOptions(
+            base_options=base_options,
+            running_mode=running_mode,
+            max_results=5,
+            score_threshold=config.AI_CONFIDENCE_THRESHOLD,
+            category_allowlist=['person'],
+            result_callback=result_callback
+        )
+
+    def create_live_stream(self, result_callback):
         """
-        Detecta si hay una persona en el frame.
-        Retorna (bool, detections)
+        Segunda instancia del modelo en modo LIVE_STREAM: detect_async() no bloquea y el
+        resultado llega a result_callback(result, image, timestamp_ms) desde un hilo de MediaPipe.
+        Retorna None si el modelo no está disponible.
         """
+        if not self._ready():
+            return None
+        try:
+            return vision.ObjectDetector.create_from_options(
+                self._options(vision.RunningMode.LIVE_STREAM, result_callback))
+        except Exception as e:
+            logger.error(f"Error al iniciar MediaPipe (LIVE_STREAM): {e}")
+            return None
+
+    def _ready(self):
         if self.detector is None:
             # Re-intentar inicialización si el modelo apareció después
             if os.path.exists(config.AI_MODEL_PATH):
                 self._initialize_detector()
-            
-            if self.detector is None:
-                return False, []
+        return self.detector is not None
+
+    def is_ready(self):
+        """True si el modelo está cargado."""
+        return self._ready()
+
+    def close(self):
+        if self.detector is not None:
+            self.detector.close()
+            self.detector = None
+
+    def to_mp_image(self, image):
+        """
+        Convierte una imagen BGR a mp.Image. La conversión a RGB se hace sobre un buffer
+        reutilizado (mp.Image copia los datos, así que el buffer queda libre al retornar).
+        Llamar con self.lock.
+        """
+        if self._rgb_buffer is None or self._rgb_buffer.shape != image.shape:
+            self._rgb_buffer = np.empty(image.shape, dtype=np.uint8)
+        cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self._rgb_buffer)
+        return mp.Image(image_format=mp.ImageFormat.SRGB, data=self._rgb_buffer)
+
+    def _detect(self, image):
+        """Ejecuta el modelo sobre una imagen BGR y retorna las detecciones."""
+        with self.lock:
+            return self.detector.detect(self.to_mp_image(image)).detections
+
+    def evaluate(self, detections):
+        # Filtrar por confianza mínima (ya lo hace el objeto detector, pero podemos ser extra estrictos aquí si falla)
+        has_person = False
+        for detection in detections:
+            score = detection.categories[0].score
+            if score >= config.AI_CONFIDENCE_THRESHOLD:
+                logger.info(f"IA: Persona detectada con confianza {score:.2f}")
+                has_person = True
+                break
+        return has_person, detections
+
+    def detect_person(self, frame):
+        """
+        Detecta si hay una persona en el frame.
+        Retorna (bool, detections)
+        """
+        if not self._ready():
+            return False, []
 
         try:
-            # Convertir a RGB para MediaPipe.
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
-
-            # Detección
-            detection_result = self.detector.detect(mp_image)
-
-            # Filtrar por confianza mínima (ya lo hace el objeto detector, pero podemos ser extra estrictos aquí si falla)
-            has_person = False
-            for detection in detection_result.detections:
-                score = detection.categories[0].score
-                if score >= config.AI_CONFIDENCE_THRESHOLD:
-                    logger.info(f"IA: Persona detectada con confianza {score:.2f}")
-                    has_person = True
-                    break
-            
-            return has_person, detection_result.detections
+            return self.evaluate(self._detect(frame))
+        except Exception as e:
+            logger.error(f"Error en detección IA: {e}")
+            return False, []
+
+    def detect_person_in_regions(self, frame, boxes):
+        """
+        Igual que detect_person pero analizando solo las zonas con movimiento.
+        Las cajas (x, y, w, h) se amplían y se fusionan; si hay varias se componen en un
+        mosaico para hacer una única inferencia. Las detecciones se devuelven en
+        coordenadas del frame completo y ordenadas por confianza.
+        Sin cajas, o si las zonas cubren casi todo el frame, se analiza el frame completo.
+        """
+        if not self._ready():
+            return False, []
 
+        try:
+            image, tiles = self.prepare_regions(frame, boxes)
+            return self.evaluate(self.map_detections(self._detect(image), tiles))
         except Exception as e:
             logger.error(f"Error en detección IA: {e}")
             return False, []
+
+    def prepare_regions(self, frame, boxes):
+        """
+        Imagen a analizar para las cajas de movimiento: el frame completo, un recorte o un
+        mosaico de recortes. Retorna (imagen, piezas); las piezas (x_mosaico, w, h, x, y)
+        sirven a map_detections() para llevar las detecciones al frame (None = frame completo).
+        """
+        if not config.AI_CROP_INFERENCE or not boxes:
+            return frame, None
+
+        height, width = frame.shape[:2]
+        regions = merge_regions(boxes, (width, height), config.AI_CROP_PADDING, config.AI_CROP_MIN_SIZE)
+        if sum(w * h for _, _, w, h in regions) > config.AI_CROP_MAX_AREA_RATIO * width * height:
+            return frame, None
+
+        if len(regions) == 1:
+            x, y, w, h = regions[0]
+            return frame[y:y + h, x:x + w], [(0, w, h, x, y)]
+        return self._build_mosaic(frame, regions)
+
+    def _build_mosaic(self, frame, regions):
+        """Coloca las zonas una al lado de otra en un lienzo para analizarlas con una sola inferencia."""
+        canvas_h = max(h for _, _, _, h in regions)
+        canvas_w = sum(w for _, _, w, _ in regions) + MOSAIC_GAP * (len(regions) - 1)
+        canvas = np.zeros((canvas_h, canvas_w, 3), dtype=frame.dtype)
+        tiles = []
+        cx = 0
+        for x, y, w, h in regions:
+            canvas[:h, cx:cx + w] = frame[y:y + h, x:x + w]
+            tiles.append((cx, w, h, x, y))
+            cx += w + MOSAIC_GAP
+        return canvas, tiles
+
+    @staticmethod
+    def map_detections(detections, tiles):
+        """Pasa las detecciones a coordenadas del frame completo y las ordena por confianza."""
+        if tiles is not None:
+            mapped = []
+            for detection in detections:
+                box = detection.bounding_box
+                center_x = box.origin_x + box.width / 2
+                center_y = box.origin_y + box.height / 2
+                # Cada detección pertenece a la pieza que contiene su centro
+                for tile_x, w, h, x, y in tiles:
+                    if tile_x <= center_x < tile_x + w and center_y < h:
+                        _offset_box(box, x - tile_x, y)
+                        mapped.append(detection)
+                        break
+            detections = mapped
+        else:
+            detections = list(detections)
+        detections.sort(key=lambda d: d.categories[0].score, reverse=True)
+        return detections
+
+
+def _offset_box(box, dx, dy):
+    box.origin_x = int(box.origin_x + dx)
+    box.origin_y = int(box.origin_y + dy)
+
+
+def merge_regions(boxes, frame_size, padding=0.25, min_size=0):
+    """
+    Amplía cada caja un 'padding' de su tamaño (y como mínimo hasta min_size píxeles),
+    la recorta al frame y fusiona las que se solapan hasta que ninguna se solape.
+    Retorna una lista de (x, y, w, h).
+    """
+    width, height = frame_size
+    rects = []
+    for x, y, w, h in boxes:
+        pad_w = max(w * padding, (min_size - w) / 2, 0)
+        pad_h = max(h * padding, (min_size - h) / 2, 0)
+        rects.append([max(0, int(x - pad_w)), max(0, int(y - pad_h)),
+                      min(width, int(x + w + pad_w)), min(height, int(y + h + pad_h))])
+
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for rect in rects:
+            for other in result:
+                if rect[0] < other[2] and other[0] < rect[2] and rect[1] < other[3] and other[1] < rect[3]:
+                    other[0], other[1] = min(other[0], rect[0]), min(other[1], rect[1])
+                    other[2], other[3] = max(other[2], rect[2]), max(other[3], rect[3])
+                    merged = True
+                    break
+            else:
+                result.append(rect)
+        rects = result
+
+    return [(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1 in rects]
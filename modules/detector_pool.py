@@ -0,0 +1,188 @@
+import time
+import queue
+import signal
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import config
+from modules.detector import PersonDetector
+
+# Configuración de logs
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("DetectorPool")
+
+
+def create_detector():
+    """Detector configurado en config.AI_BACKEND: 'inprocess' (PersonDetector) o 'process' (DetectorPool)."""
+    if config.AI_BACKEND == "process":
+        return DetectorPool(config.AI_WORKERS)
+    return PersonDetector()
+
+
+def _attach(name):
+    """Se adjunta a un segmento de memoria compartida creado por el proceso principal."""
+    try:
+        # Python >= 3.13: el segmento no se registra en este proceso (el dueño es el principal)
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker_main(conn):
+    """
+    Proceso worker: carga su propio PersonDetector y atiende peticiones
+    (id, segmento, forma, dtype, cajas). El frame se lee directamente de la memoria compartida.
+    """
+    # Ctrl+C lo gestiona el proceso principal, que cierra la tubería
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    detector = PersonDetector()
+    conn.send(("ready", detector.is_ready()))
+
+    shm = None
+    try:
+        while True:
+            try:
+                job_id, name, shape, dtype, boxes = conn.recv()
+            except (EOFError, OSError):
+                break
+            if shm is None or shm.name != name:
+                if shm is not None:
+                    shm.close()
+                shm = _attach(name)
+            frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            has_person, detections = detector.detect_person_in_regions(frame, boxes)
+            del frame  # Sin vistas vivas el segmento se puede cerrar
+            conn.send((job_id, has_person, detections))
+    finally:
+        if shm is not None:
+            shm.close()
+        detector.close()
+
+
+class _Worker:
+    """Proceso worker visto desde el proceso principal: tubería + ranura de memoria compartida propia."""
+    def __init__(self, context, index):
+        self.context = context
+        self.index = index
+        self.proc = None
+        self.conn = None
+        self.slot = None
+        self.ready = False
+        self.job_id = 0
+
+    def start(self):
+        parent_conn, child_conn = self.context.Pipe()
+        self.proc = self.context.Process(target=_worker_main, args=(child_conn,),
+                                         name=f"detector-{self.index}", daemon=True)
+        self.proc.start()
+        child_conn.close()
+        self.conn = parent_conn
+        # Espera a que el worker cargue el modelo
+        self.ready = False
+        if self.conn.poll(config.AI_WORKER_START_TIMEOUT):
+            try:
+                _, self.ready = self.conn.recv()
+            except (EOFError, OSError):
+                pass
+        if not self.ready:
+            logger.warning(f"Worker de IA {self.index} sin modelo cargado")
+
+    def stop(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.proc is not None:
+            self.proc.join(timeout=2)
+            if self.proc.is_alive():
+                self.proc.kill()
+                self.proc.join(timeout=2)
+            self.proc = None
+
+    def release_slot(self):
+        if self.slot is not None:
+            self.slot.close()
+            self.slot.unlink()
+            self.slot = None
+
+    def write_frame(self, frame):
+        """Copia el frame en la ranura (se recrea si el frame no cabe)."""
+        if self.slot is None or self.slot.size < frame.nbytes:
+            self.release_slot()
+            self.slot = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.slot.buf)
+        np.copyto(view, frame)
+        del view
+
+    def detect(self, frame, boxes):
+        self.write_frame(frame)
+        self.job_id += 1
+        self.conn.send((self.job_id, self.slot.name, frame.shape, frame.dtype.str, boxes))
+        deadline = time.monotonic() + config.AI_WORKER_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.conn.poll(remaining):
+                raise TimeoutError(f"sin respuesta en {config.AI_WORKER_TIMEOUT} s")
+            message = self.conn.recv()
+            # Se ignoran respuestas atrasadas (y el aviso de arranque si llegó tarde)
+            if message[0] == self.job_id:
+                return message[1], message[2]
+
+
+class DetectorPool:
+    """
+    Detección de personas en procesos aparte (sin GIL compartido con Flask, Telegram o la captura).
+    - Cada worker tiene su propio modelo y una ranura de memoria compartida: el frame se copia
+      una vez a la ranura y por la tubería solo viajan el nombre, la forma y las cajas.
+    - Misma interfaz que PersonDetector para InferenceEngine (detect_person_in_regions), que
+      lanza hasta 'concurrency' inferencias a la vez.
+    - Un worker que muere o deja de responder se reinicia; esa petición retorna sin persona.
+    """
+    def __init__(self, workers=None):
+        self.concurrency = workers or config.AI_WORKERS
+        # 'spawn': un fork de un proceso con hilos (cámara, Flask) podría heredar locks tomados
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = [_Worker(self.context, i) for i in range(self.concurrency)]
+        self.idle = queue.Queue()
+        self.restarts = 0
+        for worker in self.workers:
+            worker.start()
+            self.idle.put(worker)
+        logger.info(f"Pool de detección iniciado ({self.concurrency} procesos)")
+
+    def is_ready(self):
+        return any(worker.ready for worker in self.workers)
+
+    def detect_person(self, frame):
+        return self.detect_person_in_regions(frame, None)
+
+    def detect_person_in_regions(self, frame, boxes):
+        """Como PersonDetector.detect_person_in_regions, en el primer worker libre."""
+        worker = self.idle.get()
+        try:
+            if not worker.proc.is_alive():
+                self._restart(worker, "el proceso terminó")
+            return worker.detect(np.ascontiguousarray(frame), boxes)
+        except (EOFError, OSError, TimeoutError) as e:
+            self._restart(worker, e)
+            return False, []
+        finally:
+            self.idle.put(worker)
+
+    def _restart(self, worker, reason):
+        logger.error(f"Worker de IA {worker.index} caído ({reason}). Reiniciando...")
+        worker.stop()
+        worker.start()
+        self.restarts += 1
+
+    def stats(self):
+        return {
+            "workers": self.concurrency,
+            "alive": sum(1 for w in self.workers if w.proc is not None and w.proc.is_alive()),
+            "restarts": self.restarts,
+        }
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+            worker.release_slot()
@@ -0,0 +1,271 @@
+import os
+import time
+import logging
+import cv2
+import numpy as np
+import config
+
+# Configuración de logs
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("FrameSource")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+class FrameSource:
+    """
+    Interfaz común de las fuentes de vídeo.
+    read() retorna (frame BGR, timestamp, lores) o (None, None, None) cuando la fuente se agota.
+    'lores' es una imagen en grises de baja resolución para el análisis de movimiento
+    (None si la fuente no la ofrece; entonces se reescala el frame).
+    Las fuentes no 'realtime' entregan frames tan rápido como se pidan, con marcas
+    de tiempo sintéticas a config.FPS, lo que permite reproducir grabaciones de forma determinista.
+    """
+    realtime = True
+
+    def start(self):
+        pass
+
+    def read(self):
+        raise NotImplementedError
+
+    def set_frame_rate(self, fps):
+        """Ajusta el ritmo del sensor si la fuente lo permite (el bucle de captura ya marca el ritmo)."""
+        pass
+
+    def stop(self):
+        pass
+
+
+class Picamera2Source(FrameSource):
+    """
+    Cámara de la Raspberry Pi (Picamera2 + libcamera).
+    Si lores_size se indica, se configura también el stream 'lores' (YUV420) y su
+    plano Y se entrega como imagen en grises para el análisis, sin coste de conversión.
+    """
+    def __init__(self, resolution=None, vflip=True, lores_size=None):
+        self.resolution = resolution or config.RESOLUTION
+        self.vflip = vflip
+        self.lores_size = tuple(lores_size) if lores_size else None
+        self.picam2 = None
+
+    def start(self):
+        # Import diferido: solo existe en Raspberry Pi OS
+        import libcamera
+        from picamera2 import Picamera2
+
+        # Configuración de Picamera2. Se usa RGB888 pero se ha observado que capture_array entrega BGR en este sistema.
+        self.picam2 = Picamera2()
+        lores = {"size": self.lores_size, "format": "YUV420"} if self.lores_size else None
+        config_cam = self.picam2.create_preview_configuration(
+            main={"size": self.resolution, "format": "RGB888"},
+            lores=lores,
+            transform=libcamera.Transform(vflip=self.vflip)
+        )
+        self.picam2.configure(config_cam)
+        self.picam2.start()
+        logger.info("Picamera2 inicializada correctamente.")
+
+    def read(self):
+        # No swap manual ya que el driver entrega BGR directamente con config RGB888
+        if not self.lores_size:
+            return self.picam2.capture_array(), time.time(), None
+        (frame, yuv), _ = self.picam2.capture_arrays(["main", "lores"])
+        # Plano Y del YUV420: las primeras 'alto' filas
+        w, h = self.lores_size
+        return frame, time.time(), yuv[:h, :w]
+
+    def set_frame_rate(self, fps):
+        # Duración de frame fija: el sensor no captura (ni consume) más de lo necesario
+        duration = int(1_000_000 / fps)
+        self.picam2.set_controls({"FrameDurationLimits": (duration, duration)})
+
+    def stop(self):
+        if self.picam2:
+            self.picam2.stop()
+
+
+class ReplaySource(FrameSource):
+    """Base de las fuentes de reproducción: marcas de tiempo sintéticas y ritmo opcional."""
+    def __init__(self, fps=None, realtime=False, loop=False):
+        self.fps = fps or config.FPS
+        self.realtime = realtime
+        self.loop = loop
+        self.index = 0
+        self.start_time = None
+
+    def start(self):
+        self.index = 0
+        self.start_time = time.time()
+
+    def _next_frame(self):
+        raise NotImplementedError
+
+    def _rewind(self):
+        return False
+
+    def read(self):
+        frame = self._next_frame()
+        if frame is None and self.loop and self._rewind():
+            frame = self._next_frame()
+        if frame is None:
+            return None, None, None
+
+        timestamp = self.start_time + self.index / self.fps
+        self.index += 1
+        if self.realtime:
+            delay = timestamp - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        return frame, timestamp, None
+
+
+class VideoFileSource(ReplaySource):
+    """Reproduce un fichero de vídeo o un directorio de imágenes (ordenadas por nombre)."""
+    def __init__(self, path, resolution=None, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.resolution = resolution or config.RESOLUTION
+        self.capture = None
+        self.images = None
+
+    def start(self):
+        super().start()
+        if os.path.isdir(self.path):
+            self.images = sorted(
+                os.path.join(self.path, f) for f in os.listdir(self.path)
+                if f.lower().endswith(IMAGE_EXTENSIONS)
+            )
+            if not self.images:
+                raise IOError(f"No hay imágenes en {self.path}")
+        else:
+            self.capture = cv2.VideoCapture(self.path)
+            if not self.capture.isOpened():
+                raise IOError(f"No se pudo abrir el vídeo {self.path}")
+        logger.info(f"Reproduciendo {self.path}")
+
+    def _next_frame(self):
+        if self.images is not None:
+            if self.index >= len(self.images) and not self.loop:
+                return None
+            frame = cv2.imread(self.images[self.index % len(self.images)])
+        else:
+            ok, frame = self.capture.read()
+            if not ok:
+                return None
+        if frame is not None and (frame.shape[1], frame.shape[0]) != tuple(self.resolution):
+            frame = cv2.resize(frame, tuple(self.resolution))
+        return frame
+
+    def _rewind(self):
+        if self.capture is not None:
+            return self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        return True
+
+    def stop(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+class SyntheticMotionSource(ReplaySource):
+    """
+    Escena sintética determinista: fondo texturizado con ruido de sensor y un bloque
+    que cruza la imagen durante 'event_seconds' cada 'period_seconds'.
+    'light_drift' simula cambios de luz lentos: variación máxima de brillo (0-255)
+    que recorre un ciclo completo cada 'drift_period' segundos.
+    """
+    def __init__(self, duration=60.0, period_seconds=20.0, event_seconds=8.0,
+                 resolution=None, seed=0, light_drift=0, drift_period=120.0, **kwargs):
+        super().__init__(**kwargs)
+        self.resolution = resolution or config.RESOLUTION
+        self.total_frames = int(duration * self.fps)
+        self.period_frames = int(period_seconds * self.fps)
+        self.event_frames = int(event_seconds * self.fps)
+        self.light_drift = light_drift
+        self.drift_period = drift_period
+        self.rng = np.random.default_rng(seed)
+
+        w, h = self.resolution
+        background = self.rng.integers(40, 200, (h, w, 3), dtype=np.uint8)
+        self.background = cv2.GaussianBlur(background, (15, 15), 0)
+        self.noise = self.rng.integers(0, 6, (8, h, w, 3), dtype=np.uint8)
+
+    def _next_frame(self):
+        if self.index >= self.total_frames:
+            return None
+        w, h = self.resolution
+        frame = cv2.add(self.background, self.noise[self.index % len(self.noise)])
+        if self.light_drift:
+            t = self.index / self.fps
+            beta = self.light_drift * np.sin(2 * np.pi * t / self.drift_period)
+            frame = cv2.convertScaleAbs(frame, alpha=1.0, beta=beta)
+
+        phase = self.index % self.period_frames
+        if phase < self.event_frames:
+            # Figura vertical (aprox. proporciones de una persona) cruzando de izquierda a derecha
+            bw, bh = w // 6, h // 2
+            x = int((w - bw) * phase / max(1, self.event_frames - 1))
+            y = h // 3
+            cv2.rectangle(frame, (x, y), (x + bw, min(h - 1, y + bh)), (60, 50, 160), -1)
+            cv2.circle(frame, (x + bw // 2, y - bw // 3), bw // 3, (90, 120, 180), -1)
+        return frame
+
+    def in_event(self, timestamp):
+        """True si el frame de 'timestamp' contiene la figura en movimiento (verdad de referencia)."""
+        index = int(round((timestamp - self.start_time) * self.fps))
+        return index % self.period_frames < self.event_frames
+
+    def _rewind(self):
+        self.index = 0
+        self.start_time = time.time()
+        return True
+
+
+class SharedMemorySource(FrameSource):
+    """
+    Frames publicados por el proceso de captura en el anillo de memoria compartida
+    (config.FRAME_BUS_ENABLED). Permite ejecutar otro proceso sobre la misma cámara.
+    Los frames se copian al leerlos: el pipeline los retiene más tiempo del que duran en el anillo.
+    """
+    def __init__(self, name=None, timeout=5.0):
+        self.name = name or config.FRAME_BUS_NAME
+        self.timeout = timeout
+        self.reader = None
+        self.last_seq = 0
+
+    def start(self):
+        from modules.shm_frames import SharedFrameReader
+        self.reader = SharedFrameReader(self.name)
+        self.last_seq = self.reader.latest_seq()
+
+    def read(self):
+        while True:
+            shared = self.reader.wait_for_frame(self.last_seq, timeout=self.timeout)
+            if shared is None:
+                logger.warning("El anillo de frames no recibe frames nuevos.")
+                return None, None, None
+            frame = shared.frame.copy()
+            if self.reader.is_valid(shared):
+                self.last_seq = shared.seq
+                return frame, shared.timestamp, None
+
+    def stop(self):
+        if self.reader:
+            self.reader.close()
+            self.reader = None
+
+
+def create_frame_source(name=None, path=None):
+    """Crea la fuente configurada en config.FRAME_SOURCE ('picamera2', 'file', 'synthetic' o 'shm')."""
+    name = name or config.FRAME_SOURCE
+    path = path or config.FRAME_SOURCE_PATH
+    if name == "picamera2":
+        lores = config.MOTION_RESOLUTION if config.MOTION_USE_LORES_STREAM else None
+        return Picamera2Source(lores_size=lores)
+    if name == "file":
+        return VideoFileSource(path, realtime=True, loop=True)
+    if name == "synthetic":
+        return SyntheticMotionSource(realtime=True, loop=True)
+    if name == "shm":
+        return SharedMemorySource()
+    raise ValueError(f"Fuente de vídeo desconocida: {name}")
@@ -0,0 +1,127 @@
+import time
+import logging
+import config
+
+# Configuración de logs
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("Governor")
+
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+
+
+def read_cpu_temp():
+    """Temperatura de la CPU en ºC, o None si no se puede leer."""
+    try:
+        with open(THERMAL_ZONE, "r") as f:
+            return int(f.read()) / 1000
+    except (OSError, ValueError):
+        return None
+
+
+class FrameRateGovernor:
+    """
+    Ritmo de captura, de análisis y de revisiones de IA según la actividad, la carga y la temperatura.
+    - Actividad: a config.FPS mientras hay movimiento o grabación; tras GOVERNOR_IDLE_AFTER
+      segundos sin movimiento baja a GOVERNOR_IDLE_FPS (ciclo de bajo consumo). El primer
+      frame con movimiento vuelve al ritmo completo.
+    - Temperatura: por encima de GOVERNOR_TEMP_HIGH / GOVERNOR_TEMP_CRITICAL se reduce el
+      ritmo a la mitad / a un cuarto, con histéresis de GOVERNOR_TEMP_HYSTERESIS grados.
+    - Carga: si el análisis tarda más que el intervalo entre frames se analiza uno de cada
+      varios (la grabación sigue recibiendo todos), y la revisión de IA se espacia según su latencia.
+    """
+    def __init__(self, temp_reader=read_cpu_temp):
+        self.temp_reader = temp_reader
+        self.enabled = config.GOVERNOR_ENABLED
+        self.last_activity = time.monotonic()
+        self.idle = False
+        self.thermal_level = 0      # 0 normal, 1 alta, 2 crítica
+        self.temperature = None
+        self.last_temp_check = 0.0
+        self.analysis_latency = 0.0 # Media móvil (s) del análisis de un frame
+        self.ai_latency = 0.0       # Media móvil (s) de una inferencia
+
+    def reset(self):
+        """Al empezar la captura se parte del ritmo completo."""
+        self.last_activity = time.monotonic()
+        self.idle = False
+
+    def notify_activity(self, motion=False, recording=False):
+        """El análisis informa de movimiento o grabación: se vuelve al ritmo completo en el acto."""
+        if motion or recording:
+            self.last_activity = time.monotonic()
+            if self.idle:
+                self.idle = False
+                logger.info("Actividad detectada: ritmo completo")
+
+    def observe_analysis(self, seconds):
+        self.analysis_latency = 0.9 * self.analysis_latency + 0.1 * seconds
+
+    def observe_ai(self, seconds):
+        self.ai_latency = 0.8 * self.ai_latency + 0.2 * seconds
+
+    def update(self):
+        """Revisa inactividad y temperatura (barato: llamar en cada frame)."""
+        now = time.monotonic()
+        if not self.idle and now - self.last_activity > config.GOVERNOR_IDLE_AFTER:
+            self.idle = True
+            logger.info(f"Sin actividad en {config.GOVERNOR_IDLE_AFTER} s: modo de bajo consumo ({config.GOVERNOR_IDLE_FPS} FPS)")
+        if now - self.last_temp_check >= config.GOVERNOR_TEMP_INTERVAL:
+            self.last_temp_check = now
+            self.temperature = self.temp_reader()
+            self._update_thermal_level()
+
+    def _update_thermal_level(self):
+        temp = self.temperature
+        if temp is None:
+            return
+        level = self.thermal_level
+        if temp >= config.GOVERNOR_TEMP_CRITICAL:
+            level = 2
+        elif temp >= config.GOVERNOR_TEMP_HIGH:
+            level = max(level, 1)
+        # Para bajar de nivel hay que enfriarse GOVERNOR_TEMP_HYSTERESIS grados por debajo del umbral
+        if level == 2 and temp < config.GOVERNOR_TEMP_CRITICAL - config.GOVERNOR_TEMP_HYSTERESIS:
+            level = 1
+        if level == 1 and temp < config.GOVERNOR_TEMP_HIGH - config.GOVERNOR_TEMP_HYSTERESIS:
+            level = 0
+        if level != self.thermal_level:
+            logger.warning(f"CPU a {temp:.1f}°C: nivel térmico {self.thermal_level} -> {level}")
+            self.thermal_level = level
+
+    def capture_fps(self, mode=2):
+        """Frames por segundo a capturar."""
+        if not self.enabled:
+            return config.PORTERO_FPS if mode == 1 else config.FPS
+        if mode == 1:
+            fps = config.PORTERO_FPS
+        elif self.idle:
+            fps = config.GOVERNOR_IDLE_FPS
+        else:
+            fps = config.FPS
+        return fps / (2 ** self.thermal_level)
+
+    def analysis_interval(self, mode=2):
+        """Segundos mínimos entre frames analizados (0 = todos)."""
+        if not self.enabled:
+            return 0.0
+        # Margen del 20%: el análisis no debe ocupar todo el intervalo entre frames
+        needed = self.analysis_latency / 0.8
+        return needed if needed > 1.0 / self.capture_fps(mode) else 0.0
+
+    def ai_interval(self):
+        """Segundos entre revisiones de IA durante una grabación."""
+        if not self.enabled:
+            return config.AI_CHECK_INTERVAL
+        return max(config.AI_CHECK_INTERVAL * (2 ** self.thermal_level), 3 * self.ai_latency)
+
+    def stats(self, mode=2):
+        return {
+            "enabled": self.enabled,
+            "idle": self.idle,
+            "thermal_level": self.thermal_level,
+            "cpu_temp": self.temperature,
+            "capture_fps": round(self.capture_fps(mode), 2),
+            "analysis_interval_s": round(self.analysis_interval(mode), 3),
+            "ai_interval_s": round(self.ai_interval(), 2),
+            "analysis_latency_ms": round(self.analysis_latency * 1000, 1),
+        }
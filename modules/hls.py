@@ -0,0 +1,212 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+import logging
+import config
+from modules import metrics
+from modules.pipeline import StageQueue, DROP_OLDEST
+from modules.recorder import CfrResampler
+
+# Configuración de logs
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("HLS")
+
+PLAYLIST_NAME = "live.m3u8"
+INIT_NAME = "init.mp4"
+
+class LiveHlsWriter:
+    """
+    Directo en HLS con segmentos fMP4: un proceso FFmpeg de larga duración recibe los
+    frames por una tubería y mantiene una lista de reproducción deslizante en HLS_DIR.
+    - Los frames llegan por una cola acotada que descarta los más antiguos, así un FFmpeg
+      lento nunca frena la captura.
+    - FFmpeg recibe siempre 'fps' frames por segundo de tiempo real: cada frame se repite o se
+      descarta según su marca de tiempo (CfrResampler), así el directo no se acelera cuando el
+      regulador baja el ritmo de captura (reposo, temperatura) ni cuando se descartan frames.
+    - La retención está acotada en número (HLS_LIST_SIZE, FFmpeg borra los segmentos que
+      salen de la lista) y en bytes (HLS_MAX_BYTES, se borran los más antiguos).
+    - Los segmentos se numeran desde la hora de inicio, así sus nombres no se repiten
+      entre reinicios y se pueden cachear como inmutables.
+    """
+    def __init__(self, output_dir=None, frame_size=None, fps=None):
+        self.output_dir = output_dir or config.HLS_DIR
+        self.frame_size = tuple(frame_size or config.RESOLUTION)
+        self.fps = fps or config.FPS
+        self.frames = StageQueue("hls", config.HLS_QUEUE_SIZE, DROP_OLDEST)
+        self.resampler = CfrResampler(self.fps)
+        self.proc = None
+        self.stderr = None
+        self.thread = None
+        self.is_running = False
+        self.restarts = 0
+        self.pruned_bytes = 0
+        self.last_lag = 0.0
+        self.write_time = metrics.stage("hls_write")  # Escritura en la tubería (FFmpeg no da abasto si crece)
+        self.lag_time = metrics.stage("hls_lag")      # Desde la captura hasta entregarlo al codificador
+        self.frames_counter = metrics.counter("vigilancia_hls_frames_total",
+                                              "Frames entregados al codificador del directo HLS (con repeticiones)")
+        self.restarts_counter = metrics.counter("vigilancia_hls_restarts_total", "Reinicios de FFmpeg del directo HLS")
+
+    def start(self):
+        if self.is_running:
+            return
+        if not shutil.which('ffmpeg'):
+            logger.error("FFmpeg no encontrado: el directo HLS no está disponible.")
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.is_running = True
+        self.thread = threading.Thread(target=self._run, name="hls-writer", daemon=True)
+        self.thread.start()
+        logger.info(f"Directo HLS en {self.output_dir}")
+
+    def stop(self):
+        self.is_running = False
+        self.frames.close()
+        if self.thread:
+            self.thread.join(timeout=5)
+        self._stop_ffmpeg()
+
+    def push(self, frame, timestamp=None):
+        """
+        Entrega un frame capturado en 'timestamp' al directo (no bloquea; si FFmpeg va retrasado
+        se descartan los antiguos).
+        """
+        if self.is_running:
+            self.frames.put((time.time() if timestamp is None else timestamp, frame))
+
+    def playlist_path(self):
+        return os.path.join(self.output_dir, PLAYLIST_NAME)
+
+    def is_available(self):
+        return self.is_running and os.path.exists(self.playlist_path())
+
+    def stats(self):
+        try:
+            segments = self._segments()
+        except FileNotFoundError:
+            segments = []
+        return {
+            "running": self.is_running,
+            "queue": self.frames.stats(),
+            "segments": len(segments),
+            "bytes": sum(size for _, _, size in segments),
+            "restarts": self.restarts,
+            "pruned_bytes": self.pruned_bytes,
+            "encoder_lag_s": round(self.last_lag, 3),
+        }
+
+    def _start_ffmpeg(self):
+        width, height = self.frame_size
+        gop = int(self.fps * config.HLS_SEGMENT_SECONDS)
+        cmd = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(self.fps),
+            '-i', '-',
+            '-an', '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency',
+            '-crf', str(config.HLS_CRF), '-maxrate', config.HLS_MAXRATE, '-bufsize', config.HLS_MAXRATE,
+            '-pix_fmt', 'yuv420p',
+            # Un fotograma clave por segmento para que cada segmento sea independiente
+            '-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0',
+            '-f', 'hls',
+            '-hls_time', str(config.HLS_SEGMENT_SECONDS),
+            '-hls_list_size', str(config.HLS_LIST_SIZE),
+            '-hls_flags', 'delete_segments+independent_segments+omit_endlist',
+            '-hls_segment_type', 'fmp4',
+            '-hls_fmp4_init_filename', INIT_NAME,
+            '-start_number', str(int(time.time())),
+            '-hls_segment_filename', os.path.join(self.output_dir, 'seg_%d.m4s'),
+            self.playlist_path()
+        ]
+        self.stderr = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self.stderr)
+
+    def _stop_ffmpeg(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self.proc = None
+        if self.stderr:
+            self.stderr.close()
+            self.stderr = None
+
+    def _run(self):
+        last_prune = 0
+        while self.is_running:
+            item = self.frames.get(timeout=1.0)
+            if item is None:
+                continue
+            timestamp, frame = item
+            if self.proc is None or self.proc.poll() is not None:
+                if self.proc is not None:
+                    self._log_ffmpeg_error()
+                    self._stop_ffmpeg()
+                    self.restarts += 1
+                    self.restarts_counter.inc()
+                    time.sleep(1)
+                self._start_ffmpeg()
+                self.resampler = CfrResampler(self.fps)  # Línea de tiempo nueva
+            try:
+                # 0 si el frame llega antes de su hueco, más de 1 si hubo un salto en la captura
+                repeat = self.resampler.frames_for(timestamp)
+                data = frame.data if frame.flags.c_contiguous else frame.tobytes()
+                if repeat:
+                    self.last_lag = time.time() - timestamp
+                    self.lag_time.observe(self.last_lag)
+                    with self.write_time.time():
+                        for _ in range(repeat):
+                            self.proc.stdin.write(data)
+                    self.frames_counter.inc(repeat)
+            except (BrokenPipeError, OSError) as e:
+                logger.error(f"FFmpeg (HLS) dejó de aceptar frames: {e}")
+
+            now = time.monotonic()
+            if now - last_prune >= config.HLS_SEGMENT_SECONDS:
+                self._prune()
+                last_prune = now
+
+    def _log_ffmpeg_error(self):
+        try:
+            self.stderr.seek(0)
+            logger.error(f"FFmpeg (HLS) terminó: {self.stderr.read().decode(errors='replace')}")
+        except (OSError, ValueError):
+            pass
+
+    def _segments(self):
+        segments = []
+        for name in os.listdir(self.output_dir):
+            if name.endswith(".m4s"):
+                path = os.path.join(self.output_dir, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                segments.append((st.st_mtime, path, st.st_size))
+        segments.sort()
+        return segments
+
+    def _prune(self):
+        """Límite de bytes: borra los segmentos más antiguos que lo excedan."""
+        try:
+            segments = self._segments()
+        except FileNotFoundError:
+            return
+        total = sum(size for _, _, size in segments)
+        for _, path, size in segments:
+            if total <= config.HLS_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.pruned_bytes += size
+            except OSError:
+                pass
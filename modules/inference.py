@@ -0,0 +1,252 @@
+import time
+import threading
+import logging
+from collections import namedtuple, deque
+import config
+from modules import metrics
+
+# Configuración de logs
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("Inference")
+
+# Resultado de una inferencia. 'frame' es el frame analizado (sin copiar) y 'detections'
+# están en coordenadas de ese frame, ordenadas por confianza.
+InferenceResult = namedtuple("InferenceResult", ["seq", "timestamp", "has_person", "score", "detections", "frame"])
+
+
+class DetectionBus:
+    """
+    Resultados de IA ya calculados por el pipeline, para que las alertas, el timbre y las
+    miniaturas elijan el mejor frame sin lanzar inferencias propias.
+    - Guarda los últimos DETECTION_BUS_SIZE resultados; el frame solo se conserva si hay persona.
+    - Un consumidor que necesita resultados recientes pide "demanda" durante unos segundos y
+      el pipeline analiza un frame cada AI_SAMPLE_INTERVAL mientras dure (también en modo portero).
+    """
+    def __init__(self, size=None):
+        self.condition = threading.Condition()
+        self.results = deque(maxlen=size or config.DETECTION_BUS_SIZE)
+        self.demand_until = 0.0
+        self.published = 0
+        self.listeners = []  # Funciones(resultado) llamadas con cada resultado publicado
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def publish(self, result):
+        if not result.has_person:
+            result = result._replace(frame=None)
+        with self.condition:
+            self.results.append(result)
+            self.published += 1
+            self.condition.notify_all()
+        for listener in self.listeners:
+            listener(result)
+
+    def since(self, timestamp):
+        """Resultados guardados de frames capturados desde 'timestamp'."""
+        with self.condition:
+            return [r for r in self.results if r.timestamp >= timestamp]
+
+    def best(self, since_seq=0):
+        """Resultado con persona de mayor confianza para frames >= since_seq (o None)."""
+        with self.condition:
+            candidates = [r for r in self.results if r.seq >= since_seq and r.has_person]
+        return max(candidates, key=lambda r: r.score, default=None)
+
+    def request(self, seconds):
+        """Pide al pipeline que publique resultados durante los próximos 'seconds' segundos."""
+        with self.condition:
+            self.demand_until = max(self.demand_until, time.monotonic() + seconds)
+
+    def demand_active(self):
+        return time.monotonic() < self.demand_until
+
+    def stats(self):
+        with self.condition:
+            return {"published": self.published, "stored": len(self.results), "demand": self.demand_active()}
+
+
+class InferenceEngine:
+    """
+    Motor de inferencia asíncrono sobre PersonDetector.
+    - submit() nunca bloquea: deja la petición en una ranura única. Si el modelo está ocupado
+      y llega otra petición, la anterior se descarta (un frame viejo no interesa).
+    - Un hilo despachador envía la petición al modelo en modo LIVE_STREAM (detect_async) y
+      el resultado llega por callback. Si LIVE_STREAM no está disponible, el hilo ejecuta
+      el modelo en modo IMAGE; con un pool de procesos (DetectorPool) hay un hilo por
+      proceso y se analizan varios frames a la vez.
+    - latest_result(min_seq) da el último resultado si corresponde a un frame >= min_seq;
+      los llamantes consultan sin esperar y deciden en un frame posterior.
+    - En modo síncrono (reproducción determinista) submit() ejecuta la inferencia en el acto.
+    """
+    def __init__(self, detector, mode=None, on_latency=None, bus=None):
+        self.detector = detector
+        self.bus = bus          # DetectionBus donde se publica cada resultado
+        self.mode = mode or config.AI_ENGINE_MODE
+        self.on_latency = on_latency  # Función(segundos) para instrumentación
+        self.synchronous = False
+        self.condition = threading.Condition()
+        self.pending = None     # Petición esperando al modelo (solo la más reciente)
+        self.in_flight = []     # Peticiones que está procesando el modelo
+        self.concurrency = 1
+        self.latest = None      # Último InferenceResult
+        self.live = None
+        self.threads = []
+        self.is_running = False
+        self._last_ts_ms = 0
+
+        self.inferred_counter = metrics.counter("vigilancia_frames_inferred_total", "Frames analizados por el modelo de IA")
+        self.dropped_counter = metrics.counter("vigilancia_frames_dropped_total", "Frames descartados por cola llena", queue="inference")
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.total_latency = 0.0
+
+    def start(self):
+        if self.is_running:
+            return
+        # El pool de procesos no tiene LIVE_STREAM: sus workers se usan en paralelo
+        create_live_stream = getattr(self.detector, "create_live_stream", None)
+        if self.mode == "live_stream" and create_live_stream:
+            self.live = create_live_stream(self._on_live_result)
+            if self.live is None:
+                logger.warning("LIVE_STREAM no disponible: la inferencia se ejecuta en un hilo (modo IMAGE).")
+        if self.live is None:
+            self.concurrency = getattr(self.detector, "concurrency", 1)
+        self.is_running = True
+        self.threads = [threading.Thread(target=self._dispatch_loop, name=f"inference-{i}", daemon=True)
+                        for i in range(self.concurrency)]
+        for t in self.threads:
+            t.start()
+        logger.info(f"Motor de inferencia iniciado ({'LIVE_STREAM' if self.live else 'IMAGE'}, {self.concurrency} en paralelo)")
+
+    def stop(self):
+        with self.condition:
+            self.is_running = False
+            self.condition.notify_all()
+        for t in self.threads:
+            t.join(timeout=5)
+        self.threads = []
+        if self.live is not None:
+            try:
+                self.live.close()
+            except Exception:
+                pass
+            self.live = None
+
+    def submit(self, frame, seq, timestamp, boxes=None):
+        """
+        Pide analizar 'frame' (número de frame 'seq'). Con cajas de movimiento solo se
+        analizan esas zonas. El frame no se copia: no debe modificarse después.
+        """
+        request = {"seq": seq, "timestamp": timestamp, "frame": frame, "boxes": boxes,
+                   "submitted_at": time.monotonic()}
+        if self.synchronous:
+            with self.condition:
+                self.submitted += 1
+            self._complete(request, *self.detector.detect_person_in_regions(frame, boxes))
+            return
+
+        with self.condition:
+            self.submitted += 1
+            if self.pending is not None:
+                self.dropped += 1
+                self.dropped_counter.inc()
+            self.pending = request
+            self.condition.notify_all()
+
+    def latest_result(self, min_seq=0):
+        """Último resultado si corresponde a un frame >= min_seq; si no, None (aún no hay)."""
+        with self.condition:
+            result = self.latest
+        if result is not None and result.seq >= min_seq:
+            return result
+        return None
+
+    def stats(self):
+        with self.condition:
+            return {
+                "mode": "sync" if self.synchronous else ("live_stream" if self.live else "image"),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "busy": len(self.in_flight),
+                "avg_latency_ms": round(1000 * self.total_latency / self.completed, 1) if self.completed else 0.0,
+            }
+
+    def _dispatch_loop(self):
+        while True:
+            with self.condition:
+                while self.is_running and (self.pending is None or len(self.in_flight) >= self.concurrency):
+                    self.condition.wait(timeout=0.5)
+                    self._expire_in_flight()
+                if not self.is_running:
+                    break
+                request, self.pending = self.pending, None
+                self.in_flight.append(request)
+
+            try:
+                if self.live is not None:
+                    self._dispatch_live(request)
+                else:
+                    self._complete(request, *self.detector.detect_person_in_regions(request["frame"], request["boxes"]))
+            except Exception as e:
+                logger.error(f"Error en la inferencia: {e}")
+                with self.condition:
+                    self.failed += 1
+                    self._discard(request)
+
+    def _dispatch_live(self, request):
+        image, tiles = self.detector.prepare_regions(request["frame"], request["boxes"])
+        request["tiles"] = tiles
+        # LIVE_STREAM exige marcas de tiempo estrictamente crecientes (ms)
+        ts_ms = max(self._last_ts_ms + 1, int(time.monotonic() * 1000))
+        self._last_ts_ms = ts_ms
+        request["ts_ms"] = ts_ms
+        with self.detector.lock:
+            self.live.detect_async(self.detector.to_mp_image(image), ts_ms)
+
+    def _on_live_result(self, result, image, timestamp_ms):
+        """Callback de MediaPipe (hilo propio de MediaPipe)."""
+        with self.condition:
+            request = next((r for r in self.in_flight if r.get("ts_ms") == timestamp_ms), None)
+        if request is None:
+            return
+        try:
+            detections = self.detector.map_detections(result.detections, request["tiles"])
+        except Exception as e:
+            logger.error(f"Error procesando el resultado de la inferencia: {e}")
+            detections = []
+        self._complete(request, *self.detector.evaluate(detections))
+
+    def _complete(self, request, has_person, detections):
+        score = detections[0].categories[0].score if detections else 0.0
+        result = InferenceResult(request["seq"], request["timestamp"], has_person, score, detections, request["frame"])
+        latency = time.monotonic() - request["submitted_at"]
+        with self.condition:
+            if self.latest is None or result.seq >= self.latest.seq:
+                self.latest = result
+            self._discard(request)
+            self.completed += 1
+            self.total_latency += latency
+            self.condition.notify_all()
+        self.inferred_counter.inc()
+        if self.bus is not None:
+            self.bus.publish(result)
+        if self.on_latency:
+            self.on_latency(latency)
+
+    def _expire_in_flight(self):
+        """Si el modelo no responde (p. ej. MediaPipe descartó el frame), se libera la ranura."""
+        now = time.monotonic()
+        for request in list(self.in_flight):
+            if now - request["submitted_at"] > config.AI_RESULT_TIMEOUT:
+                logger.warning(f"Inferencia del frame {request['seq']} sin respuesta; se descarta.")
+                self._discard(request)
+                self.failed += 1
+
+    def _discard(self, request):
+        """Quita una petición de las que están en curso (llamar con self.condition)."""
+        self.in_flight = [r for r in self.in_flight if r is not request]
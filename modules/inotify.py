@@ -0,0 +1,115 @@
+import os
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+
+# Configuración de logs
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("Inotify")
+
+# Máscaras de <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+# Eventos que interesan al gestor de almacenamiento: ficheros terminados, movidos o borrados
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+
+def _libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1  # Solo Linux
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class DirectoryWatcher:
+    """
+    Eventos inotify de un directorio (sin dependencias: llamadas a libc con ctypes).
+    callback(mask, name) se llama desde un hilo propio por cada evento; name es None para
+    IN_Q_OVERFLOW (se perdieron eventos: hay que volver a recorrer el directorio) y para
+    los eventos del propio directorio (borrado o desmontado).
+    En un NAS montado por CIFS/NFS solo se ven los cambios hechos desde esta máquina
+    (grabador, post-procesado, Samba local); lo demás lo corrige el recorrido periódico.
+    """
+    def __init__(self, path, callback, mask=WATCH_MASK):
+        self.path = path
+        self.callback = callback
+        self.mask = mask
+        self.fd = None
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        """True si inotify está disponible y el directorio se vigila."""
+        libc = _libc()
+        if libc is None:
+            logger.warning("inotify no disponible en esta plataforma")
+            return False
+        fd = libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            logger.warning(f"inotify_init1 falló: {os.strerror(ctypes.get_errno())}")
+            return False
+        if libc.inotify_add_watch(fd, os.fsencode(self.path), self.mask) < 0:
+            logger.warning(f"No se puede vigilar {self.path}: {os.strerror(ctypes.get_errno())}")
+            os.close(fd)
+            return False
+        self.fd = fd
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="inotify", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2)
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _run(self):
+        while self.running:
+            # Espera con tiempo límite para poder parar el hilo
+            ready, _, _ = select.select([self.fd], [], [], 1.0)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except OSError as e:
+                logger.error(f"Error leyendo eventos inotify: {e}")
+                break
+            for mask, name in self._parse(data):
+                try:
+                    self.callback(mask, name)
+                except Exception as e:
+                    logger.error(f"Error procesando el evento inotify de {name}: {e}")
+                if mask & IN_IGNORED:
+                    # El vigilante se retiró (directorio borrado o desmontado)
+                    self.running = False
+
+    @staticmethod
+    def _parse(data):
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            raw = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_ISDIR:
+                continue
+            yield mask, os.fsdecode(raw) if raw else None
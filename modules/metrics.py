@@ -0,0 +1,156 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Límites (segundos) de los histogramas: de 1 ms a 1 min
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_METRIC = "vigilancia_stage_seconds"
+
+
+def _label_text(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Counter:
+    """Contador monótono."""
+    def __init__(self, labels=()):
+        self.labels = labels
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Histograma de cubetas fijas: observar cuesta una búsqueda binaria y tres sumas."""
+    def __init__(self, labels=(), buckets=DEFAULT_BUCKETS):
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # La última es +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += seconds
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q):
+        """Estimación de un percentil: límite superior de la cubeta que lo contiene."""
+        counts, _, count = self.snapshot()
+        if not count:
+            return 0.0
+        target = q * count
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            if cumulative >= target:
+                # Por encima de la última cubeta solo se sabe que supera su límite
+                return bound if bound != float("inf") else self.buckets[-1]
+        return self.buckets[-1]
+
+
+class Registry:
+    """Métricas del proceso. Se exportan en formato de texto de Prometheus y como resumen."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families = {}  # nombre -> (tipo, ayuda, {etiquetas: métrica})
+
+    def _get(self, kind, name, help_text, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, (kind, help_text, {}))
+            metrics = family[2]
+            if key not in metrics:
+                metrics[key] = factory(key)
+            return metrics[key]
+
+    def counter(self, name, help_text, **labels):
+        return self._get("counter", name, help_text, labels, lambda key: Counter(key))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS, **labels):
+        return self._get("histogram", name, help_text, labels, lambda key: Histogram(key, buckets))
+
+    def render(self):
+        """Texto para /metrics (formato de exposición de Prometheus 0.0.4)."""
+        lines = []
+        with self._lock:
+            families = [(name, kind, help_text, list(metrics.values()))
+                        for name, (kind, help_text, metrics) in sorted(self._families.items())]
+        for name, kind, help_text, metrics in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in metrics:
+                if kind == "counter":
+                    lines.append(f"{name}{_label_text(metric.labels)} {metric.value}")
+                    continue
+                counts, total, count = metric.snapshot()
+                cumulative = 0
+                for bound, n in zip(metric.buckets + (float("inf"),), counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_label_text(metric.labels, ('le', le))} {cumulative}")
+                lines.append(f"{name}_sum{_label_text(metric.labels)} {total}")
+                lines.append(f"{name}_count{_label_text(metric.labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Resumen para /status: contadores y, por etapa, número, media y p90 aproximado (ms)."""
+        result = {"counters": {}, "stages": {}}
+        with self._lock:
+            families = [(name, kind, list(metrics.values())) for name, (kind, _, metrics) in self._families.items()]
+        for name, kind, metrics in families:
+            for metric in metrics:
+                if kind == "counter":
+                    result["counters"][name + _label_text(metric.labels)] = metric.value
+                elif name == STAGE_METRIC:
+                    _, total, count = metric.snapshot()
+                    stage = dict(metric.labels).get("stage", "")
+                    result["stages"][stage] = {
+                        "count": count,
+                        "mean_ms": round(1000 * total / count, 2) if count else 0.0,
+                        "p90_ms": round(1000 * metric.quantile(0.9), 2),
+                    }
+        return result
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text, **labels):
+    return REGISTRY.counter(name, help_text, **labels)
+
+
+def stage(name):
+    """Histograma de duración de una etapa (etiqueta 'stage' de vigilancia_stage_seconds)."""
+    return REGISTRY.histogram(STAGE_METRIC, "Duración de cada etapa en segundos", stage=name)
+
+
+def render():
+    return REGISTRY.render()
+
+
+def summary():
+    return REGISTRY.summary()
@@ -0,0 +1,162 @@
+import cv2
+import numpy as np
+import config
+
+class MotionDetector:
+    """
+    Detección de movimiento por diferencia con el fondo sobre una imagen reducida.
+    - El análisis se hace a config.MOTION_RESOLUTION (stream lores de Picamera2 o reescalado).
+    - MIN_AREA y el tamaño del desenfoque se escalan con la resolución de análisis.
+    - Las zonas de inclusión/exclusión (polígonos en coordenadas normalizadas 0-1) se
+      aplican antes de umbralizar: fuera del rectángulo que envuelve las zonas incluidas
+      no se procesa nada y las zonas excluidas se anulan antes de buscar contornos.
+    Las cajas de movimiento se devuelven en coordenadas del frame completo.
+
+    Modelos de fondo (config.BACKGROUND_MODEL):
+    - "static": el fondo es un frame fijo que solo se renueva al terminar una grabación.
+    - "running_avg": media ponderada acumulada in situ (cv2.accumulateWeighted) que solo
+      aprende en los píxeles sin movimiento, así absorbe los cambios de luz lentos.
+    - "mog2": mezcla de gaussianas de OpenCV (BackgroundSubtractorMOG2).
+    """
+    def __init__(self, frame_size=None, analysis_size=None, include_zones=None, exclude_zones=None,
+                 background_model=None):
+        self.frame_size = tuple(frame_size or config.RESOLUTION)
+        self.analysis_size = tuple(analysis_size or config.MOTION_RESOLUTION)
+        include_zones = config.MOTION_INCLUDE_ZONES if include_zones is None else include_zones
+        exclude_zones = config.MOTION_EXCLUDE_ZONES if exclude_zones is None else exclude_zones
+
+        fw, fh = self.frame_size
+        aw, ah = self.analysis_size
+        self.scale_x = fw / aw
+        self.scale_y = fh / ah
+
+        # Área mínima y desenfoque equivalentes a los valores calibrados a resolución completa
+        area_ratio = (aw * ah) / (fw * fh)
+        self.min_area = config.MIN_AREA * area_ratio
+        kernel = max(3, int(round(21 * aw / fw)) | 1)
+        self.blur_kernel = (kernel, kernel)
+
+        self._build_mask(include_zones, exclude_zones)
+        self.background_model = background_model or config.BACKGROUND_MODEL
+        if self.background_model not in ("static", "running_avg", "mog2"):
+            raise ValueError(f"Modelo de fondo desconocido: {self.background_model}")
+        self.fondo = None
+        self._acumulado = None     # running_avg: fondo en float32
+        self._mascara_fondo = None # running_avg: píxeles donde el fondo puede aprender
+        self._mog2 = None
+
+    def _build_mask(self, include_zones, exclude_zones):
+        aw, ah = self.analysis_size
+        if include_zones:
+            mask = np.zeros((ah, aw), dtype=np.uint8)
+            for zone in include_zones:
+                cv2.fillPoly(mask, [self._zone_points(zone)], 255)
+        else:
+            mask = np.full((ah, aw), 255, dtype=np.uint8)
+        for zone in exclude_zones:
+            cv2.fillPoly(mask, [self._zone_points(zone)], 0)
+
+        # Rectángulo de trabajo: lo que queda fuera nunca se procesa
+        x, y, w, h = cv2.boundingRect(mask)
+        if w == 0 or h == 0:
+            raise ValueError("Las zonas de movimiento excluyen toda la imagen")
+        self.roi = (x, y, w, h)
+        self.roi_mask = mask[y:y + h, x:x + w].copy()
+        # Si el rectángulo está completo no hace falta aplicar la máscara
+        self.mask_needed = not bool(self.roi_mask.all())
+
+    def _zone_points(self, zone):
+        aw, ah = self.analysis_size
+        return np.array([(int(round(px * aw)), int(round(py * ah))) for px, py in zone], dtype=np.int32)
+
+    def prepare(self, frame, lores_gray=None):
+        """Imagen en grises, reducida, recortada a la zona de interés y desenfocada."""
+        x, y, w, h = self.roi
+        if lores_gray is not None and (lores_gray.shape[1], lores_gray.shape[0]) == self.analysis_size:
+            gris = lores_gray[y:y + h, x:x + w]
+        else:
+            if (frame.shape[1], frame.shape[0]) != self.analysis_size:
+                # INTER_LINEAR: igual de barato que INTER_AREA a 1/2 y mucho más a 1/4 (el desenfoque posterior evita el aliasing)
+                frame = cv2.resize(frame, self.analysis_size, interpolation=cv2.INTER_LINEAR)
+            gris = cv2.cvtColor(frame[y:y + h, x:x + w], cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gris, self.blur_kernel, 0)
+
+    def detect(self, gris):
+        """
+        Compara con el fondo. Retorna (hay_movimiento, cajas) con las cajas (x, y, w, h)
+        de los contornos que superan el área mínima, en coordenadas del frame completo.
+        """
+        if self.background_model == "mog2":
+            umbral = self._foreground_mog2(gris)
+        else:
+            if self.fondo is None:
+                self._seed(gris)
+                return False, []
+
+            diferencia = cv2.absdiff(self.fondo, gris)
+            if self.mask_needed:
+                cv2.bitwise_and(diferencia, self.roi_mask, dst=diferencia)
+            _, umbral = cv2.threshold(diferencia, 25, 255, cv2.THRESH_BINARY)
+            if self.background_model == "running_avg":
+                self._update_running_avg(gris, umbral)
+        umbral = cv2.dilate(umbral, None, iterations=2)
+
+        contornos, _ = cv2.findContours(umbral, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        rx, ry = self.roi[0], self.roi[1]
+        cajas = []
+        for c in contornos:
+            if cv2.contourArea(c) < self.min_area:
+                continue
+            x, y, w, h = cv2.boundingRect(c)
+            cajas.append((
+                int((x + rx) * self.scale_x), int((y + ry) * self.scale_y),
+                int(w * self.scale_x), int(h * self.scale_y),
+            ))
+        return bool(cajas), cajas
+
+    def _seed(self, gris):
+        if self.background_model == "running_avg":
+            self._acumulado = gris.astype(np.float32)
+            self._mascara_fondo = np.empty_like(gris)
+            # Copia propia: se actualiza in situ y no debe compartir memoria con el frame
+            self.fondo = gris.copy()
+        else:
+            self.fondo = gris
+
+    def _update_running_avg(self, gris, umbral):
+        """
+        Aprende el fondo sin reservar memoria nueva: a ritmo normal en los píxeles quietos
+        y cuatro veces más despacio donde hay movimiento, para que un objeto que se marcha
+        (o que estaba en el primer frame) no deje un 'fantasma' permanente.
+        """
+        cv2.bitwise_not(umbral, dst=self._mascara_fondo)
+        cv2.accumulateWeighted(gris, self._acumulado, config.BACKGROUND_ALPHA, mask=self._mascara_fondo)
+        cv2.accumulateWeighted(gris, self._acumulado, config.BACKGROUND_ALPHA / 4, mask=umbral)
+        cv2.convertScaleAbs(self._acumulado, dst=self.fondo)
+
+    def _foreground_mog2(self, gris):
+        if self._mog2 is None:
+            self._mog2 = cv2.createBackgroundSubtractorMOG2(
+                history=config.BACKGROUND_MOG2_HISTORY,
+                varThreshold=config.BACKGROUND_MOG2_THRESHOLD,
+                detectShadows=False,
+            )
+        umbral = self._mog2.apply(gris, learningRate=config.BACKGROUND_ALPHA)
+        if self.mask_needed:
+            cv2.bitwise_and(umbral, self.roi_mask, dst=umbral)
+        return umbral
+
+    def reset_background(self, gris=None):
+        """
+        Sustituye el fondo (None = se tomará el siguiente frame). MOG2 mantiene su
+        modelo aprendido salvo en un reinicio completo (gris=None).
+        """
+        if self.background_model == "mog2":
+            if gris is None:
+                self._mog2 = None
+            return
+        if gris is None:
+            self.fondo = None
+        else:
+            self._seed(gris)
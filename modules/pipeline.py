@@ -0,0 +1,83 @@
+import threading
+from collections import deque, namedtuple
+from modules import metrics
+
+# Frame capturado que circula entre etapas (el array no se copia entre colas).
+# 'lores' es la imagen en grises de baja resolución para el análisis (o None).
+FramePacket = namedtuple("FramePacket", ["seq", "timestamp", "frame", "lores"])
+
+DROP_OLDEST = "drop_oldest"   # Se descarta el elemento más antiguo (prioriza frescura)
+DROP_NEWEST = "drop_newest"   # Se descarta el elemento entrante (prioriza continuidad)
+BLOCK = "block"               # El productor espera a que haya hueco (sin pérdidas)
+
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class StageQueue:
+    """Cola acotada entre etapas del pipeline con política de descarte explícita y contadores."""
+    def __init__(self, name, maxsize, policy=DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(f"Política de cola desconocida: {policy}")
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self.items = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.puts = 0
+        self.drops = 0
+        self.max_depth = 0
+        self.drop_counter = metrics.counter("vigilancia_frames_dropped_total", "Frames descartados por cola llena", queue=name)
+
+    def put(self, item):
+        """Encola un elemento. Retorna False si el elemento (u otro) se ha descartado."""
+        with self.condition:
+            dropped = False
+            if len(self.items) >= self.maxsize:
+                if self.policy == DROP_OLDEST:
+                    self.items.popleft()
+                    self.drops += 1
+                    self.drop_counter.inc()
+                    dropped = True
+                elif self.policy == DROP_NEWEST:
+                    self.drops += 1
+                    self.drop_counter.inc()
+                    return False
+                else:
+                    self.condition.wait_for(lambda: len(self.items) < self.maxsize or self.closed)
+            if self.closed:
+                return False
+            self.items.append(item)
+            self.puts += 1
+            self.max_depth = max(self.max_depth, len(self.items))
+            self.condition.notify_all()
+            return not dropped
+
+    def get(self, timeout=None):
+        """Extrae el siguiente elemento; None si vence el timeout o la cola está cerrada y vacía."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.items or self.closed, timeout):
+                return None
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        """Despierta a productores y consumidores; los elementos pendientes aún se pueden leer."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "depth": len(self.items),
+                "maxsize": self.maxsize,
+                "max_depth": self.max_depth,
+                "policy": self.policy,
+                "puts": self.puts,
+                "drops": self.drops,
+            }
+
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import queue
+import threading
+import logging
+import config
+from modules.recorder import optimize_for_web, low_priority_prefix
+
+# Configuración de logs
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("PostProceso")
+
+TEMP_SUFFIX = ".temp.mp4"
+
+class PostProcessQueue:
+    """
+    Cola de post-procesado de clips (optimización FFmpeg para web).
+    - Número fijo de workers con prioridad baja (nice/ionice) para no competir con la captura.
+    - Cola acotada a POSTPROCESS_MAX_PENDING clips: con la cola llena (ráfaga de eventos en
+      una Pi lenta) el clip nuevo no se optimiza y pasa directamente a la cola local (sigue
+      grabado y en el catálogo, en el formato del grabador).
+    - Los trabajos pendientes se guardan en disco y se reanudan tras un reinicio.
+    - Al arrancar se recuperan los '.temp.mp4' huérfanos de una conversión interrumpida.
+    """
+    def __init__(self, path_videos, state_file=None, workers=None, catalog=None, spool=None):
+        self.path = path_videos
+        self.catalog = catalog  # RecordingCatalog a actualizar al terminar (tamaño y fecha cambian)
+        self.spool = spool      # SpoolMover: el clip terminado pasa al NAS (también si la conversión falla)
+        self.state_file = state_file or config.POSTPROCESS_STATE_FILE
+        self.workers = workers or config.POSTPROCESS_WORKERS
+        self.command_prefix = low_priority_prefix(config.POSTPROCESS_NICE, config.POSTPROCESS_IONICE_CLASS)
+
+        self.max_pending = config.POSTPROCESS_MAX_PENDING
+        self.jobs = queue.Queue(maxsize=self.max_pending)
+        self.lock = threading.Lock()
+        self.pending = {}       # ruta -> trabajo (pendientes y en curso, lo que se persiste)
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.overflowed = 0     # Clips que no se optimizaron por tener la cola llena
+        self.last_latency = 0.0 # Segundos desde que se encoló hasta que terminó
+        self.total_latency = 0.0
+        self.threads = []
+
+    def start(self):
+        # Se lee el estado antes de recuperar huérfanos (submit() reescribe el fichero)
+        saved = self._load_state()
+        self._recover_orphans()
+        for job in saved:
+            if os.path.exists(job["path"]):
+                self.submit(job["path"])
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"postprocess-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+        logger.info(f"Cola de post-procesado iniciada ({self.workers} workers, {len(self.pending)} pendientes)")
+
+    def submit(self, path):
+        """Encola un clip para optimizar. Los duplicados se ignoran. Retorna False si la cola estaba llena."""
+        with self.lock:
+            if path in self.pending:
+                return True
+            full = len(self.pending) >= self.max_pending
+            if not full:
+                job = {"path": path, "submitted_at": time.time()}
+                self.pending[path] = job
+                self.jobs.put_nowait(job)  # Hay hueco: la cola nunca tiene más trabajos que 'pending'
+                self._save_state()
+            else:
+                self.overflowed += 1
+        if full:
+            logger.warning(f"Cola de post-procesado llena ({self.max_pending}): {os.path.basename(path)} "
+                           f"se guarda sin optimizar")
+            if self.spool:
+                self.spool.submit(path)
+        return not full
+
+    def stats(self):
+        with self.lock:
+            done = self.completed + self.failed
+            return {
+                "backlog": len(self.pending) - self.running,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "overflowed": self.overflowed,
+                "last_latency_s": round(self.last_latency, 2),
+                "avg_latency_s": round(self.total_latency / done, 2) if done else 0.0,
+            }
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            with self.lock:
+                self.running += 1
+            ok = False
+            try:
+                ok = optimize_for_web(job["path"], command_prefix=self.command_prefix)
+                if ok and self.catalog:
+                    self.catalog.add(job["path"])
+            except Exception as e:
+                logger.error(f"Error en el post-procesado de {job['path']}: {e}")
+            finally:
+                if self.spool:
+                    self.spool.submit(job["path"])
+                latency = time.time() - job["submitted_at"]
+                with self.lock:
+                    self.running -= 1
+                    self.pending.pop(job["path"], None)
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                    self.last_latency = latency
+                    self.total_latency += latency
+                    self._save_state()
+
+    def _load_state(self):
+        """Trabajos pendientes guardados por la ejecución anterior."""
+        if not os.path.exists(self.state_file):
+            return []
+        try:
+            with open(self.state_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"No se pudo leer la cola persistida: {e}")
+            return []
+
+    def is_pending(self, path):
+        """True si el clip está en cola o convirtiéndose."""
+        with self.lock:
+            return path in self.pending
+
+    def _save_state(self):
+        """Escritura atómica de los trabajos pendientes (llamar con self.lock)."""
+        tmp = self.state_file + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(sorted(self.pending.values(), key=lambda j: j["submitted_at"]), f)
+            os.replace(tmp, self.state_file)
+        except OSError as e:
+            logger.error(f"No se pudo guardar la cola de post-procesado: {e}")
+
+    def _recover_orphans(self):
+        """
+        Un '.temp.mp4' es el original de una conversión que no terminó: el destino (si existe)
+        está incompleto. Se restaura el original y se vuelve a encolar.
+        """
+        for directory in [self.path] + ([self.spool.dir] if self.spool else []):
+            if os.path.exists(directory):
+                self._recover_orphans_in(directory)
+
+    def _recover_orphans_in(self, directory):
+        for name in os.listdir(directory):
+            if not name.endswith(TEMP_SUFFIX):
+                continue
+            temp_path = os.path.join(directory, name)
+            final_path = temp_path[:-len(TEMP_SUFFIX)]
+            try:
+                if os.path.exists(final_path):
+                    os.remove(final_path)
+                os.rename(temp_path, final_path)
+                logger.warning(f"Recuperado clip con post-procesado interrumpido: {os.path.basename(final_path)}")
+                self.submit(final_path)
+            except OSError as e:
+                logger.error(f"No se pudo recuperar {name}: {e}")
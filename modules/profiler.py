@@ -0,0 +1,146 @@
+import os
+import sys
+import time
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+import config
+
+# Configuración de logs
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("Profiler")
+
+
+class ProfilerBusy(Exception):
+    """Ya hay un perfilado o una captura de memoria en curso."""
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _stack(frame, max_depth):
+    """Pila de la raíz a la hoja como lista de etiquetas (recortada a max_depth desde la hoja)."""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _duration(seconds):
+    """Duración pedida acotada a [PROFILER_MIN_SECONDS, PROFILER_MAX_SECONDS] (por defecto PROFILER_DEFAULT_SECONDS)."""
+    seconds = float(seconds or config.PROFILER_DEFAULT_SECONDS)
+    return max(config.PROFILER_MIN_SECONDS, min(seconds, config.PROFILER_MAX_SECONDS))
+
+
+class Profiler:
+    """
+    Perfilado bajo demanda sin reiniciar el servicio.
+    - sample(): muestreo de las pilas de todos los hilos (captura, análisis, grabación, Telegram,
+      almacenamiento, peticiones Flask) con sys._current_frames(). El resultado es texto en
+      formato 'collapsed' (hilo;func;func... N), que aceptan flamegraph.pl y speedscope.
+    - memory(): activa tracemalloc solo durante la ventana pedida y devuelve las N líneas
+      de código que más memoria han reservado (y siguen vivas) en ese tiempo.
+    El coste está acotado: duración máxima, intervalo mínimo entre muestras, profundidad
+    máxima de pila y una sola captura a la vez. El último resultado de cada tipo se guarda
+    para descargarlo después.
+    """
+    def __init__(self):
+        self._busy = threading.Lock()
+        self.results = {}  # tipo -> (marca de tiempo, texto)
+
+    def _acquire(self):
+        if not self._busy.acquire(blocking=False):
+            raise ProfilerBusy("Ya hay un perfilado en curso")
+
+    def sample(self, seconds=None, interval=None):
+        """Muestrea todas las pilas durante 'seconds'. Retorna (texto collapsed, estadísticas)."""
+        seconds = _duration(seconds)
+        interval = max(float(interval or config.PROFILER_INTERVAL), config.PROFILER_MIN_INTERVAL)
+        self._acquire()
+        try:
+            own = threading.get_ident()
+            stacks = Counter()
+            samples = 0
+            busy_time = 0.0
+            start = time.perf_counter()
+            deadline = start + seconds
+            logger.info(f"Perfilando {seconds:.0f} s (una muestra cada {interval * 1000:.0f} ms)")
+            while True:
+                t0 = time.perf_counter()
+                if t0 >= deadline:
+                    break
+                names = {t.ident: t.name for t in threading.enumerate()}
+                frames = sys._current_frames()
+                for ident, frame in frames.items():
+                    if ident == own:
+                        continue
+                    thread = names.get(ident, f"thread-{ident}")
+                    stack = _stack(frame, config.PROFILER_MAX_DEPTH)
+                    stacks[";".join([thread] + stack)] += 1
+                # Sin referencias a los frames entre muestras (retendrían sus variables locales)
+                frames = frame = None
+                samples += 1
+                elapsed = time.perf_counter() - t0
+                busy_time += elapsed
+                time.sleep(max(0.0, interval - elapsed))
+            duration = time.perf_counter() - start
+        finally:
+            self._busy.release()
+
+        text = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        stats = {
+            "seconds": round(duration, 2),
+            "samples": samples,
+            "stacks": len(stacks),
+            # Fracción de una CPU gastada en el propio muestreo
+            "overhead": round(busy_time / duration, 4) if duration else 0.0,
+        }
+        self.results["profile"] = (time.time(), text)
+        logger.info(f"Perfil completado: {samples} muestras, {len(stacks)} pilas, sobrecoste {stats['overhead']:.1%}")
+        return text, stats
+
+    def memory(self, seconds=None, top=None):
+        """Reservas de memoria durante 'seconds' agrupadas por línea. Retorna (texto, estadísticas)."""
+        seconds = _duration(seconds)
+        top = top or config.PROFILER_MEMORY_TOP
+        self._acquire()
+        try:
+            # Si ya estaba activo (p. ej. PYTHONTRACEMALLOC) no se para al terminar
+            started_here = not tracemalloc.is_tracing()
+            if started_here:
+                tracemalloc.start(config.PROFILER_TRACEMALLOC_FRAMES)
+            baseline = tracemalloc.take_snapshot()
+            time.sleep(seconds)
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if started_here:
+                tracemalloc.stop()
+        finally:
+            self._busy.release()
+
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        snapshot = snapshot.filter_traces(filters)
+        diff = snapshot.compare_to(baseline.filter_traces(filters), "lineno")
+        lines = [f"# Reservas vivas de Python tras {seconds:.0f} s (top {top} por línea, diferencia con el inicio)"]
+        for stat in diff[:top]:
+            frame = stat.traceback[0]
+            lines.append(f"{stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8d} bloques  "
+                         f"{frame.filename}:{frame.lineno}")
+        lines.append(f"# Total trazado: {current / 1024:.1f} KiB (pico {peak / 1024:.1f} KiB)")
+        text = "\n".join(lines) + "\n"
+        stats = {"seconds": seconds, "traced_kib": round(current / 1024, 1), "peak_kib": round(peak / 1024, 1)}
+        self.results["memory"] = (time.time(), text)
+        logger.info(f"Captura de memoria completada: {stats['traced_kib']} KiB trazados")
+        return text, stats
+
+    def last(self, kind):
+        """Último resultado ('profile' o 'memory') como (marca de tiempo, texto), o None."""
+        return self.results.get(kind)
+
+
+profiler = Profiler()
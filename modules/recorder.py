@@ -0,0 +1,361 @@
+import os
+import time
+import shutil
+import subprocess
+import tempfile
+import logging
+from fractions import Fraction
+import cv2
+import config
+from modules import metrics
+
+try:
+    import av  # PyAV (opcional): codificación con marcas de tiempo por frame
+    try:
+        from av.video.frame import PictureType
+        _PICTURE_TYPE_I = PictureType.I
+    except ImportError:
+        _PICTURE_TYPE_I = "I"  # PyAV < 13
+except ImportError:
+    av = None
+
+# Configuración de logs
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("Recorder")
+
+class ClipWriter:
+    """
+    Interfaz de los escritores de clips.
+    needs_postprocess indica si el fichero resultante aún debe pasar por optimize_for_web().
+    variable_rate indica que el clip es de ritmo variable: los frames se escriben con
+    write_at() y su marca de tiempo, y se pueden saltar los estáticos (ver StaticFrameGate).
+    """
+    needs_postprocess = False
+    variable_rate = False
+
+    def write(self, frame):
+        raise NotImplementedError
+
+    def write_at(self, frame, timestamp, keyframe=False):
+        raise NotImplementedError
+
+    def close(self):
+        """Cierra el clip. Retorna True si el fichero quedó bien escrito."""
+        raise NotImplementedError
+
+
+class OpenCVClipWriter(ClipWriter):
+    """Método original: cv2.VideoWriter con 'mp4v' (requiere re-codificar a H.264 después)."""
+    needs_postprocess = True
+
+    def __init__(self, path, frame_size, fps):
+        self.path = path
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self.out = cv2.VideoWriter(path, fourcc, fps, frame_size)
+
+    def write(self, frame):
+        self.out.write(frame)
+
+    def close(self):
+        self.out.release()
+        return os.path.exists(self.path)
+
+
+class FFmpegClipWriter(ClipWriter):
+    """
+    Codificación H.264 en una sola pasada: los frames BGR se envían por una tubería a un
+    proceso FFmpeg que vive lo que dura el clip. Con MP4 fragmentado el fichero es válido
+    (y reproducible) en todo momento, y queda terminado al cerrar sin reescribirlo.
+    """
+    def __init__(self, path, frame_size, fps, output_args=()):
+        self.path = path
+        self.failed = False
+        width, height = frame_size
+        cmd = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(fps),
+            '-i', '-',
+            '-an', *output_args, '-c:v', 'libx264', '-preset', config.RECORDER_PRESET,
+            '-crf', str(config.RECORDER_CRF), '-pix_fmt', 'yuv420p',
+            '-g', str(int(fps * config.RECORDER_KEYFRAME_SECONDS)),
+            '-movflags', config.RECORDER_MOVFLAGS,
+            '-f', 'mp4', path
+        ]
+        # stderr a fichero temporal: una tubería sin leer podría bloquear a FFmpeg
+        self.stderr = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self.stderr)
+
+    def write(self, frame):
+        if self.failed:
+            return
+        try:
+            # Sin copia si el array es contiguo (el caso normal)
+            self.proc.stdin.write(frame.data if frame.flags.c_contiguous else frame.tobytes())
+        except (BrokenPipeError, OSError) as e:
+            self.failed = True
+            logger.error(f"FFmpeg dejó de aceptar frames para {self.path}: {e}")
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            returncode = self.proc.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            returncode = -1
+        if returncode != 0:
+            self.stderr.seek(0)
+            logger.error(f"FFmpeg falló al grabar {self.path}: {self.stderr.read().decode(errors='replace')}")
+        self.stderr.close()
+        return returncode == 0 and os.path.exists(self.path)
+
+
+class FFmpegVfrClipWriter(FFmpegClipWriter):
+    """
+    Ritmo variable con FFmpeg (sin PyAV). Una tubería rawvideo no lleva marcas de tiempo, así
+    que la entrada sigue siendo de ritmo constante: los huecos de los frames saltados se
+    rellenan con el último frame escrito y FFmpeg los descarta (mpdecimate) antes de codificar,
+    conservando el instante de los demás. Se ahorra la codificación, no la tubería.
+    """
+    variable_rate = True
+
+    def __init__(self, path, frame_size, fps):
+        heartbeat = max(1, int(round(fps * config.RECORDER_VFR_HEARTBEAT)))
+        super().__init__(path, frame_size, fps, output_args=(
+            '-vf', f'mpdecimate=max={heartbeat}', '-fps_mode', 'vfr',
+            '-force_key_frames', f'expr:gte(t,n_forced*{config.RECORDER_KEYFRAME_SECONDS})'))
+        self.resampler = CfrResampler(fps)
+        self.held = None
+
+    def write_at(self, frame, timestamp, keyframe=False):
+        # Los fotogramas clave los fuerza FFmpeg por tiempo (-force_key_frames)
+        copies = self.resampler.frames_for(timestamp)
+        if copies and self.held is not None:
+            for _ in range(copies - 1):
+                self.write(self.held)
+        if copies:
+            self.write(frame)
+        self.held = frame
+
+
+class PyAVClipWriter(ClipWriter):
+    """
+    Ritmo variable con PyAV: cada frame se codifica con su marca de tiempo real (milisegundos
+    desde el inicio del clip), así que los frames saltados no cuestan nada. Los fotogramas
+    clave se fuerzan desde fuera (keyframe=True) para que el clip se pueda recorrer aunque
+    pase mucho tiempo sin frames.
+    """
+    variable_rate = True
+    TIME_BASE = Fraction(1, 1000)
+
+    def __init__(self, path, frame_size, fps):
+        self.path = path
+        self.failed = False
+        self.t0 = None
+        self.last_pts = -1
+        width, height = frame_size
+        self.container = av.open(path, mode="w", format="mp4", options={"movflags": config.RECORDER_MOVFLAGS})
+        self.stream = self.container.add_stream("libx264", rate=int(round(fps)))
+        self.stream.width = width
+        self.stream.height = height
+        self.stream.pix_fmt = "yuv420p"
+        self.stream.time_base = self.TIME_BASE
+        self.stream.codec_context.time_base = self.TIME_BASE
+        # Sin GOP por número de frames: las claves las marca write_at (IDR para poder saltar a ellas)
+        self.stream.options = {"preset": config.RECORDER_PRESET, "crf": str(config.RECORDER_CRF),
+                               "forced-idr": "1", "x264-params": "keyint=infinite"}
+
+    def write_at(self, frame, timestamp, keyframe=False):
+        if self.failed:
+            return
+        if self.t0 is None:
+            self.t0 = timestamp
+            keyframe = True
+        # Las marcas deben crecer aunque dos frames caigan en el mismo milisegundo
+        pts = max(int(round((timestamp - self.t0) * 1000)), self.last_pts + 1)
+        self.last_pts = pts
+        try:
+            video_frame = av.VideoFrame.from_ndarray(frame, format="bgr24")
+            video_frame.pts = pts
+            video_frame.time_base = self.TIME_BASE
+            if keyframe:
+                video_frame.pict_type = _PICTURE_TYPE_I
+            for packet in self.stream.encode(video_frame):
+                self.container.mux(packet)
+        except Exception as e:
+            self.failed = True
+            logger.error(f"PyAV dejó de aceptar frames para {self.path}: {e}")
+
+    def close(self):
+        try:
+            if not self.failed:
+                for packet in self.stream.encode(None):
+                    self.container.mux(packet)
+            self.container.close()
+        except Exception as e:
+            logger.error(f"PyAV falló al cerrar {self.path}: {e}")
+            return False
+        return not self.failed and os.path.exists(self.path)
+
+
+class StaticFrameGate:
+    """
+    Decide qué frames escribe un clip de ritmo variable. Se compara cada frame con el último
+    escrito en una miniatura en grises: si cambia menos de 'min_change' (fracción de píxeles
+    que varían más de PIXEL_THRESHOLD niveles) se salta. Aunque la escena esté quieta se
+    escribe un frame cada 'heartbeat' segundos, y el primer frame escrito pasados
+    'keyframe_seconds' desde el último fotograma clave se marca como clave.
+    """
+    SIZE = (80, 60)
+    PIXEL_THRESHOLD = 25  # Por encima del ruido del sensor
+
+    def __init__(self, min_change=None, heartbeat=None, keyframe_seconds=None):
+        self.min_change = config.RECORDER_VFR_MIN_CHANGE if min_change is None else min_change
+        self.heartbeat = config.RECORDER_VFR_HEARTBEAT if heartbeat is None else heartbeat
+        self.keyframe_seconds = config.RECORDER_KEYFRAME_SECONDS if keyframe_seconds is None else keyframe_seconds
+        self.reference = None
+        self.last_written = None
+        self.last_keyframe = None
+        self.written = 0
+        self.skipped = 0
+
+    def _thumbnail(self, frame, lores=None):
+        if lores is not None:
+            return cv2.resize(lores, self.SIZE, interpolation=cv2.INTER_AREA)
+        # Reducir antes de pasar a grises (interpolación lineal: INTER_AREA en color cuesta 15 veces más)
+        return cv2.cvtColor(cv2.resize(frame, self.SIZE, interpolation=cv2.INTER_LINEAR), cv2.COLOR_BGR2GRAY)
+
+    def change(self, thumbnail):
+        """Fracción de la miniatura que cambió respecto al último frame escrito."""
+        diff = cv2.absdiff(thumbnail, self.reference)
+        return cv2.countNonZero(cv2.threshold(diff, self.PIXEL_THRESHOLD, 255, cv2.THRESH_BINARY)[1]) / diff.size
+
+    def decide(self, timestamp, frame, lores=None):
+        """Retorna (escribir, fotograma_clave) para el frame capturado en 'timestamp'."""
+        thumbnail = self._thumbnail(frame, lores)
+        write = (self.reference is None or timestamp - self.last_written >= self.heartbeat or
+                 self.change(thumbnail) >= self.min_change)
+        if not write:
+            self.skipped += 1
+            return False, False
+        keyframe = self.last_keyframe is None or timestamp - self.last_keyframe >= self.keyframe_seconds
+        if keyframe:
+            self.last_keyframe = timestamp
+        self.reference = thumbnail
+        self.last_written = timestamp
+        self.written += 1
+        return True, keyframe
+
+
+class CfrResampler:
+    """
+    Convierte frames con marcas de tiempo irregulares a ritmo constante (los clips se codifican
+    a 'fps' fijos). frames_for(ts) dice cuántas veces escribir el frame: 0 si llega antes de su
+    hueco (se descarta) o más de 1 si hubo un salto (se repite). Así la duración del clip coincide
+    con el tiempo real aunque el ritmo de captura cambie.
+    """
+    # Un salto mayor que esto (reloj ajustado, pausa larga) no se rellena
+    MAX_GAP_SECONDS = 5.0
+
+    def __init__(self, fps):
+        self.interval = 1.0 / fps
+        self.next_ts = None
+
+    def frames_for(self, timestamp):
+        if self.next_ts is None or abs(timestamp - self.next_ts) > self.MAX_GAP_SECONDS:
+            self.next_ts = timestamp
+        count = 0
+        # Un frame ocupa los huecos cuyo instante está a menos de medio intervalo de él
+        while self.next_ts <= timestamp + self.interval / 2:
+            count += 1
+            self.next_ts += self.interval
+        return count
+
+
+def ffmpeg_available():
+    return shutil.which('ffmpeg') is not None
+
+
+def create_clip_writer(path, frame_size, fps=None, variable_rate=False):
+    """
+    Crea el escritor configurado en config.RECORDER_BACKEND ('ffmpeg' u 'opencv').
+    Con variable_rate se usa PyAV si está instalado, o FFmpeg con mpdecimate; sin ninguno
+    de los dos el clip se graba a ritmo constante.
+    """
+    fps = fps or config.FPS
+    if variable_rate:
+        if av is not None:
+            return PyAVClipWriter(path, frame_size, fps)
+        if ffmpeg_available():
+            return FFmpegVfrClipWriter(path, frame_size, fps)
+        logger.warning("Ni PyAV ni FFmpeg disponibles: se graba a ritmo constante.")
+    if config.RECORDER_BACKEND == "ffmpeg":
+        if ffmpeg_available():
+            return FFmpegClipWriter(path, frame_size, fps)
+        logger.warning("FFmpeg no encontrado. Se graba con OpenCV (mp4v) y post-procesado.")
+    return OpenCVClipWriter(path, frame_size, fps)
+
+
+def low_priority_prefix(nice=None, ionice_class=None):
+    """Prefijo de comando para ejecutar un proceso con prioridad baja de CPU (nice) y de disco (ionice)."""
+    prefix = []
+    if nice and shutil.which('nice'):
+        prefix += ['nice', '-n', str(nice)]
+    if ionice_class and shutil.which('ionice'):
+        prefix += ['ionice', '-c', str(ionice_class)]
+    return prefix
+
+
+def optimize_for_web(raw_path, command_prefix=None):
+    """
+    Usa FFmpeg para convertir el vídeo a H.264 optimizado para web (faststart).
+    Esto permite que el vídeo se reproduzca en streaming sin esperar a descargarse entero.
+    command_prefix permite ejecutar FFmpeg con otra prioridad (ver low_priority_prefix).
+    Retorna True si la conversión terminó correctamente.
+    """
+    if not os.path.exists(raw_path):
+        return False
+
+    final_path = raw_path # El nombre ya termina en .mp4
+    temp_path = raw_path + ".temp.mp4"
+
+    try:
+        # Renombramos el original a temp
+        os.rename(raw_path, temp_path)
+        start = time.perf_counter()
+
+        logger.info(f"FFmpeg: Optimizando {final_path}...")
+
+        # Comando FFmpeg para optimizar el video
+        cmd = (command_prefix or []) + [
+            'ffmpeg', '-y', '-i', temp_path,
+            '-c:v', 'libx264', '-preset', 'ultrafast',
+            '-crf', '28',
+            '-movflags', '+faststart',
+            final_path
+        ]
+
+        # Ejecutar conversión
+        result = subprocess.run(cmd, capture_output=True, text=True)
+
+        metrics.stage("postprocess").observe(time.perf_counter() - start)
+
+        if result.returncode == 0:
+            logger.info(f"FFmpeg: Conversión exitosa. Archivo listo para streaming: {final_path}")
+            # Borramos el temporal si todo fue bien
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return True
+        else:
+            logger.error(f"FFmpeg falló: {result.stderr}")
+            # Si falla, intentamos dejar el original como estaba para que al menos se pueda descargar
+            if os.path.exists(temp_path) and not os.path.exists(final_path):
+                os.rename(temp_path, final_path)
+
+    except Exception as e:
+        logger.error(f"Error durante el post-procesado de vídeo: {e}")
+        if os.path.exists(temp_path) and not os.path.exists(final_path):
+            os.rename(temp_path, final_path)
+    return False
@@ -0,0 +1,203 @@
+import os
+import heapq
+import config
+
+
+SEGMENT_MARK = "_parte"  # alerta_X.mp4, alerta_X_parte2.mp4, ...: segmentos consecutivos de un evento
+
+
+def evento_y_segmento(nombre):
+    """(identificador del evento, número de segmento desde 1) de un fichero de grabación."""
+    base = nombre.rsplit(".", 1)[0]
+    evento, marca, numero = base.rpartition(SEGMENT_MARK)
+    if marca and numero.isdigit():
+        return evento, int(numero)
+    return base, 1
+
+
+def nombre_segmento(clip, numero):
+    """Nombre del segmento 'numero' del evento que empezó con el clip 'clip'."""
+    evento = evento_y_segmento(os.path.basename(clip))[0]
+    return f"{evento}{SEGMENT_MARK}{numero}.mp4" if numero > 1 else f"{evento}.mp4"
+
+
+def clave_evento(nombre):
+    """
+    Clip, miniatura y segmentos de un mismo evento comparten nombre base
+    (alerta_X.mp4 / alerta_X.jpg / alerta_X_parte2.mp4): se conservan y se borran juntos.
+    """
+    return evento_y_segmento(nombre)[0]
+
+
+class RetentionIndex:
+    """
+    Índice de eventos del NAS ordenado por prioridad de borrado.
+    Cada evento (clip + miniatura) tiene una "fecha efectiva": su fecha real desplazada por
+    lo que vale conservarlo.
+    - Confianza de la IA: una persona confirmada con confianza c suma c * RETENTION_PERSON_BONUS_DAYS.
+    - Tamaño: cada MB adelanta el evento RETENTION_SECONDS_PER_MB (a igualdad, antes los grandes).
+    - Fijado a mano ("conservar"): nunca se borra.
+    Como todos los eventos envejecen al mismo ritmo, el orden por fecha efectiva no cambia con
+    el tiempo: basta un montículo, sin reordenar. Se borra primero la fecha efectiva más antigua,
+    y la limpieza por antigüedad compara la fecha efectiva con el límite de días.
+    No hace E/S: lo usa GestorAlmacenamiento y se puede probar con cargas sintéticas.
+    """
+    def __init__(self, person_bonus_days=None, seconds_per_mb=None):
+        self.person_bonus = (config.RETENTION_PERSON_BONUS_DAYS if person_bonus_days is None
+                             else person_bonus_days) * 86400
+        self.seconds_per_mb = config.RETENTION_SECONDS_PER_MB if seconds_per_mb is None else seconds_per_mb
+        self.clear()
+
+    def clear(self):
+        self.eventos = {}   # clave -> {"fecha", "ficheros": {nombre: (tamaño, mtime)}, "bytes", "score", "pinned", "prioridad"}
+        self.monticulo = [] # (prioridad, clave); las entradas obsoletas se descartan al recorrerlo
+        self.bytes_total = 0
+        self.fijados = 0     # Totales al día para stats() (sin recorrer los eventos)
+        self.con_persona = 0
+
+    def __len__(self):
+        return len(self.eventos)
+
+    def prioridad(self, evento):
+        """Fecha efectiva del evento (None si está fijado)."""
+        if evento["pinned"]:
+            return None
+        bonus = self.person_bonus * (evento["score"] or 0.0)
+        penalty = self.seconds_per_mb * evento["bytes"] / (1024 * 1024)
+        return evento["fecha"] + bonus - penalty
+
+    def _refresh(self, clave, evento):
+        prioridad = self.prioridad(evento)
+        if prioridad != evento["prioridad"]:
+            evento["prioridad"] = prioridad
+            if prioridad is not None:
+                heapq.heappush(self.monticulo, (prioridad, clave))
+                self._compact()
+
+    def _compact(self):
+        # Se reconstruye el montículo si acumula demasiadas entradas obsoletas
+        if len(self.monticulo) > 2 * len(self.eventos) + 64:
+            self.monticulo = [(e["prioridad"], c) for c, e in self.eventos.items() if e["prioridad"] is not None]
+            heapq.heapify(self.monticulo)
+
+    # --- Altas, bajas y metadatos ---
+
+    def add_file(self, nombre, tamano, mtime):
+        clave = clave_evento(nombre)
+        evento = self.eventos.get(clave)
+        if evento is None:
+            evento = self.eventos[clave] = {"fecha": mtime, "ficheros": {}, "bytes": 0,
+                                            "score": None, "pinned": False, "prioridad": None}
+        anterior = evento["ficheros"].get(nombre)
+        if anterior:
+            evento["bytes"] -= anterior[0]
+            self.bytes_total -= anterior[0]
+        evento["ficheros"][nombre] = (tamano, mtime)
+        evento["bytes"] += tamano
+        self.bytes_total += tamano
+        evento["fecha"] = min(evento["fecha"], mtime)
+        self._refresh(clave, evento)
+        return clave
+
+    def remove_file(self, nombre):
+        clave = clave_evento(nombre)
+        evento = self.eventos.get(clave)
+        if evento is None or nombre not in evento["ficheros"]:
+            return
+        tamano = evento["ficheros"].pop(nombre)[0]
+        evento["bytes"] -= tamano
+        self.bytes_total -= tamano
+        if evento["ficheros"]:
+            self._refresh(clave, evento)
+        else:
+            del self.eventos[clave]
+            self.fijados -= evento["pinned"]
+            self.con_persona -= bool(evento["score"])
+            self._compact()
+
+    def set_score(self, clave, score):
+        """Confianza de persona del evento (0-1). False si el evento no está en el índice."""
+        evento = self.eventos.get(clave)
+        if evento is None:
+            return False
+        self.con_persona += bool(score) - bool(evento["score"])
+        evento["score"] = score
+        self._refresh(clave, evento)
+        return True
+
+    def set_pinned(self, clave, pinned):
+        evento = self.eventos.get(clave)
+        if evento is None:
+            return False
+        self.fijados += bool(pinned) - evento["pinned"]
+        evento["pinned"] = bool(pinned)
+        self._refresh(clave, evento)
+        return True
+
+    # --- Selección de eventos a borrar ---
+
+    def ordered(self):
+        """Eventos no fijados de menor a mayor fecha efectiva, sin modificar el índice."""
+        heap = self.monticulo
+        if not heap:
+            return
+        # Recorrido en orden del montículo con una frontera auxiliar: coste proporcional a lo recorrido
+        frontera = [(heap[0], 0)]
+        vistos = set()
+        while frontera:
+            (prioridad, clave), i = heapq.heappop(frontera)
+            for hijo in (2 * i + 1, 2 * i + 2):
+                if hijo < len(heap):
+                    heapq.heappush(frontera, (heap[hijo], hijo))
+            evento = self.eventos.get(clave)
+            if evento is None or evento["prioridad"] != prioridad or clave in vistos:
+                continue
+            vistos.add(clave)
+            yield clave, evento
+
+    def expired(self, limite):
+        """Eventos cuya fecha efectiva es anterior a 'limite' (epoch)."""
+        result = []
+        for clave, evento in self.ordered():
+            if evento["prioridad"] >= limite:
+                break
+            result.append((clave, dict(evento["ficheros"])))
+        return result
+
+    def select(self, por_liberar, protegidos_desde=None):
+        """
+        Eventos a borrar para liberar 'por_liberar' bytes, en una pasada. Se saltan los que
+        tienen algún fichero modificado después de 'protegidos_desde' (en escritura).
+        Retorna (lista de (clave, ficheros), bytes que suman).
+        """
+        seleccion, acumulado = [], 0
+        for clave, evento in self.ordered():
+            if acumulado >= por_liberar:
+                break
+            ficheros = evento["ficheros"]
+            if protegidos_desde is not None and any(mtime > protegidos_desde for _, mtime in ficheros.values()):
+                continue
+            seleccion.append((clave, dict(ficheros)))
+            acumulado += evento["bytes"]
+        return seleccion, acumulado
+
+    def ingest_rate(self, ventana, ahora):
+        """
+        Bytes por día que llegan al índice: media de los eventos de los últimos 'ventana' segundos
+        (o desde el más antiguo, si el índice abarca menos). 0 si no hay eventos recientes.
+        """
+        desde = ahora - ventana
+        recientes, primero = 0, ahora
+        for evento in self.eventos.values():
+            primero = min(primero, evento["fecha"])
+            if evento["fecha"] >= desde:
+                recientes += evento["bytes"]
+        periodo = ahora - max(desde, primero)
+        if not recientes or periodo <= 0:
+            return 0.0
+        # Con menos de una hora de historia la media no es representativa
+        return recientes / max(periodo, 3600) * 86400
+
+    def stats(self):
+        return {"events": len(self.eventos), "bytes": self.bytes_total, "pinned": self.fijados,
+                "with_person": self.con_persona}
@@ -0,0 +1,56 @@
+import numpy as np
+
+class FrameRingBuffer:
+    """
+    Buffer circular de frames sobre un único array preasignado (arena).
+    La memoria se reserva una sola vez (con el primer frame) y nunca crece:
+    capacidad = min(segundos * fps, max_bytes / tamaño_de_frame).
+    """
+    def __init__(self, seconds, fps, max_bytes):
+        self.seconds = seconds
+        self.fps = fps
+        self.max_bytes = max_bytes
+        self.arena = None
+        self.timestamps = None
+        self.capacity = 0
+        self.head = 0     # Siguiente posición a escribir
+        self.count = 0
+
+    def _allocate(self, frame):
+        frame_bytes = frame.nbytes
+        self.capacity = int(min(self.seconds * self.fps, self.max_bytes // frame_bytes))
+        if self.capacity <= 0:
+            return False
+        self.arena = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+        self.timestamps = np.zeros(self.capacity, dtype=np.float64)
+        return True
+
+    def push(self, frame, timestamp):
+        """Copia el frame en la siguiente ranura (sobrescribe el más antiguo si está lleno)."""
+        if self.arena is None and not self._allocate(frame):
+            return
+        if frame.shape != self.arena.shape[1:]:
+            # Cambio de resolución: se descarta el contenido y se reasigna
+            self.arena = None
+            self.clear()
+            if not self._allocate(frame):
+                return
+        np.copyto(self.arena[self.head], frame)
+        self.timestamps[self.head] = timestamp
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def frames_since(self, since):
+        """Itera (timestamp, frame) en orden cronológico desde 'since'. Los frames son vistas de la arena."""
+        start = (self.head - self.count) % self.capacity if self.capacity else 0
+        for i in range(self.count):
+            idx = (start + i) % self.capacity
+            if self.timestamps[idx] >= since:
+                yield self.timestamps[idx], self.arena[idx]
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def nbytes(self):
+        return self.arena.nbytes if self.arena is not None else 0
@@ -0,0 +1,186 @@
+import time
+import logging
+import threading
+from collections import namedtuple
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+
+# Configuración de logs
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("FrameBus")
+
+MAGIC = 0x46524D31  # 'FRM1'
+
+# Cabecera global del segmento
+HEADER = np.dtype([("magic", "<u4"), ("slots", "<u4"), ("height", "<u4"), ("width", "<u4"),
+                   ("channels", "<u4"), ("reserved", "<u4"), ("latest_seq", "<u8")])
+# Cabecera de cada ranura. 'lock' es un seqlock: impar mientras se escribe la ranura.
+SLOT_HEADER = np.dtype([("lock", "<u8"), ("seq", "<u8"), ("timestamp", "<f8"),
+                        ("mode", "u1"), ("motion", "u1"), ("reserved", "u1", (6,))])
+ALIGN = 64
+
+# Frame leído del anillo. 'frame' es una vista de solo lectura sobre la memoria compartida;
+# 'lock' permite comprobar con is_valid() que no se sobrescribió mientras se usaba.
+SharedFrame = namedtuple("SharedFrame", ["seq", "timestamp", "mode", "motion", "frame", "lock"])
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _layout(slots, shape):
+    """Desplazamientos de las cabeceras de ranura y de los frames, y tamaño total."""
+    slot_headers = _align(HEADER.itemsize)
+    frames = _align(slot_headers + slots * SLOT_HEADER.itemsize)
+    frame_bytes = _align(int(np.prod(shape)))
+    return slot_headers, frames, frame_bytes, frames + slots * frame_bytes
+
+
+class _RingView:
+    """Vistas numpy de la cabecera, las ranuras y los frames de un segmento."""
+    def _map(self, slots, shape):
+        slot_headers, frames, frame_bytes, _ = _layout(slots, shape)
+        buf = self.shm.buf
+        self.header = np.ndarray((), dtype=HEADER, buffer=buf)
+        self.slot_headers = np.ndarray((slots,), dtype=SLOT_HEADER, buffer=buf, offset=slot_headers)
+        self.frames = np.ndarray((slots,) + tuple(shape), dtype=np.uint8, buffer=buf,
+                                 offset=frames, strides=(frame_bytes,) + _strides(shape))
+        self.slots = slots
+        self.shape = tuple(shape)
+
+    def _unmap(self):
+        # Sin vistas vivas el segmento se puede cerrar
+        self.header = self.slot_headers = self.frames = None
+
+
+def _strides(shape):
+    strides = []
+    step = 1
+    for dim in reversed(shape):
+        strides.insert(0, step)
+        step *= dim
+    return tuple(strides)
+
+
+class SharedFrameRing(_RingView):
+    """
+    Anillo de frames en memoria compartida (lo escribe solo el proceso de captura).
+    Cada ranura lleva el número de frame, su marca de tiempo, el modo y si hubo movimiento.
+    Otros procesos locales lo leen con SharedFrameReader sin copiar los frames.
+    En el proceso de captura escriben dos hilos (captura y análisis): un cerrojo local los
+    serializa, porque el seqlock solo protege a los lectores de un único escritor.
+    """
+    def __init__(self, name, slots, frame_shape):
+        _, _, _, size = _layout(slots, frame_shape)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Segmento de una ejecución anterior que no se cerró bien
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = name
+        self.write_lock = threading.Lock()
+        self._map(slots, frame_shape)
+        height, width = frame_shape[:2]
+        channels = frame_shape[2] if len(frame_shape) > 2 else 1
+        self.slot_headers[:] = 0
+        self.header["slots"], self.header["height"], self.header["width"] = slots, height, width
+        self.header["channels"], self.header["latest_seq"] = channels, 0
+        self.header["magic"] = MAGIC  # La última: los lectores esperan a que el segmento esté completo
+        logger.info(f"Anillo de frames en memoria compartida: /dev/shm/{name} ({slots} ranuras)")
+
+    def publish(self, frame, seq, timestamp, mode=0, motion=False):
+        """Copia el frame en la ranura seq % slots."""
+        slot = self.slot_headers[seq % self.slots]
+        with self.write_lock:
+            slot["lock"] += 1  # Impar: escribiendo
+            np.copyto(self.frames[seq % self.slots], frame)
+            slot["seq"], slot["timestamp"] = seq, timestamp
+            slot["mode"], slot["motion"] = mode, motion
+            slot["lock"] += 1  # Par: consistente
+            self.header["latest_seq"] = seq
+
+    def set_motion(self, seq, motion):
+        """
+        El análisis marca el movimiento después de publicar el frame (si la ranura aún es suya).
+        La escritura también pasa por el seqlock: un lector que la cruce vuelve a leer la ranura.
+        """
+        slot = self.slot_headers[seq % self.slots]
+        with self.write_lock:
+            # Comprobado con el cerrojo: la captura no puede reutilizar la ranura entre medias
+            if slot["seq"] != seq:
+                return
+            slot["lock"] += 1
+            slot["motion"] = motion
+            slot["lock"] += 1
+
+    def close(self):
+        self._unmap()
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedFrameReader(_RingView):
+    """Acceso de solo lectura al anillo de otro proceso."""
+    def __init__(self, name):
+        try:
+            # Python >= 3.13: el lector no registra el segmento (su dueño es el escritor)
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # Antes de 3.13 el resource_tracker del lector lo borraría al salir este proceso
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        header = np.ndarray((), dtype=HEADER, buffer=self.shm.buf)
+        if header["magic"] != MAGIC:
+            del header
+            self.shm.close()
+            raise ValueError(f"/dev/shm/{name} no es un anillo de frames")
+        shape = (int(header["height"]), int(header["width"]), int(header["channels"]))
+        slots = int(header["slots"])
+        del header
+        self._map(slots, shape)
+        self.frames.flags.writeable = False
+        self.name = name
+
+    def latest_seq(self):
+        return int(self.header["latest_seq"])
+
+    def read(self, seq):
+        """Frame 'seq' si sigue en el anillo y no se está escribiendo; si no, None."""
+        slot = self.slot_headers[seq % self.slots]
+        lock = int(slot["lock"])
+        if lock % 2 or int(slot["seq"]) != seq:
+            return None
+        result = SharedFrame(seq, float(slot["timestamp"]), int(slot["mode"]), bool(slot["motion"]),
+                             self.frames[seq % self.slots], lock)
+        if int(slot["lock"]) != lock:
+            return None
+        return result
+
+    def latest(self):
+        seq = self.latest_seq()
+        return self.read(seq) if seq else None
+
+    def is_valid(self, shared_frame):
+        """True si la ranura no se ha sobrescrito desde que se leyó (el frame usado era íntegro)."""
+        return int(self.slot_headers[shared_frame.seq % self.slots]["lock"]) == shared_frame.lock
+
+    def wait_for_frame(self, last_seq, timeout=1.0, poll=0.01):
+        """Espera un frame posterior a last_seq (sondeando, no hay notificación entre procesos)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.latest_seq() > last_seq:
+                frame = self.latest()
+                if frame is not None:
+                    return frame
+            time.sleep(poll)
+        return None
+
+    def close(self):
+        self._unmap()
+        self.shm.close()
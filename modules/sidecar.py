@@ -0,0 +1,212 @@
+import os
+import time
+import struct
+import threading
+import numpy as np
+
+SIDECAR_EXTENSION = ".vsc"
+MAGIC = b"VSC1"
+VERSION = 1
+
+# Cabecera: firma, versión, reservado, bytes por registro, inicio del clip (epoch), ancho, alto, FPS
+HEADER = struct.Struct("<4sBBHdHHf")
+
+# Un registro por frame capturado del clip (16 bytes, little-endian, sin relleno):
+# - t_ms: milisegundos desde el inicio del clip
+# - motion: fracción del frame cubierta por las cajas de movimiento (NaN: frame no analizado)
+# - box: caja que une todas las de movimiento, x0, y0, x1, y1 normalizados a 0-65535 (ceros: sin movimiento)
+# - person: confianza de persona de la IA (NaN: frame no analizado por el modelo)
+RECORD = np.dtype([("t_ms", "<u4"), ("motion", "<f2"), ("box", "<u2", (4,)), ("person", "<f2")])
+
+BOX_SCALE = 65535
+
+# Regiones con nombre para las búsquedas (x0, y0, x1, y1 normalizados)
+REGIONS = {
+    "left": (0.0, 0.0, 0.5, 1.0),
+    "right": (0.5, 0.0, 1.0, 1.0),
+    "top": (0.0, 0.0, 1.0, 0.5),
+    "bottom": (0.0, 0.5, 1.0, 1.0),
+}
+
+
+def sidecar_for(clip_name):
+    return clip_name.rsplit(".", 1)[0] + SIDECAR_EXTENSION
+
+
+def motion_summary(boxes, frame_size):
+    """(fracción del frame con movimiento, caja unión normalizada o None) de las cajas (x, y, w, h)."""
+    if not boxes:
+        return 0.0, None
+    width, height = frame_size
+    area = sum(w * h for _, _, w, h in boxes)
+    x0 = min(x for x, _, _, _ in boxes)
+    y0 = min(y for _, y, _, _ in boxes)
+    x1 = max(x + w for x, _, w, _ in boxes)
+    y1 = max(y + h for _, y, _, h in boxes)
+    return min(1.0, area / (width * height)), (x0 / width, y0 / height, min(1.0, x1 / width), min(1.0, y1 / height))
+
+
+class SidecarRecorder:
+    """
+    Registros por frame de un clip mientras se graba, en un array que crece por duplicación.
+    El grabador añade una fila por frame (add); la confianza de la IA llega después desde
+    otro hilo (set_person) y se asocia por marca de tiempo, aunque llegue antes que la fila.
+    Los tiempos son relativos al primer frame añadido (el primero del clip).
+    """
+    def __init__(self, frame_size, fps, start=None):
+        self.start = start
+        self.frame_size = frame_size
+        self.fps = fps
+        self.records = np.zeros(64, dtype=RECORD)
+        self.count = 0
+        self.rows = {}            # marca de tiempo -> fila
+        self.pending_person = {}  # Resultados de IA de frames aún sin fila
+        self.lock = threading.Lock()
+
+    def add(self, timestamp, motion=float("nan"), box=None):
+        with self.lock:
+            if self.start is None:
+                self.start = timestamp
+            if self.count == len(self.records):
+                self.records = np.resize(self.records, 2 * len(self.records))
+            row = self.records[self.count]
+            row["t_ms"] = max(0, int(round((timestamp - self.start) * 1000)))
+            row["motion"] = motion
+            row["box"] = [int(round(v * BOX_SCALE)) for v in box] if box else (0, 0, 0, 0)
+            row["person"] = self.pending_person.pop(timestamp, float("nan"))
+            self.rows[timestamp] = self.count
+            self.count += 1
+
+    def set_person(self, timestamp, score):
+        with self.lock:
+            row = self.rows.get(timestamp)
+            if row is None:
+                self.pending_person[timestamp] = score
+            else:
+                self.records[row]["person"] = score
+
+    def max_person(self):
+        """Mayor confianza de persona del clip (None si la IA no analizó ningún frame)."""
+        with self.lock:
+            person = self.records["person"][:self.count]
+        analysed = person[~np.isnan(person)]
+        return float(analysed.max()) if analysed.size else None
+
+    def save(self, path):
+        """Escritura atómica del fichero (cabecera + registros)."""
+        width, height = self.frame_size
+        with self.lock:
+            records = self.records[:self.count]
+            header = HEADER.pack(MAGIC, VERSION, 0, RECORD.itemsize, self.start, width, height, self.fps)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(header)
+                f.write(records.tobytes())
+        os.replace(tmp, path)
+
+
+def read_sidecar(path):
+    """(cabecera, registros) de un fichero; los registros son una vista de solo lectura sin copia."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, _, record_size, start, width, height, fps = HEADER.unpack_from(data)
+    if magic != MAGIC or record_size != RECORD.itemsize:
+        raise ValueError(f"{os.path.basename(path)}: formato de sidecar no reconocido")
+    header = {"version": version, "start": start, "width": width, "height": height, "fps": fps}
+    return header, np.frombuffer(data, dtype=RECORD, offset=HEADER.size)
+
+
+def parse_region(text):
+    """Región con nombre (left, right, top, bottom) o 'x0,y0,x1,y1' normalizada."""
+    if text in REGIONS:
+        return REGIONS[text]
+    values = tuple(float(v) for v in text.split(","))
+    if len(values) != 4 or not all(0.0 <= v <= 1.0 for v in values) or values[0] >= values[2] or values[1] >= values[3]:
+        raise ValueError(f"región no válida: {text}")
+    return values
+
+
+def parse_hours(text):
+    """'HH:MM-HH:MM' -> (segundo del día inicial, final). Si el final es menor, cruza la medianoche."""
+    def seconds(part):
+        hours, _, minutes = part.strip().partition(":")
+        value = int(hours) * 3600 + int(minutes or 0) * 60
+        if not 0 <= value <= 86400:
+            raise ValueError(f"hora no válida: {part}")
+        return value
+    first, sep, last = text.partition("-")
+    if not sep:
+        raise ValueError(f"franja horaria no válida: {text}")
+    return seconds(first), seconds(last)
+
+
+def in_hours(seconds_of_day, hours):
+    start, end = hours
+    if start <= end:
+        return (seconds_of_day >= start) & (seconds_of_day < end)
+    return (seconds_of_day >= start) | (seconds_of_day < end)
+
+
+def match_frames(header, records, min_person=None, min_motion=None, region=None, hours=None,
+                 start=None, end=None):
+    """Máscara de los frames que cumplen todas las condiciones (vectorizado sobre los registros)."""
+    mask = np.ones(len(records), dtype=bool)
+    if start is not None or end is not None:
+        timestamps = header["start"] + records["t_ms"] / 1000.0
+        if start is not None:
+            mask &= timestamps >= start
+        if end is not None:
+            mask &= timestamps < end
+    if min_person is not None:
+        mask &= records["person"] >= min_person  # NaN (sin analizar) nunca cumple
+    if min_motion is not None:
+        mask &= records["motion"] >= min_motion
+    if region is not None:
+        box = records["box"].astype(np.float32) / BOX_SCALE
+        cx = (box[:, 0] + box[:, 2]) / 2
+        cy = (box[:, 1] + box[:, 3]) / 2
+        x0, y0, x1, y1 = region
+        # El centro de la caja de movimiento dentro de la región
+        mask &= (box[:, 2] > box[:, 0]) & (cx >= x0) & (cx <= x1) & (cy >= y0) & (cy <= y1)
+    if hours is not None:
+        offset = time.localtime(header["start"]).tm_gmtoff
+        seconds_of_day = (header["start"] + offset + records["t_ms"] / 1000.0) % 86400
+        mask &= in_hours(seconds_of_day, hours)
+    return mask
+
+
+def search(catalog, min_person=None, min_motion=None, region=None, hours=None, start=None, end=None,
+           limit=50, max_scan=2000, window=0):
+    """
+    Clips con algún frame que cumpla las condiciones, más recientes primero, sin abrir ningún MP4.
+    El catálogo descarta primero por fecha, franja horaria y confianza máxima del clip; después
+    se leen los sidecars de los candidatos (16 bytes por frame). 'window' es la duración máxima de
+    un clip: el catálogo solo conoce su cierre.
+    Retorna (resultados, sidecars leídos).
+    """
+    results, scanned = [], 0
+    rows = catalog.sidecar_candidates(min_person=min_person, start=start, end=end, hours=hours,
+                                      window=window, limit=max_scan)
+    for row in rows:
+        path = catalog.locate(sidecar_for(row["filename"]))
+        if path is None:
+            continue
+        try:
+            header, records = read_sidecar(path)
+        except (OSError, ValueError, struct.error):
+            continue
+        scanned += 1
+        mask = match_frames(header, records, min_person, min_motion, region, hours, start, end)
+        if not mask.any():
+            continue
+        matched = records[mask]
+        person = matched["person"][~np.isnan(matched["person"])]
+        results.append({
+            "row": row,
+            "matches": int(mask.sum()),
+            "first_match_s": round(float(matched["t_ms"][0]) / 1000.0, 2),
+            "best_person": float(person.max()) if person.size else None,
+        })
+        if len(results) >= limit:
+            break
+    return results, scanned
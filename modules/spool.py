@@ -0,0 +1,255 @@
+import os
+import time
+import shutil
+import logging
+import threading
+import config
+from modules import metrics
+from modules.sidecar import SIDECAR_EXTENSION
+
+# Configuración de logs
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("Spool")
+
+PART_SUFFIX = ".part"      # Copia en curso en el NAS (se renombra al terminar)
+TEMP_SUFFIX = ".temp.mp4"  # Original de un post-procesado en curso
+CHUNK_SIZE = 1024 * 1024
+COMPANIONS = (".jpg", SIDECAR_EXTENSION)  # Ficheros que acompañan a cada clip (miniatura e índice por frame)
+
+
+class SpoolMover:
+    """
+    Cola de escritura diferida en la tarjeta local delante del NAS.
+    - Los clips y las miniaturas se graban en SPOOL_DIR: un corte de CIFS/NFS no bloquea al
+      grabador ni al post-procesado, que también trabaja en local.
+    - Un hilo los mueve al NAS por lotes (cada SPOOL_FLUSH_INTERVAL o al acumular
+      SPOOL_FLUSH_MB), con el ancho de banda limitado a SPOOL_BANDWIDTH_MBPS y reintentos con
+      espera creciente si el NAS falla. Cada fichero se copia como '.part' y se renombra al
+      final (conservando su fecha): en el NAS nunca aparece un clip a medias.
+    - Un clip pasa a la cola cuando está terminado (cerrado y post-procesado) y se mueve con
+      su miniatura y su sidecar. Los que llegan cuando su clip ya se movió se mueven solos.
+    - Si la cola supera SPOOL_MAX_MB (o la tarjeta se queda sin sitio) se graba directamente
+      en el NAS hasta que se vacíe.
+    """
+    def __init__(self, spool_dir=None, nas_dir=None, catalog=None, storage=None):
+        self.dir = spool_dir or config.SPOOL_DIR
+        self.nas_dir = nas_dir or config.PATH_NAS
+        self.catalog = catalog
+        self.storage = storage
+        os.makedirs(self.dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.ready = {}             # nombre del clip -> momento en que quedó listo
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.running = False
+        self.backlog_bytes = 0
+        self.backlog_files = 0
+        self.moved = 0
+        self.moved_bytes = 0
+        self.failures = 0
+        self.last_error = None
+        self.next_attempt = 0.0
+        self.retry_delay = config.SPOOL_RETRY_INTERVAL
+        self.overflowing = False
+        self.write_time = metrics.stage("nas_write")
+        self.moved_counter = metrics.counter("vigilancia_spool_moved_bytes_total", "Bytes movidos de la cola local al NAS")
+
+    # --- Interfaz para el grabador ---
+
+    def record_dir(self):
+        """Directorio donde grabar el próximo clip: la cola local, o el NAS si la cola está llena."""
+        self._measure_backlog()
+        try:
+            free = shutil.disk_usage(self.dir).free
+        except OSError:
+            free = 0
+        full = (self.backlog_bytes >= config.SPOOL_MAX_MB * 1024 * 1024 or
+                free < config.SPOOL_MIN_FREE_MB * 1024 * 1024)
+        if full != self.overflowing:
+            self.overflowing = full
+            if full:
+                logger.warning(f"Cola local llena ({self.backlog_bytes / (1024 * 1024):.0f} MB): grabando directamente en el NAS")
+            else:
+                logger.info("Cola local con espacio: grabando de nuevo en local")
+        return self.nas_dir if full else self.dir
+
+    def holds(self, filename):
+        """True si el fichero está (todavía) en la cola local."""
+        return os.path.isfile(os.path.join(self.dir, os.path.basename(filename)))
+
+    def submit(self, path):
+        """El clip está terminado: se moverá al NAS (con su miniatura y su sidecar) en el próximo lote."""
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.dir):
+            return  # Grabado directamente en el NAS
+        with self.lock:
+            self.ready.setdefault(os.path.basename(path), time.time())
+        if self._pending_mb() >= config.SPOOL_FLUSH_MB:
+            self.wakeup.set()
+
+    # --- Hilo del mover ---
+
+    def start(self, busy=None):
+        """
+        Arranca el mover. Los clips que quedaron en la cola de una ejecución anterior se dan
+        por terminados salvo que busy(ruta) diga que siguen en uso (post-procesado pendiente).
+        """
+        for name in os.listdir(self.dir):
+            path = os.path.join(self.dir, name)
+            if name.endswith(".mp4") and not name.endswith(TEMP_SUFFIX) and not (busy and busy(path)):
+                self.ready.setdefault(name, os.path.getmtime(path))
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="spool-mover", daemon=True)
+        self.thread.start()
+        logger.info(f"Cola local de grabación en {self.dir} ({len(self.ready)} clips pendientes de mover)")
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    def flush(self):
+        """Mover ya lo pendiente (p. ej. al apagar)."""
+        self.next_attempt = 0.0
+        self.wakeup.set()
+
+    def _run(self):
+        while self.running:
+            self.wakeup.wait(config.SPOOL_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            if time.time() < self.next_attempt:
+                continue
+            try:
+                self._move_batch()
+            except Exception as e:
+                logger.error(f"Error en el mover de la cola local: {e}")
+
+    def _batch(self):
+        """Ficheros a mover en este lote: clips terminados con sus acompañantes, y acompañantes sueltos."""
+        with self.lock:
+            clips = sorted(self.ready, key=self.ready.get)
+        names = set(os.listdir(self.dir))
+        batch = []
+        for clip in clips:
+            batch.append((clip, True))
+            base = clip.rsplit(".", 1)[0]
+            batch += [(base + ext, False) for ext in COMPANIONS if base + ext in names]
+        # Acompañantes cuyo clip ya no está en la cola (p. ej. la miniatura de una alerta que
+        # se guardó después de mover el clip)
+        for name in names:
+            if name.endswith(COMPANIONS) and name.rsplit(".", 1)[0] + ".mp4" not in names:
+                batch.append((name, False))
+        return batch
+
+    def _move_batch(self):
+        batch = self._batch()
+        if not batch:
+            return
+        start = time.perf_counter()
+        moved_bytes = 0
+        for name, is_clip in batch:
+            if not self.running:
+                break
+            if not os.path.exists(os.path.join(self.dir, name)):
+                # Ya no está (borrado a mano o movido en un lote anterior)
+                with self.lock:
+                    self.ready.pop(name, None)
+                continue
+            try:
+                moved_bytes += self._move(name)
+            except OSError as e:
+                # El NAS no responde: se reintenta todo el lote más tarde, con espera creciente
+                self.failures += 1
+                self.last_error = f"{name}: {e}"
+                self.next_attempt = time.time() + self.retry_delay
+                logger.error(f"No se pudo mover {name} al NAS ({e}). Reintento en {self.retry_delay:.0f} s")
+                self.retry_delay = min(self.retry_delay * 2, config.SPOOL_RETRY_MAX)
+                break
+            if is_clip:
+                with self.lock:
+                    self.ready.pop(name, None)
+        else:
+            self.retry_delay = config.SPOOL_RETRY_INTERVAL
+            self.last_error = None
+        elapsed = time.perf_counter() - start
+        if moved_bytes:
+            logger.info(f"Lote movido al NAS: {moved_bytes / (1024 * 1024):.1f} MB en {elapsed:.1f} s")
+        self._measure_backlog()
+
+    def _move(self, name):
+        """Copia un fichero al NAS con el ancho de banda limitado y lo borra de la cola. Retorna sus bytes."""
+        src = os.path.join(self.dir, name)
+        dst = os.path.join(self.nas_dir, name)
+        part = dst + PART_SUFFIX
+        t0 = time.perf_counter()
+        rate = config.SPOOL_BANDWIDTH_MBPS * 1024 * 1024
+        copied = 0
+        with open(src, "rb") as fsrc, open(part, "wb") as fdst:
+            while True:
+                chunk = fsrc.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                fdst.write(chunk)
+                copied += len(chunk)
+                if rate > 0:
+                    # Limitación de ancho de banda: no ir por delante de copied / rate
+                    ahead = copied / rate - (time.perf_counter() - t0)
+                    if ahead > 0:
+                        time.sleep(ahead)
+            fdst.flush()
+            os.fsync(fdst.fileno())
+        shutil.copystat(src, part)  # Conserva la fecha: orden de la galería y antigüedad
+        os.replace(part, dst)
+        os.remove(src)
+        self.write_time.observe(time.perf_counter() - t0)
+        self.moved += 1
+        self.moved_bytes += copied
+        self.moved_counter.inc(copied)
+        if self.storage:
+            self.storage.registrar_archivo(dst)
+        if self.catalog and name.endswith(".mp4"):
+            self.catalog.add(dst)
+        return copied
+
+    def _pending_mb(self):
+        with self.lock:
+            names = list(self.ready)
+        total = 0
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(self.dir, name))
+            except OSError:
+                pass
+        return total / (1024 * 1024)
+
+    def _measure_backlog(self):
+        files, total = 0, 0
+        with os.scandir(self.dir) as it:
+            for entry in it:
+                try:
+                    if entry.is_file():
+                        files += 1
+                        total += entry.stat().st_size
+                except OSError:
+                    continue
+        self.backlog_files, self.backlog_bytes = files, total
+
+    def stats(self):
+        with self.lock:
+            ready = len(self.ready)
+            oldest = min(self.ready.values()) if self.ready else None
+        _, write_sum, write_count = self.write_time.snapshot()
+        return {
+            "backlog_files": self.backlog_files,
+            "backlog_mb": round(self.backlog_bytes / (1024 * 1024), 1),
+            "ready_clips": ready,
+            "oldest_ready_s": round(time.time() - oldest, 1) if oldest else 0.0,
+            "moved_files": self.moved,
+            "moved_mb": round(self.moved_bytes / (1024 * 1024), 1),
+            "nas_write_avg_s": round(write_sum / write_count, 3) if write_count else 0.0,
+            "nas_write_p90_s": round(self.write_time.quantile(0.9), 3),
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "recording_to_nas": self.overflowing,
+        }
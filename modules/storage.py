@@ -2,18 +2,133 @@ import os
 import shutil
 import time
 import logging
+import threading
+import config
+from modules import metrics
+from modules.retention import RetentionIndex, clave_evento
+from modules.inotify import (DirectoryWatcher, IN_CLOSE_WRITE, IN_MOVED_TO, IN_MOVED_FROM, IN_DELETE,
+                             IN_Q_OVERFLOW, IN_IGNORED)
+
+TEMP_SUFFIX = ".temp.mp4"  # Original de un post-procesado en curso: nunca se borra desde aquí
+PART_SUFFIX = ".part"      # Copia en curso desde la cola local
+INGESTA_TTL = 300          # Segundos que se reutiliza el ritmo de grabación calculado (recorre todo el índice)
+
 
 class GestorAlmacenamiento:
-    def __init__(self, path_videos, max_days=7, max_usage_percent=90, cleaning_percent=5):
+    """
+    Limpieza del NAS por antigüedad y por espacio.
+    - Índice en memoria de los eventos (clip + miniatura) con su tamaño, fecha, confianza de
+      la IA y si están fijados, ordenado por prioridad de borrado (ver RetentionIndex). Se
+      mantiene con los eventos del grabador, con inotify y con un recorrido completo del
+      directorio cada STORAGE_CLEANUP_INTERVAL.
+    - El uso del disco se comprueba cada STORAGE_CHECK_INTERVAL segundos y al cerrarse cada
+      fichero: al pasar de max_usage_percent se calcula de una vez qué eventos borrar (los de
+      menor prioridad hasta liberar lo necesario) sin volver a listar ni medir el disco.
+    - El clip y su miniatura se borran juntos. No se tocan ficheros modificados hace menos
+      de STORAGE_MIN_AGE segundos (grabación o post-procesado en curso) ni eventos fijados.
+    """
+    def __init__(self, path_videos, max_days=7, max_usage_percent=90, cleaning_percent=5, catalog=None):
         self.path = path_videos
         self.max_days = max_days
         self.max_usage_percent = max_usage_percent
         self.cleaning_percent = cleaning_percent
-        
+        self.catalog = catalog  # RecordingCatalog a mantener al día con los borrados
+
         # Configurar logging básico si no existe
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - [ALMACENAMIENTO] - %(message)s')
         self.logger = logging.getLogger(__name__)
 
+        self.lock = threading.Lock()
+        self.indice = RetentionIndex()
+        self.scores_pendientes = {}  # clave -> confianza de eventos que aún están en la cola local
+        self.despertar = threading.Event()
+        self.rescan_pendiente = False
+        self.watcher = None
+        self.inotify_activo = False
+        self.ultimo_escaneo = 0.0
+        self.eliminados = 0
+        self.bytes_liberados = 0
+        self.ingesta = (0.0, 0.0)  # (momento del cálculo, bytes por día)
+        self.thread = None
+
+    # --- Índice ---
+
+    def _indexar(self, nombre, tamano, mtime):
+        """Alta o actualización de un fichero en el índice (llamar con self.lock)."""
+        if nombre.endswith(TEMP_SUFFIX) or nombre.endswith(PART_SUFFIX):
+            return
+        clave = self.indice.add_file(nombre, tamano, mtime)
+        if clave in self.scores_pendientes:
+            self.indice.set_score(clave, self.scores_pendientes.pop(clave))
+
+    def registrar_archivo(self, path, score=None):
+        """El grabador (o la alerta, con la confianza de la IA) terminó de escribir un fichero en el NAS."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        nombre = os.path.basename(path)
+        en_nas = os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.path)
+        with self.lock:
+            if en_nas:
+                self._indexar(nombre, st.st_size, st.st_mtime)
+            if score is not None and not self.indice.set_score(clave_evento(nombre), score):
+                # Aún en la cola local: se aplicará al llegar al NAS
+                self.scores_pendientes[clave_evento(nombre)] = score
+        self.despertar.set()
+
+    def fijar(self, nombre, pinned=True):
+        """Marca un evento como "conservar" (no se borra por antigüedad ni por espacio)."""
+        with self.lock:
+            return self.indice.set_pinned(clave_evento(nombre), pinned)
+
+    def escanear(self):
+        """Recorrido completo del directorio: reconstruye el índice (cambios hechos desde otras máquinas)."""
+        if not os.path.exists(self.path):
+            return
+        ficheros = []
+        with os.scandir(self.path) as it:
+            for entrada in it:
+                try:
+                    if entrada.is_file():
+                        st = entrada.stat()
+                        ficheros.append((entrada.name, st.st_size, st.st_mtime))
+                except OSError:
+                    continue
+        # Confianza de la IA y eventos fijados, guardados en el catálogo
+        metadatos = self.catalog.retention_metadata() if self.catalog else {}
+        with self.lock:
+            self.indice.clear()
+            for nombre, tamano, mtime in ficheros:
+                self._indexar(nombre, tamano, mtime)
+            for nombre, (score, pinned) in metadatos.items():
+                clave = clave_evento(nombre)
+                if score is not None:
+                    self.indice.set_score(clave, score)
+                if pinned:
+                    self.indice.set_pinned(clave, True)
+            self.ultimo_escaneo = time.time()
+            eventos, total = len(self.indice), self.indice.bytes_total
+        self.logger.info(f"Índice de almacenamiento: {eventos} eventos, {total / (1024 * 1024):.1f} MB")
+
+    def _on_inotify(self, mask, nombre):
+        if mask & (IN_Q_OVERFLOW | IN_IGNORED) or nombre is None:
+            # Se perdieron eventos (o el directorio desapareció): recorrido completo en el próximo ciclo
+            self.rescan_pendiente = True
+            self.despertar.set()
+            return
+        if mask & (IN_DELETE | IN_MOVED_FROM):
+            with self.lock:
+                self.indice.remove_file(nombre)
+            # Borrados desde fuera del sistema (p. ej. por Samba en esta máquina). Los movimientos
+            # no: el post-procesado aparta el clip como .temp.mp4 mientras lo convierte
+            if self.catalog and mask & IN_DELETE:
+                self.catalog.remove(nombre)
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            self.registrar_archivo(os.path.join(self.path, nombre))
+
+    # --- Uso del disco ---
+
     def obtener_espacio_usado(self):
         """Devuelve el porcentaje de uso del disco donde está la carpeta."""
         try:
@@ -33,7 +148,7 @@ class GestorAlmacenamiento:
             total_mb = total / (1024 * 1024)
             used_mb = used / (1024 * 1024)
             free_mb = free / (1024 * 1024)
-            
+
             return {
                 "total_mb": total_mb,
                 "used_mb": used_mb,
@@ -43,78 +158,139 @@ class GestorAlmacenamiento:
         except FileNotFoundError:
             return None
 
-    def limpiar_por_antiguedad(self):
-        """Elimina archivos más antiguos que max_days."""
-        if not os.path.exists(self.path):
-            return
+    def estadisticas(self):
+        with self.lock:
+            indice = self.indice.stats()
+        ingesta = self._ingesta()
+        archivados, ahorro = self.catalog.archive_stats() if self.catalog else (0, 0)
+        return {
+            "indexed_events": indice["events"],
+            "indexed_mb": round(indice["bytes"] / (1024 * 1024), 1),
+            "pinned_events": indice["pinned"],
+            "person_events": indice["with_person"],
+            "inotify": self.inotify_activo,
+            "deleted_files": self.eliminados,
+            "freed_mb": round(self.bytes_liberados / (1024 * 1024), 1),
+            "last_scan": self.ultimo_escaneo,
+            "archived_events": archivados,
+            "archive_saved_mb": round(ahorro / (1024 * 1024), 1),
+            "ingest_mb_per_day": round(ingesta / (1024 * 1024), 1),
+            # Días de grabación que caben en el espacio liberado por el archivo, al ritmo actual
+            "extra_retention_days": round(ahorro / ingesta, 2) if ingesta else 0.0,
+        }
 
+    def _ingesta(self):
+        """
+        Ritmo de grabación a calidad completa (los clips más recientes que el archivo), en bytes
+        por día. Recorre todo el índice: se recalcula como mucho cada INGESTA_TTL segundos.
+        """
         ahora = time.time()
-        limite_segundos = self.max_days * 86400 # días a segundos
-
-        self.logger.info(f"Comprobando archivos antiguos (> {self.max_days} días)...")
-        
-        archivos_eliminados = 0
-        for filename in os.listdir(self.path):
-            filepath = os.path.join(self.path, filename)
-            
-            # Solo procesar archivos (evitar borrar directorios por error)
-            if not os.path.isfile(filepath):
-                continue
-                
-            estat = os.stat(filepath)
-            edad = ahora - estat.st_mtime
-            
-            if edad > limite_segundos:
+        calculado, valor = self.ingesta
+        if ahora - calculado < INGESTA_TTL:
+            return valor
+        with self.lock:
+            valor = self.indice.ingest_rate(config.ARCHIVE_AFTER_DAYS * 86400, ahora)
+        self.ingesta = (ahora, valor)
+        return valor
+
+    # --- Políticas de limpieza ---
+
+    def _borrar_eventos(self, seleccion, motivo):
+        """Borra los ficheros de los eventos elegidos (clip y miniatura juntos). Retorna bytes liberados."""
+        liberados = 0
+        for clave, ficheros in seleccion:
+            for nombre, (tamano, _) in ficheros.items():
+                filepath = os.path.join(self.path, nombre)
                 try:
                     os.remove(filepath)
-                    self.logger.info(f"Eliminado por antigüedad: {filename}")
-                    archivos_eliminados += 1
+                    liberados += tamano
+                    self.eliminados += 1
+                except FileNotFoundError:
+                    pass
                 except OSError as e:
-                    self.logger.error(f"Error al eliminar {filename}: {e}")
-        
-        if archivos_eliminados > 0:
-            self.logger.info(f"Total eliminados por antigüedad: {archivos_eliminados}")
+                    self.logger.error(f"Error al eliminar {nombre}: {e}")
+                    continue
+                with self.lock:
+                    self.indice.remove_file(nombre)
+                if self.catalog:
+                    self.catalog.remove(filepath)
+            self.logger.info(f"Eliminado por {motivo}: {clave} ({', '.join(ficheros)})")
+        self.bytes_liberados += liberados
+        return liberados
+
+    def limpiar_por_antiguedad(self):
+        """
+        Elimina los eventos más antiguos que max_days. La antigüedad es la de la fecha efectiva:
+        las personas confirmadas duran más, los eventos fijados no caducan.
+        """
+        with self.lock:
+            seleccion = self.indice.expired(time.time() - self.max_days * 86400)
+        if seleccion:
+            self.logger.info(f"Eventos caducados (más de {self.max_days} días de fecha efectiva): {len(seleccion)}")
+            self._borrar_eventos(seleccion, "antigüedad")
 
     def limpiar_por_espacio(self):
-        """Si el espacio supera el umbral, borra los videos más antiguos hasta bajar un 5% del límite."""
-        uso_actual = self.obtener_espacio_usado()
-        
+        """
+        Si el uso supera el umbral, borra los eventos de menor prioridad hasta bajar cleaning_percent
+        por debajo del límite. La selección se calcula de una vez con los tamaños del índice.
+        """
+        try:
+            total, used, _ = shutil.disk_usage(self.path)
+        except FileNotFoundError:
+            self.logger.error(f"Ruta no encontrada: {self.path}")
+            return
+        uso_actual = used / total * 100
         if uso_actual < self.max_usage_percent:
             return
 
         self.logger.warning(f"Espacio crítico ({uso_actual:.1f}%). Iniciando limpieza de emergencia...")
-        
-        # Objetivo: Bajar un 5% por debajo del límite para no estar borrando constantemente
+        # Objetivo: bajar cleaning_percent por debajo del límite para no estar borrando constantemente
         objetivo_uso = self.max_usage_percent - self.cleaning_percent
-        
-        # Obtener lista de archivos con su fecha de modificación
-        archivos = []
-        for f in os.listdir(self.path):
-            fp = os.path.join(self.path, f)
-            if os.path.isfile(fp):
-                archivos.append((fp, os.path.getmtime(fp)))
-        
-        # Ordenar por fecha (más antiguos primero)
-        archivos.sort(key=lambda x: x[1])
-        
-        eliminados = 0
-        for filepath, _ in archivos:
-            if self.obtener_espacio_usado() <= objetivo_uso:
-                break
-                
-            try:
-                os.remove(filepath)
-                self.logger.info(f"Eliminado por espacio: {os.path.basename(filepath)}")
-                eliminados += 1
-            except OSError as e:
-                self.logger.error(f"Error al eliminar {filepath}: {e}")
-                
-        self.logger.info(f"Limpieza de espacio completada. Archivos eliminados: {eliminados}. Uso actual: {self.obtener_espacio_usado():.1f}%")
+        por_liberar = used - objetivo_uso / 100 * total
+
+        with self.lock:
+            seleccion, acumulado = self.indice.select(por_liberar, time.time() - config.STORAGE_MIN_AGE)
+        if acumulado < por_liberar:
+            self.logger.warning(f"Las grabaciones no fijadas solo suman {acumulado / (1024 * 1024):.1f} MB de los "
+                                f"{por_liberar / (1024 * 1024):.1f} MB a liberar")
+
+        liberados = self._borrar_eventos(seleccion, "espacio")
+        self.logger.info(f"Limpieza de espacio completada. Eventos eliminados: {len(seleccion)} "
+                         f"({liberados / (1024 * 1024):.1f} MB). Uso actual: {self.obtener_espacio_usado():.1f}%")
 
     def ejecutar_limpieza(self):
         """Ejecuta ambas políticas de limpieza."""
         try:
-            self.limpiar_por_antiguedad()
-            self.limpiar_por_espacio()
+            with metrics.stage("storage_cleanup").time():
+                self.limpiar_por_antiguedad()
+                self.limpiar_por_espacio()
         except Exception as e:
             self.logger.error(f"Error durante el ciclo de limpieza: {e}")
+
+    # --- Hilo del gestor ---
+
+    def iniciar(self):
+        """Índice inicial, vigilancia con inotify y comprobaciones periódicas en un hilo propio."""
+        self.thread = threading.Thread(target=self._run, name="storage", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        self.escanear()
+        if config.STORAGE_USE_INOTIFY and os.path.exists(self.path):
+            self.watcher = DirectoryWatcher(self.path, self._on_inotify)
+            self.inotify_activo = self.watcher.start()
+        self.ejecutar_limpieza()
+        while True:
+            # Se despierta antes si se cierra un fichero o inotify pide un recorrido
+            self.despertar.wait(config.STORAGE_CHECK_INTERVAL)
+            self.despertar.clear()
+            try:
+                if self.rescan_pendiente or time.time() - self.ultimo_escaneo >= config.STORAGE_CLEANUP_INTERVAL:
+                    self.rescan_pendiente = False
+                    self.escanear()
+                    # Cambios hechos fuera del sistema (p. ej. borrados desde otra máquina)
+                    if self.catalog:
+                        self.catalog.reconcile()
+                self.ejecutar_limpieza()
+            except Exception as e:
+                self.logger.error(f"Error en el gestor de almacenamiento: {e}")
@@ -0,0 +1,69 @@
+import threading
+import cv2
+import config
+from modules import metrics
+
+class FrameBroadcaster:
+    """
+    Difusión del streaming MJPEG.
+    Cada frame nuevo se codifica a JPEG una sola vez (por el primer cliente que lo pide)
+    y se comparte con el resto. Los clientes esperan en una condición hasta que exista
+    un frame con número de secuencia mayor que el último que recibieron.
+    """
+    def __init__(self, quality=None):
+        self.quality = quality if quality is not None else config.STREAM_JPEG_QUALITY
+        self.condition = threading.Condition()
+        self.seq = 0
+        self._frame = None
+
+        # Caché del último JPEG (protegida por su propio lock para no bloquear al publicador)
+        self._encode_lock = threading.Lock()
+        self._jpeg = None
+        self._jpeg_seq = 0
+        self.encoded_frames = 0
+        self.encode_counter = metrics.counter("vigilancia_frames_encoded_total", "Frames codificados a JPEG para el streaming")
+        self.encode_time = metrics.stage("jpeg_encode")
+
+    def publish(self, frame):
+        """Publica un frame nuevo (no se copia: el llamador no debe modificarlo después)."""
+        with self.condition:
+            self._frame = frame
+            self.seq += 1
+            self.condition.notify_all()
+            return self.seq
+
+    def wait_for_frame(self, last_seq=0, timeout=1.0):
+        """
+        Espera a que haya un frame más nuevo que last_seq.
+        Retorna (seq, jpeg_bytes) o (last_seq, None) si vence el timeout.
+        """
+        with self.condition:
+            ready = self.condition.wait_for(lambda: self.seq > last_seq and self._frame is not None, timeout)
+            if not ready:
+                return last_seq, None
+            seq, frame = self.seq, self._frame
+        return self._encode(seq, frame)
+
+    def get_latest(self):
+        """JPEG del último frame publicado sin esperar (o None)."""
+        with self.condition:
+            seq, frame = self.seq, self._frame
+        if frame is None:
+            return None
+        return self._encode(seq, frame)[1]
+
+    def _encode(self, seq, frame):
+        with self._encode_lock:
+            # Si otro cliente ya codificó este frame (o uno posterior) se reutiliza
+            if self._jpeg_seq < seq:
+                with self.encode_time.time():
+                    flag, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                if flag:
+                    self._jpeg = encoded.tobytes()
+                    self._jpeg_seq = seq
+                    self.encoded_frames += 1
+                    self.encode_counter.inc()
+            if self._jpeg_seq < seq:
+                # Fallo de codificación: se avanza igualmente para no reintentar en bucle
+                return seq, None
+            return self._jpeg_seq, self._jpeg
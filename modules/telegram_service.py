@@ -2,12 +2,16 @@ import logging
 import threading
 import time
 import os
+import io
+import datetime
 import requests
 import asyncio
 from telegram import Update, Bot
 from telegram.ext import ApplicationBuilder, ContextTypes, MessageHandler, filters
 from telegram.ext import CommandHandler
 import config
+from modules import metrics
+from modules.profiler import profiler, ProfilerBusy
 
 # Configuración de logs
 logging.basicConfig(level=logging.INFO)
@@ -45,6 +49,10 @@ class TelegramService:
             self.app.add_handler(CommandHandler("vigilancia", self.handle_modo2))
             self.app.add_handler(CommandHandler("estado", self.handle_estado))
             
+            # Diagnóstico: /perfil [segundos] y /memoria [segundos]
+            self.app.add_handler(CommandHandler("perfil", self.handle_perfil))
+            self.app.add_handler(CommandHandler("memoria", self.handle_memoria))
+            
             self.bot = self.app.bot
             
         except Exception as e:
@@ -55,7 +63,7 @@ class TelegramService:
             return
 
         # Ejecutar polling en un hilo separado
-        self.thread = threading.Thread(target=self._run_polling, daemon=True)
+        self.thread = threading.Thread(target=self._run_polling, name="telegram", daemon=True)
         self.thread.start()
         logger.info("Servicio Telegram iniciado.")
 
@@ -107,7 +115,8 @@ class TelegramService:
                 with open(image_path, 'rb') as photo:
                     files = {'photo': photo}
                     data = {'chat_id': self.chat_id, 'caption': caption}
-                    response = requests.post(url, files=files, data=data)
+                    with metrics.stage("telegram_send").time():
+                        response = requests.post(url, files=files, data=data)
                     if response.status_code != 200:
                          logger.error(f"Error al enviar a Telegram: {response.text}")
                     else:
@@ -179,3 +188,31 @@ class TelegramService:
         except Exception as e:
             logger.error(f"Error en /estado: {e}")
             await update.message.reply_text(f" Error: {e}")
+    
+    async def handle_perfil(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /perfil [segundos]: perfil de todos los hilos como documento de texto."""
+        await self._run_profiler(update, context, "profile", profiler.sample)
+
+    async def handle_memoria(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /memoria [segundos]: top de reservas de memoria como documento de texto."""
+        await self._run_profiler(update, context, "memory", profiler.memory)
+
+    async def _run_profiler(self, update, context, kind, run):
+        # Solo desde el chat configurado: el perfil expone rutas y nombres internos
+        if str(update.effective_chat.id) != str(self.chat_id):
+            logger.warning(f"/{kind} rechazado desde el chat {update.effective_chat.id}")
+            return
+        try:
+            seconds = float(context.args[0]) if context.args else config.PROFILER_DEFAULT_SECONDS
+            seconds = min(seconds, config.PROFILER_MAX_SECONDS)
+            await update.message.reply_text(f"Capturando durante {seconds:.0f} s...")
+            # En un hilo aparte: el bucle de Telegram sigue atendiendo mientras dura
+            text, stats = await asyncio.to_thread(run, seconds)
+            name = datetime.datetime.now().strftime(f"{kind}_%Y%m%d_%H%M%S.txt")
+            summary = ", ".join(f"{key}: {value}" for key, value in stats.items())
+            await update.message.reply_document(document=io.BytesIO(text.encode()), filename=name, caption=summary)
+        except ProfilerBusy as e:
+            await update.message.reply_text(f"INFO: {e}")
+        except Exception as e:
+            logger.error(f"Error en /{kind}: {e}")
+            await update.message.reply_text(f" Error: {e}")
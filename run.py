@@ -1,6 +1,4 @@
 import os
-import time
-import threading
 from flask import Flask
 from app.routes import main_bp
 from modules.camera import VideoCamera
@@ -10,13 +8,12 @@ from modules.telegram_service import TelegramService
 from modules.vpn_service import start_vpn
 from modules.samba_service import ensure_samba_started
 from modules.mode_manager import ModeManager
+from modules.postprocess import PostProcessQueue
+from modules.catalog import RecordingCatalog
+from modules.spool import SpoolMover
+from modules.archive import ArchiveTranscoder
 import config
 
-def start_storage_manager(manager):
-    while True:
-        manager.ejecutar_limpieza()
-        time.sleep(config.STORAGE_CLEANUP_INTERVAL)
-
 def create_app():
     # Helper para crear la app 
     app = Flask(__name__, template_folder="app/templates", static_folder="app/static")
@@ -49,8 +46,14 @@ if __name__ == "__main__":
     # Inicialización de módulos
     camera = VideoCamera(mode_manager=mode_manager)
     sensors = SensorManager(mode_manager=mode_manager, camera=camera)
-    storage = GestorAlmacenamiento(config.PATH_NAS, config.MAX_DAYS_STORAGE, config.MAX_USAGE_PERCENT, config.STORAGE_CLEANUP_PERCENT)
+    # Con la cola local, el catálogo lista también los clips que aún no llegaron al NAS
+    catalog = RecordingCatalog(config.PATH_NAS, extra_paths=[config.SPOOL_DIR] if config.SPOOL_ENABLED else ())
+    storage = GestorAlmacenamiento(config.PATH_NAS, config.MAX_DAYS_STORAGE, config.MAX_USAGE_PERCENT, config.STORAGE_CLEANUP_PERCENT, catalog=catalog)
+    spool = SpoolMover(catalog=catalog, storage=storage) if config.SPOOL_ENABLED else None
     telegram = TelegramService(config.TELEGRAM_TOKEN, config.TELEGRAM_CHAT_ID, mode_manager=mode_manager)
+    postprocess = PostProcessQueue(config.PATH_NAS, catalog=catalog, spool=spool)
+    archive = ArchiveTranscoder(config.PATH_NAS, catalog, storage,
+                                is_quiet=lambda: camera.is_quiet(config.ARCHIVE_QUIET_SECONDS)) if config.ARCHIVE_ENABLED else None
     
     # Configuración de la web app y contexto
     app = create_app()
@@ -58,11 +61,30 @@ if __name__ == "__main__":
     app.sensors = sensors
     app.telegram = telegram
     app.mode_manager = mode_manager
+    app.postprocess = postprocess
+    app.catalog = catalog
+    app.storage = storage
+    app.spool = spool
+    app.archive = archive
     
     # Vincular cámara con Telegram para alertas
     camera.set_telegram_service(telegram)
+    camera.set_postprocess_queue(postprocess)
+    camera.set_catalog(catalog)
+    camera.set_storage_manager(storage)
+    camera.set_spool(spool)
     
     # Inicio de hilos secundarios
+    print("Catálogo de grabaciones activo...")
+    catalog.start()
+    
+    print("Cola de post-procesado activa...")
+    postprocess.start()
+    
+    if spool:
+        print("Cola local de grabación activa...")
+        spool.start(busy=postprocess.is_pending)
+    
     print("Iniciando Cámara...")
     camera.start()
     
@@ -73,9 +95,10 @@ if __name__ == "__main__":
     telegram.start()
     
     print("Gestor de almacenamiento activo...")
-    t_storage = threading.Thread(target=start_storage_manager, args=(storage,))
-    t_storage.daemon = True
-    t_storage.start()
+    storage.iniciar()
+    
+    if archive and archive.start():
+        print("Archivo de clips antiguos activo...")
     
     # Print Initial Storage Status
     stats = storage.obtener_estado_detallado()
@@ -103,3 +126,7 @@ if __name__ == "__main__":
         print("Shutting down...")
         camera.stop()
         sensors.stop_button_monitoring()
+        if spool:
+            spool.stop()
+        if archive:
+            archive.stop()
@@ -0,0 +1,103 @@
+"""
+Benchmark del catálogo de grabaciones (/api/recordings) frente al listado directo del disco.
+
+Crea un directorio temporal con N clips vacíos (y una miniatura de cada dos), lo indexa
+con una reconciliación y mide las consultas de la galería: primera página, una página
+profunda (cursor), un rango de fechas y una consulta de cambios (?since=). Como referencia
+mide también el listado anterior (listdir + getmtime + stat + exists por clip); en un NAS
+por CIFS cada una de esas llamadas es un viaje de red.
+
+Uso:
+    python scripts/bench_catalog.py --clips 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from modules.catalog import RecordingCatalog
+
+
+def populate(path, clips):
+    now = time.time()
+    for i in range(clips):
+        name = f"alerta_{i:07d}"
+        mtime = now - (clips - i) * 60  # Un clip por minuto
+        clip = os.path.join(path, name + ".mp4")
+        open(clip, "wb").close()
+        os.utime(clip, (mtime, mtime))
+        if i % 2 == 0:
+            open(os.path.join(path, name + ".jpg"), "wb").close()
+    return now
+
+
+def legacy_listing(path):
+    """El /api/recordings anterior, sin la serialización JSON."""
+    files = [f for f in os.listdir(path) if f.endswith(".mp4")]
+    files.sort(key=lambda x: os.path.getmtime(os.path.join(path, x)), reverse=True)
+    result = []
+    for f in files:
+        st = os.stat(os.path.join(path, f))
+        thumb = os.path.exists(os.path.join(path, f.rsplit(".", 1)[0] + ".jpg"))
+        result.append((f, st.st_size, st.st_mtime, thumb))
+    return result
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return result, float(np.percentile(times, 50)), float(np.percentile(times, 90))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", type=int, default=100000, help="Clips sintéticos")
+    parser.add_argument("--repeat", type=int, default=50, help="Repeticiones de cada consulta")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        videos = os.path.join(tmp, "nas")
+        os.makedirs(videos)
+        print(f"Creando {args.clips} clips...")
+        now = populate(videos, args.clips)
+
+        catalog = RecordingCatalog(videos, db_path=os.path.join(tmp, "recordings.db"))
+        t0 = time.perf_counter()
+        catalog.reconcile()
+        print(f"Reconciliación inicial: {time.perf_counter() - t0:.2f} s ({catalog.stats()['clips']} clips)")
+        t0 = time.perf_counter()
+        catalog.reconcile()
+        print(f"Reconciliación sin cambios: {time.perf_counter() - t0:.2f} s")
+
+        _, cursor = catalog.list(60)
+        for _ in range(args.clips // 120):  # Media lista más abajo
+            _, cursor = catalog.list(60, cursor)
+        version = catalog.version
+        catalog.add(os.path.join(videos, "alerta_0000000.mp4"))
+        catalog.remove(os.path.join(videos, "alerta_0000001.mp4"))
+
+        cases = [
+            ("primera página (60)", lambda: catalog.list(60)),
+            ("página a mitad (cursor)", lambda: catalog.list(60, cursor)),
+            ("rango 02:00-05:00 de ayer", lambda: catalog.list(60, None, now - 86400 - 3 * 3600, now - 86400)),
+            ("cambios ?since=", lambda: catalog.changes(version)),
+            ("estadísticas", catalog.stats),
+        ]
+        print(f"{'consulta':<28} {'p50 ms':>8} {'p90 ms':>8}")
+        for name, fn in cases:
+            _, p50, p90 = timed(fn, args.repeat)
+            print(f"{name:<28} {p50:>8.3f} {p90:>8.3f}")
+        _, p50, p90 = timed(lambda: legacy_listing(videos), max(1, args.repeat // 10))
+        print(f"{'listado anterior (disco)':<28} {p50:>8.1f} {p90:>8.1f}")
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
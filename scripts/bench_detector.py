@@ -0,0 +1,119 @@
+"""
+Benchmark del detector de personas: en el mismo proceso frente a un pool de procesos.
+
+Mientras el detector trabaja sin pausa (un hilo por inferencia simultánea, como el motor
+de inferencia), el hilo principal ejecuta la detección de movimiento sobre los mismos
+frames. Así se mide a la vez el rendimiento de la IA y cuánto frena al resto del
+programa (GIL compartido en el mismo proceso).
+
+Uso:
+    python scripts/bench_detector.py --seconds 20 --workers 1 2 3
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import config
+from modules.detector import PersonDetector
+from modules.detector_pool import DetectorPool
+from modules.frame_sources import SyntheticMotionSource, VideoFileSource
+from modules.motion import MotionDetector
+
+
+def load_frames(args):
+    if args.clip:
+        source = VideoFileSource(args.clip, realtime=False)
+    else:
+        source = SyntheticMotionSource(duration=args.frames / config.FPS, realtime=False)
+    source.start()
+    motion = MotionDetector()
+    frames = []
+    while len(frames) < args.frames:
+        frame, _, lores = source.read()
+        if frame is None:
+            break
+        _, boxes = motion.detect(motion.prepare(frame, lores))
+        frames.append((frame, boxes))
+    source.stop()
+    return frames
+
+
+def run(detector, threads, frames, seconds):
+    """Retorna (inferencias/s, ms medios por inferencia, ms por frame de movimiento p50, p90)."""
+    stop = threading.Event()
+    latencies = []
+
+    def infer_loop(offset):
+        i = offset
+        while not stop.is_set():
+            frame, boxes = frames[i % len(frames)]
+            t0 = time.perf_counter()
+            detector.detect_person_in_regions(frame, boxes)
+            latencies.append(time.perf_counter() - t0)
+            i += threads
+
+    workers = [threading.Thread(target=infer_loop, args=(i,), daemon=True) for i in range(threads)]
+    for t in workers:
+        t.start()
+
+    motion = MotionDetector()
+    motion_ms = []
+    start = time.perf_counter()
+    i = 0
+    while time.perf_counter() - start < seconds:
+        frame, _ = frames[i % len(frames)]
+        t0 = time.perf_counter()
+        motion.detect(motion.prepare(frame))
+        motion_ms.append((time.perf_counter() - t0) * 1000)
+        i += 1
+        # Ritmo de la cámara
+        time.sleep(max(0.0, 1.0 / config.FPS - (time.perf_counter() - t0)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for t in workers:
+        t.join()
+
+    count = len(latencies)
+    return (count / elapsed, 1000 * sum(latencies) / count if count else 0.0,
+            float(np.percentile(motion_ms, 50)), float(np.percentile(motion_ms, 90)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clip", help="Vídeo a usar (por defecto: escena sintética)")
+    parser.add_argument("--frames", type=int, default=300, help="Frames a cargar")
+    parser.add_argument("--seconds", type=float, default=20.0, help="Duración de cada medida")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 3], help="Tamaños de pool a medir")
+    args = parser.parse_args()
+
+    frames = load_frames(args)
+    print(f"{len(frames)} frames, {os.cpu_count()} CPUs")
+
+    detector = PersonDetector()
+    if not detector.is_ready():
+        raise SystemExit("La IA no está disponible (MediaPipe o el modelo no encontrados)")
+    cases = [("mismo proceso", detector, 1)]
+    for n in args.workers:
+        cases.append((f"pool x{n}", None, n))
+
+    print(f"{'backend':<15} {'inf/s':>7} {'ms/inf':>8} {'mov. p50 ms':>12} {'mov. p90 ms':>12}")
+    for name, instance, threads in cases:
+        if instance is None:
+            instance = DetectorPool(threads)
+            if not instance.is_ready():
+                instance.close()
+                raise SystemExit("Los workers no pudieron cargar el modelo")
+        try:
+            rate, infer_ms, p50, p90 = run(instance, threads, frames, args.seconds)
+        finally:
+            instance.close()
+        print(f"{name:<15} {rate:>7.1f} {infer_ms:>8.1f} {p50:>12.2f} {p90:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark de la detección de movimiento: coste por frame según la resolución de análisis
+y las zonas de interés.
+
+Uso:
+    python scripts/bench_motion.py --frames 300
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from modules.frame_sources import SyntheticMotionSource
+from modules.motion import MotionDetector
+
+
+def load_frames(count):
+    source = SyntheticMotionSource(duration=count / config.FPS, realtime=False)
+    source.start()
+    frames = []
+    while True:
+        frame, _, _ = source.read()
+        if frame is None:
+            return frames
+        frames.append(frame)
+
+
+def measure(detector, frames):
+    triggers = 0
+    start = time.perf_counter()
+    for frame in frames:
+        moving, _ = detector.detect(detector.prepare(frame))
+        triggers += moving
+    return (time.perf_counter() - start) / len(frames) * 1000.0, triggers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames)
+    full = config.RESOLUTION
+    w, h = full
+    cases = [
+        ("completa", MotionDetector(analysis_size=full, include_zones=[], exclude_zones=[])),
+        (f"{w // 2}x{h // 2}", MotionDetector(analysis_size=(w // 2, h // 2), include_zones=[], exclude_zones=[])),
+        (f"{w // 4}x{h // 4}", MotionDetector(analysis_size=(w // 4, h // 4), include_zones=[], exclude_zones=[])),
+        (f"{w // 2}x{h // 2} + ROI", MotionDetector(
+            analysis_size=(w // 2, h // 2),
+            include_zones=[[(0, 0.25), (1, 0.25), (1, 1), (0, 1)]],
+            exclude_zones=[[(0.8, 0.25), (1, 0.25), (1, 0.6), (0.8, 0.6)]])),
+    ]
+
+    baseline = None
+    print(f"{'análisis':<18} {'ms/frame':>9} {'x mejora':>9} {'frames con mov.':>16}")
+    for name, detector in cases:
+        ms, triggers = measure(detector, frames)
+        baseline = baseline or ms
+        print(f"{name:<18} {ms:>9.3f} {baseline / ms:>9.1f} {triggers:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Benchmark de reproducción del pipeline de vigilancia (movimiento -> IA -> grabación).
+
+Reproduce un clip grabado (o una escena sintética) tan rápido como sea posible a través
+de VideoCamera, sin Picamera2, y muestra frames/s, percentiles de latencia por etapa y
+cuántas grabaciones y detecciones se dispararon. Los clips se escriben en un directorio
+temporal que se borra al terminar.
+
+Uso:
+    python scripts/bench_pipeline.py                       # escena sintética de 60 s
+    python scripts/bench_pipeline.py --clip grabacion.mp4  # vídeo o carpeta de imágenes
+    python scripts/bench_pipeline.py --ai off
+    python scripts/bench_pipeline.py --light-drift 40 --compare-background
+    python scripts/bench_pipeline.py --clip grabacion.mp4 --ai on --compare-crop
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+
+class StageTimings:
+    """Acumula las duraciones de cada etapa para calcular percentiles exactos."""
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def observe(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+    def summary(self, percentiles=(50, 90, 99)):
+        rows = {}
+        for stage, values in self.samples.items():
+            arr = np.asarray(values) * 1000.0
+            rows[stage] = {
+                "count": len(values),
+                "mean_ms": float(arr.mean()),
+                **{f"p{p}_ms": float(np.percentile(arr, p)) for p in percentiles},
+            }
+        return rows
+
+
+def build_source(args):
+    from modules.frame_sources import VideoFileSource, SyntheticMotionSource
+    if args.clip:
+        return VideoFileSource(args.clip, fps=args.fps, realtime=False)
+    return SyntheticMotionSource(duration=args.seconds, fps=args.fps, realtime=False,
+                                 light_drift=args.light_drift, drift_period=args.drift_period)
+
+
+def run_replay(args, configure=None):
+    """Ejecuta una reproducción completa y retorna (camera, timings, segundos)."""
+    from modules.camera import VideoCamera
+
+    config.USE_AI_DETECTION = args.ai != "off"
+    config.BACKGROUND_MODEL = args.background
+    config.AI_CROP_INFERENCE = args.ai_crop == "on"
+    camera = VideoCamera(source=build_source(args))
+    if camera.source is None:
+        raise SystemExit("No se pudo abrir la fuente de vídeo")
+    if args.ai == "on" and (camera.detector is None or not camera.detector.is_ready()):
+        raise SystemExit("La IA no está disponible (MediaPipe o el modelo no encontrados)")
+    camera.optimize_recordings = args.postprocess
+    camera.timings = StageTimings()
+    if configure:
+        configure(camera)
+
+    camera.is_running = True
+    start = time.perf_counter()
+    camera._process_video()
+    elapsed = time.perf_counter() - start
+    camera.source.stop()
+    return camera, camera.timings, elapsed
+
+
+def print_report(title, camera, timings, elapsed):
+    frames = camera.stats["frames"]
+    print(f"\n== {title} ==")
+    print(f"Frames: {frames}  Tiempo: {elapsed:.2f} s  Velocidad: {frames / elapsed:.1f} frames/s")
+    print(f"{'etapa':<10} {'n':>7} {'media':>8} {'p50':>8} {'p90':>8} {'p99':>8}  (ms)")
+    for stage, row in sorted(timings.summary().items()):
+        print(f"{stage:<10} {row['count']:>7} {row['mean_ms']:>8.2f} {row['p50_ms']:>8.2f} "
+              f"{row['p90_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+    print("Contadores: " + ", ".join(f"{k}={v}" for k, v in camera.stats.items()))
+
+
+def track_false_motion(camera):
+    """
+    Cuenta lo que ocurre en frames sin movimiento real (fuera de las ráfagas de la escena
+    sintética): frames con movimiento, disparos y llamadas a la IA en falso, y frames grabados
+    sin nada que grabar.
+    """
+    in_event = getattr(camera.source, "in_event", None)
+    counters = ("motion_frames", "triggers", "ai_calls")
+    false = dict.fromkeys(counters + ("recording_frames",), 0)
+    camera.false_stats = false if in_event else None
+    if not in_event:
+        return
+    process = camera._process_frame
+
+    def process_frame(frame, ahora, lores=None, seq=0):
+        before = {key: camera.stats[key] for key in counters}
+        process(frame, ahora, lores, seq)
+        if not in_event(ahora):
+            for key in counters:
+                false[key] += camera.stats[key] - before[key]
+            false["recording_frames"] += camera.grabando
+    camera._process_frame = process_frame
+
+
+def compare_background(args):
+    """
+    Misma reproducción con cada modelo de fondo. En la escena sintética se sabe qué frames
+    tienen movimiento real: se cuentan los frames con movimiento, los disparos y las llamadas
+    a la IA en falso (cambios de luz, ruido) y cuántos evita cada modelo frente a 'static'.
+    Sin IA, cada frame con movimiento en falso es una llamada que el filtro de IA tendría que
+    hacer (sin persona no se graba y se sigue preguntando): se muestran como estimación.
+    """
+    results = {}
+    for model in ("static", "running_avg", "mog2"):
+        args.background = model
+        camera, timings, elapsed = run_replay(args, configure=track_false_motion)
+        print_report(f"Fondo: {model}", camera, timings, elapsed)
+        results[model] = (camera.stats, camera.false_stats)
+
+    ai_on = args.ai != "off"
+    base_stats, base_false = results["static"]
+    if base_false is None:
+        # Vídeo real: sin referencia de qué movimiento es falso
+        print(f"\n{'modelo':<12} {'frames mov.':>12} {'disparos':>9} {'llamadas IA':>12} {'grabaciones':>12}")
+        for model, (stats, _) in results.items():
+            print(f"{model:<12} {stats['motion_frames']:>12} {stats['triggers']:>9} "
+                  f"{stats['ai_calls']:>12} {stats['recordings']:>12}")
+        return
+
+    ai_label = "IA en falso" if ai_on else "IA est."
+    print(f"\n{'modelo':<12} {'frames mov.':>12} {'en falso':>9} {'disparos':>9} {'en falso':>9} {'evitados':>9} "
+          f"{ai_label:>12} {'evitadas':>9} {'grabaciones':>12} {'s grab. en falso':>17}")
+    base_ai = base_false["ai_calls"] if ai_on else base_false["motion_frames"]
+    for model, (stats, false) in results.items():
+        ai = false["ai_calls"] if ai_on else false["motion_frames"]
+        print(f"{model:<12} {stats['motion_frames']:>12} {false['motion_frames']:>9} {stats['triggers']:>9} "
+              f"{false['triggers']:>9} {base_false['triggers'] - false['triggers']:>9} "
+              f"{ai:>12} {base_ai - ai:>9} {stats['recordings']:>12} {false['recording_frames'] / args.fps:>17.1f}")
+
+
+def compare_crop(args):
+    """Misma reproducción con inferencia sobre el frame completo y sobre los recortes de movimiento."""
+    results = {}
+    for mode in ("off", "on"):
+        args.ai_crop = mode
+        camera, timings, elapsed = run_replay(args)
+        print_report(f"Inferencia por recortes: {mode}", camera, timings, elapsed)
+        ai = timings.summary().get("ai", {"count": 0, "mean_ms": 0.0, "p90_ms": 0.0})
+        results[mode] = (camera.stats, ai)
+
+    print(f"\n{'recortes':<9} {'llamadas IA':>12} {'IA media ms':>12} {'IA p90 ms':>10} {'detecciones':>12} {'grabaciones':>12}")
+    for mode, (stats, ai) in results.items():
+        print(f"{mode:<9} {ai['count']:>12} {ai['mean_ms']:>12.2f} {ai['p90_ms']:>10.2f} "
+              f"{stats['detections']:>12} {stats['recordings']:>12}")
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clip", help="Vídeo o carpeta de imágenes a reproducir (por defecto: escena sintética)")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Duración de la escena sintética")
+    parser.add_argument("--light-drift", type=float, default=0, help="Variación de brillo de la escena sintética (0-255)")
+    parser.add_argument("--drift-period", type=float, default=120.0, help="Periodo del cambio de luz sintético (s)")
+    parser.add_argument("--background", choices=["static", "running_avg", "mog2"], default=config.BACKGROUND_MODEL,
+                        help="Modelo de fondo de la detección de movimiento")
+    parser.add_argument("--compare-background", action="store_true",
+                        help="Reproducir con cada modelo de fondo y comparar disparos y llamadas a la IA frente a 'static'")
+    parser.add_argument("--ai-crop", choices=["on", "off"], default="on" if config.AI_CROP_INFERENCE else "off",
+                        help="Inferencia sobre los recortes de movimiento")
+    parser.add_argument("--compare-crop", action="store_true",
+                        help="Reproducir con y sin inferencia por recortes y comparar tiempo de IA y detecciones")
+    parser.add_argument("--fps", type=float, default=config.FPS, help="FPS de las marcas de tiempo de la reproducción")
+    parser.add_argument("--ai", choices=["auto", "on", "off"], default="auto", help="Uso del detector MediaPipe")
+    parser.add_argument("--postprocess", action="store_true", help="Ejecutar también la optimización FFmpeg de los clips")
+    parser.add_argument("--keep", action="store_true", help="No borrar los clips generados")
+    return parser
+
+
+def main():
+    args = make_parser().parse_args()
+
+    output_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    config.PATH_NAS = output_dir
+    try:
+        if args.compare_background:
+            compare_background(args)
+        elif args.compare_crop:
+            compare_crop(args)
+        else:
+            camera, timings, elapsed = run_replay(args)
+            print_report("Reproducción", camera, timings, elapsed)
+            clips = [f for f in os.listdir(output_dir) if f.endswith(".mp4")]
+            print(f"Clips escritos: {len(clips)} en {output_dir}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
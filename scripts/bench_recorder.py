@@ -0,0 +1,107 @@
+"""
+Benchmark de grabación: CPU-segundos y bytes escritos por clip.
+
+Compara el método anterior (cv2.VideoWriter mp4v + re-codificación con FFmpeg en
+optimize_for_web) con el grabador H.264 de una sola pasada (FFmpegClipWriter).
+La CPU incluye la del propio proceso y la de los procesos FFmpeg hijos.
+
+Uso:
+    python scripts/bench_recorder.py --seconds 20 --clips 3
+    python scripts/bench_recorder.py --clip grabacion.mp4
+"""
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from modules.frame_sources import SyntheticMotionSource, VideoFileSource
+from modules.recorder import OpenCVClipWriter, FFmpegClipWriter, optimize_for_web, ffmpeg_available
+
+
+def load_frames(args):
+    if args.clip:
+        source = VideoFileSource(args.clip, realtime=False)
+    else:
+        source = SyntheticMotionSource(duration=args.seconds, period_seconds=args.seconds,
+                                       event_seconds=args.seconds / 2, realtime=False)
+    source.start()
+    frames = []
+    while True:
+        frame, _, _ = source.read()
+        if frame is None:
+            break
+        frames.append(frame)
+    source.stop()
+    return frames
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def record_legacy(path, frames):
+    """mp4v con OpenCV y después re-codificación H.264: el clip se escribe dos veces."""
+    height, width, _ = frames[0].shape
+    writer = OpenCVClipWriter(path, (width, height), config.FPS)
+    for frame in frames:
+        writer.write(frame)
+    writer.close()
+    written = os.path.getsize(path)
+    optimize_for_web(path)
+    return written + os.path.getsize(path)
+
+
+def record_single_pass(path, frames):
+    height, width, _ = frames[0].shape
+    writer = FFmpegClipWriter(path, (width, height), config.FPS)
+    for frame in frames:
+        writer.write(frame)
+    if not writer.close():
+        raise SystemExit("FFmpeg falló en la grabación de una pasada")
+    written = os.path.getsize(path)
+    if "faststart" in config.RECORDER_MOVFLAGS:
+        # faststart reescribe el fichero completo al cerrar
+        written *= 2
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clip", help="Vídeo a usar como contenido (por defecto: escena sintética)")
+    parser.add_argument("--seconds", type=float, default=20.0, help="Duración del clip sintético")
+    parser.add_argument("--clips", type=int, default=3, help="Clips por método")
+    args = parser.parse_args()
+
+    if not ffmpeg_available():
+        raise SystemExit("Este benchmark necesita ffmpeg en el PATH")
+
+    frames = load_frames(args)
+    output_dir = tempfile.mkdtemp(prefix="bench_recorder_")
+    print(f"Clip: {len(frames)} frames ({len(frames) / config.FPS:.1f} s a {config.FPS} FPS)")
+    print(f"{'método':<14} {'CPU s/clip':>11} {'pared s/clip':>13} {'MB escritos/clip':>17} {'MB final':>9}")
+    try:
+        for name, method in (("mp4v+ffmpeg", record_legacy), ("h264 1 pasada", record_single_pass)):
+            cpu, wall, written, final = 0.0, 0.0, 0, 0
+            for i in range(args.clips):
+                path = os.path.join(output_dir, f"{name.replace(' ', '_')}_{i}.mp4")
+                cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+                written += method(path, frames)
+                cpu += cpu_seconds() - cpu_start
+                wall += time.perf_counter() - wall_start
+                final += os.path.getsize(path)
+            n = args.clips
+            print(f"{name:<14} {cpu / n:>11.2f} {wall / n:>13.2f} {written / n / 1e6:>17.2f} {final / n / 1e6:>9.2f}")
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
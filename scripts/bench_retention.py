@@ -0,0 +1,132 @@
+"""
+Carga sintética para la política de retención (modules/retention.py).
+
+Genera N eventos repartidos en los últimos días (clip de tamaño variable, miniatura en
+los que tuvieron alerta, una parte con persona confirmada y algunos fijados) y mide:
+- el alta de todos los ficheros en el índice,
+- la selección de una limpieza por espacio y una por antigüedad,
+- el coste de mantener el índice con altas y bajas sueltas (lo que hacen grabador e inotify),
+- la misma selección ordenando toda la lista cada vez (como la limpieza anterior).
+Además comprueba las propiedades de la política: nunca se eligen eventos fijados, la
+selección es un prefijo del orden por fecha efectiva y las personas duran más que el
+movimiento sin persona.
+
+Uso:
+    python scripts/bench_retention.py --events 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from modules.retention import RetentionIndex
+
+MB = 1024 * 1024
+
+
+def generate(events, days, seed):
+    rng = random.Random(seed)
+    now = time.time()
+    workload = []
+    for i in range(events):
+        fecha = now - rng.uniform(0, days * 86400)
+        size = int(rng.lognormvariate(2.0, 0.6) * MB)  # ~7 MB de media
+        person = rng.random() < 0.2
+        workload.append({
+            "clave": f"alerta_{i:07d}",
+            "fecha": fecha,
+            "size": size,
+            "thumb": person or rng.random() < 0.3,
+            "score": rng.uniform(0.8, 1.0) if person else None,
+            "pinned": rng.random() < 0.01,
+        })
+    return now, workload
+
+
+def build(index, workload):
+    for ev in workload:
+        index.add_file(ev["clave"] + ".mp4", ev["size"], ev["fecha"])
+        if ev["thumb"]:
+            index.add_file(ev["clave"] + ".jpg", 60 * 1024, ev["fecha"] + 2)
+        if ev["score"] is not None:
+            index.set_score(ev["clave"], ev["score"])
+        if ev["pinned"]:
+            index.set_pinned(ev["clave"], True)
+
+
+def naive_select(index, por_liberar):
+    """Selección ordenando todos los eventos en cada limpieza."""
+    candidatos = sorted((index.prioridad(e), c) for c, e in index.eventos.items() if not e["pinned"])
+    seleccion, acumulado = [], 0
+    for _, clave in candidatos:
+        if acumulado >= por_liberar:
+            break
+        seleccion.append(clave)
+        acumulado += index.eventos[clave]["bytes"]
+    return seleccion
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100000, help="Eventos sintéticos")
+    parser.add_argument("--days", type=float, default=30, help="Días que abarcan los eventos")
+    parser.add_argument("--free", type=float, default=0.05, help="Fracción de los bytes a liberar")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    now, workload = generate(args.events, args.days, args.seed)
+    index = RetentionIndex()
+    _, build_ms = timed(lambda: build(index, workload))
+    stats = index.stats()
+    print(f"{stats['events']} eventos, {stats['bytes'] / MB / 1024:.1f} GB, {stats['with_person']} con persona, "
+          f"{stats['pinned']} fijados")
+    print(f"Alta en el índice: {build_ms:.0f} ms ({1000 * build_ms / args.events:.1f} µs/evento)")
+
+    por_liberar = args.free * index.bytes_total
+    (seleccion, acumulado), select_ms = timed(lambda: index.select(por_liberar))
+    _, naive_ms = timed(lambda: naive_select(index, por_liberar))
+    print(f"Limpieza por espacio ({args.free:.0%}): {len(seleccion)} eventos, {acumulado / MB:.0f} MB "
+          f"en {select_ms:.1f} ms (ordenando todo: {naive_ms:.1f} ms)")
+    expired, expired_ms = timed(lambda: index.expired(now - config.MAX_DAYS_STORAGE * 86400))
+    print(f"Limpieza por antigüedad (> {config.MAX_DAYS_STORAGE} días): {len(expired)} eventos en {expired_ms:.1f} ms")
+
+    # Mantenimiento: altas y bajas sueltas entre limpiezas
+    churn = 10000
+    rng = random.Random(args.seed + 1)
+    claves = list(index.eventos)
+
+    def mantener():
+        for i in range(churn):
+            if i % 2:
+                index.remove_file(rng.choice(claves) + ".mp4")
+            else:
+                index.add_file(f"nuevo_{i:07d}.mp4", 5 * MB, now + i)
+    _, churn_ms = timed(mantener)
+    print(f"Mantenimiento: {churn} altas/bajas en {churn_ms:.0f} ms ({1000 * churn_ms / churn:.1f} µs/op), "
+          f"montículo de {len(index.monticulo)} entradas para {len(index)} eventos")
+
+    # Propiedades de la política
+    seleccion, _ = index.select(por_liberar)
+    elegidos = {clave for clave, _ in seleccion}
+    assert not any(index.eventos[c]["pinned"] for c in elegidos), "se eligió un evento fijado"
+    limite = max(index.eventos[c]["prioridad"] for c in elegidos)
+    assert all(e["prioridad"] is None or e["prioridad"] >= limite or c in elegidos
+               for c, e in index.eventos.items()), "la selección no es un prefijo del orden"
+    assert [c for c, _ in seleccion] == naive_select(index, por_liberar), "distinto de la ordenación completa"
+    person_share = sum(1 for c in elegidos if index.eventos[c]["score"]) / len(elegidos)
+    print(f"Propiedades OK. Personas entre los elegidos: {person_share:.1%} (en el total: "
+          f"{index.stats()['with_person'] / len(index):.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark del índice por frame (sidecar .vsc) y de las búsquedas de /api/search.
+
+Crea un directorio temporal con N clips sintéticos (un MP4 vacío y su sidecar con
+movimiento, caja y confianza de persona aleatorios, un clip cada 10 minutos) y mide:
+- el coste de añadir cada fila mientras se graba (SidecarRecorder.add) y de guardar el fichero,
+- los bytes por clip y por frame,
+- búsquedas típicas ("persona > 0.9 en la mitad izquierda entre las 02:00 y las 05:00", ...),
+  con cuántos sidecars se leyeron y cuántos clips cumplen,
+- que el filtro previo del catálogo no descarta ningún clip que cumpla frame a frame
+  (franjas horarias que tocan o cruzan la medianoche y rangos de fechas), también en los
+  clips cuya fila creó la alerta antes del cierre (uno de cada tres).
+
+Uso:
+    python scripts/bench_sidecar.py --clips 2000 --frames 300
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from modules.catalog import RecordingCatalog
+from modules.sidecar import (SidecarRecorder, match_frames, parse_hours, parse_region, read_sidecar, search,
+                             sidecar_for)
+
+# Franjas para comprobar el filtro previo: normales, cruzando la medianoche y el día entero
+CHECK_HOURS = ["02:00-05:00", "23:30-00:30", "22:00-02:00", "00:00-00:10", "23:59-24:00",
+               "00:00-23:59", "00:00-24:00", "12:00-11:59"]
+
+
+def populate(path, catalog, clips, frames, fps, rng):
+    """Escribe los clips y sus sidecars. Retorna (µs por fila, ms por guardado, bytes por clip)."""
+    now = time.time()
+    add_time = save_time = 0.0
+    size = 0
+    for i in range(clips):
+        name = f"alerta_{i:07d}.mp4"
+        created = now - (clips - i) * 600
+        clip = os.path.join(path, name)
+        open(clip, "wb").close()
+        os.utime(clip, (created, created))
+
+        sidecar = SidecarRecorder((640, 480), fps)
+        person_clip = rng.random() < 0.3
+        t0 = time.perf_counter()
+        for n in range(frames):
+            ts = created - frames / fps + n / fps
+            x = rng.random() * 0.8
+            sidecar.add(ts, rng.random() * 0.2, (x, 0.2, x + 0.2, 0.6))
+            if person_clip and n % fps == 0:
+                sidecar.set_person(ts, rng.random())
+        add_time += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        sidecar.save(os.path.join(path, sidecar_for(name)))
+        save_time += time.perf_counter() - t0
+        size += os.path.getsize(os.path.join(path, sidecar_for(name)))
+        if i % 3 == 0:
+            # La alerta llega con el clip aún grabándose: su fila existe antes de add()
+            catalog.set_thumbnail(clip, clip.rsplit(".", 1)[0] + ".jpg", 0.9)
+        catalog.add(clip)
+        catalog.set_sidecar(clip, sidecar.max_person())
+    return add_time / (clips * frames) * 1e6, save_time / clips * 1000, size / clips
+
+
+def check_prefilter(path, catalog, window, rng):
+    """
+    Compara franjas horarias y rangos de fechas con la comprobación frame a frame de todos los
+    sidecars. Retorna los fallos.
+    """
+    sidecars = [read_sidecar(os.path.join(path, name)) + (name,) for name in os.listdir(path) if name.endswith(".vsc")]
+    checks = [(text, dict(hours=parse_hours(text))) for text in CHECK_HOURS]
+    # Rangos cortos que empiezan a mitad de un clip (su inicio queda antes de 'start')
+    for index in rng.choice(len(sidecars), size=min(20, len(sidecars)), replace=False):
+        header, records, name = sidecars[index]
+        start = header["start"] + records["t_ms"][len(records) // 2] / 1000.0
+        checks.append((f"{name} +{len(records) // 2}", dict(start=start, end=start + 10)))
+    failures = []
+    for title, query in checks:
+        expected = {name for header, records, name in sidecars if match_frames(header, records, **query).any()}
+        results, _ = search(catalog, limit=len(sidecars), max_scan=len(sidecars), window=window, **query)
+        found = {sidecar_for(result["row"]["filename"]) for result in results}
+        if found != expected:
+            failures.append(f"{title}: {len(found)} clips, se esperaban {len(expected)}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", type=int, default=2000, help="Clips sintéticos")
+    parser.add_argument("--frames", type=int, default=300, help="Frames por clip")
+    parser.add_argument("--fps", type=int, default=10, help="FPS de los clips")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    output_dir = tempfile.mkdtemp(prefix="bench_sidecar_")
+    try:
+        catalog = RecordingCatalog(output_dir, os.path.join(output_dir, "recordings.db"))
+        add_us, save_ms, size = populate(output_dir, catalog, args.clips, args.frames, args.fps, rng)
+        print(f"Sidecars: {args.clips} clips de {args.frames} frames")
+        print(f"Escritura: {add_us:.1f} µs/frame, {save_ms:.2f} ms por guardado, "
+              f"{size / 1024:.1f} KB por clip ({size / args.frames:.1f} B/frame)")
+
+        queries = {
+            "persona > 0.9, izquierda, 02:00-05:00": dict(min_person=0.9, region=parse_region("left"),
+                                                         hours=parse_hours("02:00-05:00")),
+            "persona > 0.5": dict(min_person=0.5),
+            "movimiento > 15% en 0,0,0.3,1": dict(min_motion=0.15, region=parse_region("0,0,0.3,1")),
+        }
+        print(f"{'búsqueda':<40} {'ms':>8} {'leídos':>7} {'clips':>6}")
+        for title, query in queries.items():
+            t0 = time.perf_counter()
+            results, scanned = search(catalog, limit=args.clips, max_scan=args.clips, window=90, **query)
+            elapsed = (time.perf_counter() - t0) * 1000
+            print(f"{title:<40} {elapsed:>8.1f} {scanned:>7} {len(results):>6}")
+
+        failures = check_prefilter(output_dir, catalog, window=90, rng=rng)
+        print(f"Filtro previo del catálogo: {'correcto' if not failures else '; '.join(failures)}")
+        catalog.close()
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark del streaming MJPEG: CPU por cliente conectado.
+
+Compara el broadcaster (codificación única por frame) con el método anterior
+(cada cliente codifica el frame por su cuenta en un bucle sin pausa).
+
+Uso:
+    python scripts/bench_streaming.py --clients 1 5 20 --seconds 5
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from modules.streaming import FrameBroadcaster
+
+
+def synthetic_frames(count=30):
+    """Frames sintéticos con algo de textura para que el JPEG no sea trivial."""
+    w, h = config.RESOLUTION
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, (h, w, 3), dtype=np.uint8)
+    base = cv2.GaussianBlur(base, (9, 9), 0)
+    frames = []
+    for i in range(count):
+        frame = base.copy()
+        x = (i * 17) % (w - 80)
+        cv2.rectangle(frame, (x, 100), (x + 80, 300), (0, 0, 255), -1)
+        frames.append(frame)
+    return frames
+
+
+def run_broadcaster(clients, seconds, frames):
+    broadcaster = FrameBroadcaster()
+    stop = threading.Event()
+    delivered = [0] * clients
+
+    def producer():
+        i = 0
+        while not stop.is_set():
+            broadcaster.publish(frames[i % len(frames)])
+            i += 1
+            time.sleep(1.0 / config.FPS)
+
+    def client(idx):
+        last_seq = 0
+        while not stop.is_set():
+            last_seq, jpeg = broadcaster.wait_for_frame(last_seq, timeout=0.5)
+            if jpeg:
+                delivered[idx] += 1
+
+    return _measure(producer, client, clients, seconds, stop, delivered, lambda: broadcaster.encoded_frames)
+
+
+def run_legacy(clients, seconds, frames):
+    """Reproduce el get_frame() original: imencode bajo el lock, por cliente y sin pausa."""
+    lock = threading.Lock()
+    state = {"frame": None, "encodes": 0}
+    stop = threading.Event()
+    delivered = [0] * clients
+
+    def producer():
+        i = 0
+        while not stop.is_set():
+            with lock:
+                state["frame"] = frames[i % len(frames)].copy()
+            i += 1
+            time.sleep(1.0 / config.FPS)
+
+    def client(idx):
+        while not stop.is_set():
+            with lock:
+                if state["frame"] is None:
+                    continue
+                flag, encoded = cv2.imencode(".jpg", state["frame"])
+                state["encodes"] += 1
+            if flag:
+                encoded.tobytes()
+                delivered[idx] += 1
+
+    return _measure(producer, client, clients, seconds, stop, delivered, lambda: state["encodes"])
+
+
+def _measure(producer, client, clients, seconds, stop, delivered, encodes):
+    threads = [threading.Thread(target=producer, daemon=True)]
+    threads += [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join(timeout=2)
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    return {
+        "cpu_s": cpu,
+        "cpu_pct": 100.0 * cpu / wall,
+        "cpu_ms_per_client_s": 1000.0 * cpu / wall / clients,
+        "fps_per_client": sum(delivered) / clients / wall,
+        "encodes": encodes(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--skip-legacy", action="store_true", help="No medir el método anterior")
+    args = parser.parse_args()
+
+    frames = synthetic_frames()
+    modes = [("broadcaster", run_broadcaster)]
+    if not args.skip_legacy:
+        modes.append(("legacy", run_legacy))
+
+    print(f"{'modo':<12} {'clientes':>8} {'CPU %':>8} {'CPU ms/s/cli':>13} {'fps/cli':>8} {'encodes':>8}")
+    for name, runner in modes:
+        for n in args.clients:
+            r = runner(n, args.seconds, frames)
+            print(f"{name:<12} {n:>8} {r['cpu_pct']:>8.1f} {r['cpu_ms_per_client_s']:>13.2f} "
+                  f"{r['fps_per_client']:>8.1f} {r['encodes']:>8}")
+
+
+if __name__ == "__main__":
+    main()
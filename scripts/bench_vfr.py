@@ -0,0 +1,137 @@
+"""
+Grabación de ritmo variable frente a ritmo constante sobre una reproducción.
+
+Reproduce un clip grabado (o una escena sintética con ráfagas de movimiento separadas por
+escena quieta) y lo graba de dos formas:
+- CFR: todos los frames, colocados a config.FPS (FFmpegClipWriter + CfrResampler),
+- VFR: solo los frames que cambian, con latido cada RECORDER_VFR_HEARTBEAT segundos
+  (StaticFrameGate + PyAV si está instalado, si no FFmpeg con mpdecimate).
+Mide CPU (proceso y FFmpeg hijos), tiempo de pared, tamaño del clip y frames codificados.
+La decisión de la puerta (coste por frame y frames saltados) se mide siempre, aunque no
+haya codificador.
+
+Uso:
+    python scripts/bench_vfr.py
+    python scripts/bench_vfr.py --clip grabacion.mp4 --min-change 0.005
+"""
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from modules.frame_sources import SyntheticMotionSource, VideoFileSource
+from modules import recorder
+from modules.recorder import CfrResampler, FFmpegClipWriter, StaticFrameGate, create_clip_writer, ffmpeg_available
+
+
+def load_frames(args):
+    """(marca de tiempo, frame) de la reproducción."""
+    if args.clip:
+        source = VideoFileSource(args.clip, realtime=False)
+    else:
+        # Una ráfaga de movimiento de 'event' segundos cada 'period': el resto, escena quieta con ruido
+        source = SyntheticMotionSource(duration=args.seconds, period_seconds=args.period,
+                                       event_seconds=args.event, realtime=False)
+    source.start()
+    frames = []
+    while True:
+        frame, timestamp, _ = source.read()
+        if frame is None:
+            break
+        frames.append((timestamp, frame))
+    source.stop()
+    return frames
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def record_cfr(path, frames):
+    height, width, _ = frames[0][1].shape
+    writer = FFmpegClipWriter(path, (width, height), config.FPS)
+    resampler = CfrResampler(config.FPS)
+    encoded = 0
+    for timestamp, frame in frames:
+        for _ in range(resampler.frames_for(timestamp)):
+            writer.write(frame)
+            encoded += 1
+    if not writer.close():
+        raise SystemExit("FFmpeg falló en la grabación CFR")
+    return encoded
+
+
+def record_vfr(path, frames, min_change):
+    height, width, _ = frames[0][1].shape
+    writer = create_clip_writer(path, (width, height), config.FPS, variable_rate=True)
+    gate = StaticFrameGate(min_change=min_change)
+    for timestamp, frame in frames:
+        write, keyframe = gate.decide(timestamp, frame)
+        if write:
+            writer.write_at(frame, timestamp, keyframe)
+    if not writer.close():
+        raise SystemExit("Falló la grabación VFR")
+    return gate.written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clip", help="Vídeo a reproducir (por defecto: escena sintética)")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Duración de la escena sintética")
+    parser.add_argument("--period", type=float, default=20.0, help="Segundos entre ráfagas de movimiento")
+    parser.add_argument("--event", type=float, default=4.0, help="Duración de cada ráfaga")
+    parser.add_argument("--min-change", type=float, default=config.RECORDER_VFR_MIN_CHANGE,
+                        help="Fracción de la imagen que debe cambiar para escribir un frame")
+    args = parser.parse_args()
+
+    frames = load_frames(args)
+    duration = frames[-1][0] - frames[0][0]
+    print(f"Reproducción: {len(frames)} frames ({duration:.1f} s)")
+
+    gate = StaticFrameGate(min_change=args.min_change)
+    start = time.perf_counter()
+    for timestamp, frame in frames:
+        gate.decide(timestamp, frame)
+    gate_us = (time.perf_counter() - start) / len(frames) * 1e6
+    print(f"Puerta de frames estáticos: {gate.written} escritos, {gate.skipped} saltados "
+          f"({gate.skipped / len(frames):.0%}), {gate_us:.0f} µs/frame")
+
+    methods = []
+    if ffmpeg_available():
+        methods.append(("CFR", record_cfr))
+    if recorder.av is not None or ffmpeg_available():
+        backend = "PyAV" if recorder.av is not None else "ffmpeg"
+        methods.append((f"VFR ({backend})", lambda path, f: record_vfr(path, f, args.min_change)))
+    if not methods:
+        raise SystemExit("Para comparar la codificación hace falta ffmpeg en el PATH o PyAV")
+
+    output_dir = tempfile.mkdtemp(prefix="bench_vfr_")
+    print(f"{'método':<14} {'frames codif.':>13} {'CPU s':>7} {'pared s':>8} {'MB':>7}")
+    try:
+        results = {}
+        for name, method in methods:
+            path = os.path.join(output_dir, name.split()[0] + ".mp4")
+            cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+            encoded = method(path, frames)
+            cpu = cpu_seconds() - cpu_start
+            wall = time.perf_counter() - wall_start
+            size = os.path.getsize(path)
+            results[name.split()[0]] = (cpu, size)
+            print(f"{name:<14} {encoded:>13} {cpu:>7.2f} {wall:>8.2f} {size / 1e6:>7.2f}")
+        if "CFR" in results and "VFR" in results:
+            (cfr_cpu, cfr_size), (vfr_cpu, vfr_size) = results["CFR"], results["VFR"]
+            print(f"VFR frente a CFR: {vfr_size / cfr_size:.0%} del tamaño, {vfr_cpu / cfr_cpu:.0%} de la CPU")
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()